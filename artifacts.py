@@ -0,0 +1,165 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+import pandas as pd
+import pyarrow as pa
+
+CAMPAIGN_SCHEMA_VERSION = 1
+
+# Colunas não anuláveis são obrigatórias; as demais ficam nulas quando não existem no DataFrame
+CAMPAIGN_SCHEMA = pa.schema([
+    pa.field("usuario", pa.string(), nullable=False),
+    pa.field("cpf", pa.string(), nullable=False),
+    pa.field("nome_cliente", pa.string()),
+    pa.field("primeiro_nome", pa.string()),
+    pa.field("telefone_contato", pa.string(), nullable=False),
+    pa.field("mensagem", pa.string(), nullable=False),
+    pa.field("Saldo", pa.float64(), nullable=False),
+    pa.field("dinheiro", pa.float64()),
+    pa.field("Créditos", pa.float64()),
+    pa.field("Débitos", pa.float64()),
+    pa.field("Créditos Expirados", pa.float64()),
+    pa.field("creditos_a_expirar", pa.float64()),
+    pa.field("datas_a_expirar", pa.list_(pa.timestamp("us"))),
+    pa.field("data_min_a_expirar", pa.timestamp("us")),
+    pa.field("data_max_a_expirar", pa.timestamp("us")),
+    pa.field("pontos_acumulados_periodo", pa.float64()),
+    pa.field("filtro_pontuacao_data_inicio", pa.timestamp("us")),
+    pa.field("filtro_pontuacao_data_fim", pa.timestamp("us")),
+])
+
+def write_campaign(df: pd.DataFrame, path: str, nome_projeto: str) -> str:
+    """
+    Writes the campaign as an Arrow IPC file with CAMPAIGN_SCHEMA, the hand-off between build and send.
+
+    Columns outside the schema are dropped, optional columns missing from df are written as nulls
+    and the file is uncompressed so read_campaign can memory-map it.
+
+    :return: Path of the file
+    """
+    colunas = {}
+    for field in CAMPAIGN_SCHEMA:
+        if field.name not in df.columns:
+            if not field.nullable:
+                raise ValueError(f"The campaign is missing the column {field.name}")
+            colunas[field.name] = pa.nulls(len(df), field.type)
+            continue
+
+        coluna = df[field.name]
+        if pa.types.is_string(field.type):
+            coluna = coluna.astype("string")
+        elif pa.types.is_timestamp(field.type):
+            coluna = pd.to_datetime(coluna)
+        elif pa.types.is_floating(field.type):
+            coluna = pd.to_numeric(coluna)
+        elif pa.types.is_list(field.type):
+            coluna = coluna.map(lambda datas: [pd.Timestamp(d) for d in datas] if isinstance(datas, list) else None)
+
+        colunas[field.name] = pa.array(coluna, type=field.type, from_pandas=True)
+        if not field.nullable and colunas[field.name].null_count:
+            raise ValueError(f"The campaign column {field.name} has {colunas[field.name].null_count} nulls")
+
+    schema = CAMPAIGN_SCHEMA.with_metadata({
+        "schema_version": str(CAMPAIGN_SCHEMA_VERSION),
+        "nome_projeto": nome_projeto,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+    })
+    table = pa.Table.from_arrays(list(colunas.values()), schema=schema)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+        writer.write_table(table, max_chunksize=100_000)
+    os.replace(tmp_path, path)
+    return path
+
+def read_campaign(path: str, columns: list = None) -> pd.DataFrame:
+    """Reads a campaign written by write_campaign, memory-mapping the file"""
+    with pa.memory_map(path, "r") as source:
+        table = pa.ipc.open_file(source).read_all()
+
+    versao = int((table.schema.metadata or {}).get(b"schema_version", b"0"))
+    if versao != CAMPAIGN_SCHEMA_VERSION:
+        raise ValueError(f"{path} has campaign schema version {versao}, expected {CAMPAIGN_SCHEMA_VERSION}")
+
+    if columns is not None:
+        table = table.select(columns)
+    return table.to_pandas()
+
+def campaign_metadata(path: str) -> dict:
+    """nome_projeto, created_at and schema_version of a campaign file, without reading its rows"""
+    with pa.memory_map(path, "r") as source:
+        metadata = pa.ipc.open_file(source).schema.metadata or {}
+    return {chave.decode(): valor.decode() for chave, valor in metadata.items()}
+
+def export_excel(df: pd.DataFrame, path: str, background: bool = True):
+    """
+    Writes df to .xlsx with openpyxl's write-only (streaming) workbook.
+
+    :param background: Writes in a separate thread and returns it right away; the interpreter
+        waits for it before exiting
+    :return: The thread writing the file, or None when not in background
+    """
+    if not background:
+        _escrever_excel(df, path)
+        return None
+
+    thread = threading.Thread(target=_escrever_excel, args=(df.copy(), path), name=f"export_excel:{path}")
+    thread.start()
+    return thread
+
+def _escrever_excel(df, path):
+    from openpyxl import Workbook
+
+    # Listas não cabem numa célula; o resto vai como objetos Python com nulos como None
+    df = df.apply(lambda coluna: coluna.map(lambda x: ", ".join(map(str, x)) if isinstance(x, list) else x))
+    df = df.astype(object).where(df.notna(), None)
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(list(df.columns))
+    for row in df.itertuples(index=False, name=None):
+        sheet.append(row)
+
+    tmp_path = f"{path}.tmp.xlsx"
+    workbook.save(tmp_path)
+    os.replace(tmp_path, path)
+    logging.info(f"Excel export written to {path}")
+
+def file_hash(path: str, chunk_size: int = 1 << 20) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+def read_report(path: str, cache_dir: str = "data/report_cache/", **read_excel_kwargs) -> pd.DataFrame:
+    """
+    pd.read_excel of a report, converted to Parquet once and read from there afterwards.
+
+    The cache key is the file's hash plus the read_excel arguments, so a changed report or
+    different parsing options never hit a stale conversion.
+    """
+    chave = hashlib.sha256(
+        (file_hash(path) + json.dumps(read_excel_kwargs, sort_keys=True, default=str)).encode()
+    ).hexdigest()
+    cache_path = os.path.join(cache_dir, f"{chave}.parquet")
+
+    if os.path.exists(cache_path):
+        return pd.read_parquet(cache_path)
+
+    df = pd.read_excel(path, **read_excel_kwargs)
+
+    # Colunas com tipos misturados (números e textos) viram texto para caberem no Parquet
+    for coluna in df.columns[df.dtypes == object]:
+        if pd.api.types.infer_dtype(df[coluna], skipna=True).startswith("mixed"):
+            df[coluna] = df[coluna].astype("string")
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{cache_path}.tmp"
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, cache_path)
+    return df
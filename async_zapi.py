@@ -0,0 +1,161 @@
+import asyncio
+import os
+import time
+import aiohttp
+import dotenv
+
+dotenv.load_dotenv()
+
+_FIM = object()
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = None):
+        """
+        :param rate: Tokens added per second
+        :param capacity: Maximum burst size (defaults to rate)
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity else max(rate, 1)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class AsyncZAPIClient:
+    BASE_URL = "https://api.z-api.io"
+
+    def __init__(
+        self, instance_id=None, instance_token=None, client_token=None,
+        max_concurrency: int = 10, requests_per_second: float = 5, base_url: str = None
+    ):
+        self.instance_id = instance_id if instance_id else os.getenv("ZAPI_INSTANCE_ID")
+        self.instance_token = instance_token if instance_token else os.getenv("ZAPI_INSTANCE_TOKEN")
+        self.client_token = client_token if client_token else os.getenv("ZAPI_CLIENT_TOKEN")
+        self.base_url = base_url if base_url else self.BASE_URL
+
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._rate_limiter = TokenBucket(requests_per_second)
+        self._session = None
+
+    async def __aenter__(self):
+        self._get_session()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_concurrency),
+                headers={"client-token": self.client_token or ""}
+            )
+        return self._session
+
+    async def _request(self, method, endpoint, data=None):
+        url = f"{self.base_url}/instances/{self.instance_id}/token/{self.instance_token}/{endpoint}"
+
+        async with self._semaphore:
+            await self._rate_limiter.acquire()
+            async with self._get_session().request(method, url, json=data) as response:
+                response.raise_for_status()
+                return await response.json(content_type=None)
+
+    async def send_text(self, phone, message, delay_message=10):
+        data = {
+            "phone": phone,
+            "message": message,
+            "delayMessage": delay_message
+        }
+
+        return await self._request("POST", "send-text", data)
+
+    async def send_image(self, phone, caption, image_url, delay_message=10):
+        data = {
+            "phone": phone,
+            "caption": caption,
+            "image": image_url,
+            "delayMessage": delay_message
+        }
+
+        return await self._request("POST", "send-image", data)
+
+    async def read_message(self, message_id, phone):
+        data = {
+            "phone": phone,
+            "message_id": message_id
+        }
+
+        return await self._request("POST", "read-message", data)
+
+    async def retrieve_chats(self):
+        return await self._request("GET", "chats")
+
+    async def get_chat_metadata(self, phone):
+        return await self._request("GET", f"chats/{phone}")
+
+    async def send_text_many(self, messages, delay_message=10, workers: int = None):
+        """
+        Sends many texts concurrently and yields the results in completion order.
+
+        A fixed number of workers pull the messages from the iterable as they finish, and the
+        results wait in a queue of the same size, so memory does not grow with the campaign
+        and messages are only read as fast as they are sent and consumed.
+
+        :param messages: Iterable of (phone, message) pairs
+        :param workers: Messages in flight at a time (defaults to max_concurrency)
+        :return: Async generator of (phone, result) pairs, where result is the
+            response body or the exception raised for that message
+        """
+        workers = workers if workers else self.max_concurrency
+        mensagens = iter(messages)
+        resultados = asyncio.Queue(maxsize=workers)
+
+        async def worker():
+            erro = None
+            try:
+                # O iterador é compartilhado; next() não tem await, então não há corrida entre os workers
+                for phone, message in mensagens:
+                    try:
+                        resultado = await self.send_text(phone, message, delay_message)
+                    except Exception as e:
+                        resultado = e
+                    await resultados.put((phone, resultado))
+            except Exception as e:
+                # Erro do próprio iterável de mensagens
+                erro = e
+            await resultados.put((_FIM, erro))
+
+        tarefas = [asyncio.ensure_future(worker()) for _ in range(workers)]
+        ativos = len(tarefas)
+        try:
+            while ativos:
+                phone, resultado = await resultados.get()
+                if phone is _FIM:
+                    ativos -= 1
+                    if resultado is not None:
+                        raise resultado
+                    continue
+                yield phone, resultado
+        finally:
+            for tarefa in tarefas:
+                tarefa.cancel()
+            await asyncio.gather(*tarefas, return_exceptions=True)
@@ -0,0 +1,153 @@
+import os
+import shutil
+import tempfile
+import uuid
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from utils import aggregate_chunks, cpfs_to_int
+
+SEM_RESGATE = "(sem resgate)"
+
+def _fonte_batches(fonte, columns, batch_size):
+    """Batches of a DataFrame, a pyarrow dataset or the path of a Parquet dataset, as DataFrames"""
+    if isinstance(fonte, pd.DataFrame):
+        for inicio in range(0, len(fonte), batch_size):
+            yield fonte.iloc[inicio:inicio + batch_size][columns]
+        return
+
+    dataset = fonte if isinstance(fonte, ds.Dataset) else ds.dataset(fonte, format="parquet", partitioning="hive")
+    # Os batches vêm no tamanho dos arquivos; juntá-los evita gravar milhares de arquivos pequenos por bucket
+    acumulados, linhas = [], 0
+    for batch in dataset.to_batches(columns=columns, batch_size=batch_size):
+        acumulados.append(batch)
+        linhas += batch.num_rows
+        if linhas >= batch_size:
+            yield pa.Table.from_batches(acumulados).to_pandas()
+            acumulados, linhas = [], 0
+    if linhas:
+        yield pa.Table.from_batches(acumulados).to_pandas()
+
+def bucket_by_cpf(fonte, path: str, cpf_column: str, time_column: str, columns: list = None,
+                  buckets: int = 64, batch_size: int = 1_000_000) -> str:
+    """
+    Rewrites the rows of fonte as a Parquet dataset partitioned by bucket = CPF % buckets.
+
+    fonte is read batch by batch, so it never sits in memory whole. The CPF becomes the int64
+    column cpf and the time column the timestamp column momento; the other columns keep their names.
+
+    :param fonte: DataFrame, pyarrow dataset or path of a Parquet dataset (hive partitioning)
+    :param columns: Other columns to keep
+    :return: path
+    """
+    columns = list(columns or [])
+    for i, df in enumerate(_fonte_batches(fonte, [cpf_column, time_column] + columns, batch_size)):
+        cpfs = cpfs_to_int(df[cpf_column])
+        df = df[columns].assign(
+            cpf=cpfs.to_numpy(),
+            momento=pd.to_datetime(df[time_column]).astype("datetime64[us]").to_numpy(),
+            bucket=(cpfs % buckets).to_numpy(),
+        )[cpfs.to_numpy() >= 0]
+
+        ds.write_dataset(
+            pa.Table.from_pandas(df, preserve_index=False), path, format="parquet",
+            partitioning=ds.partitioning(pa.schema([("bucket", pa.int64())]), flavor="hive"),
+            existing_data_behavior="overwrite_or_ignore",
+            basename_template=f"part-{uuid.uuid4().hex}-{i}-{{i}}.parquet",
+        )
+    return path
+
+def _ler_bucket(path, bucket, columns):
+    caminho = os.path.join(path, f"bucket={bucket}")
+    if not os.path.isdir(caminho):
+        return pd.DataFrame(columns=columns)
+    return ds.dataset(caminho, format="parquet").to_table(columns=columns).to_pandas()
+
+def attribute_conversions(sends, redemptions, window_days: float = 7, buckets: int = 64,
+                          send_cpf: str = "usuario", send_time: str = "data_envio", variant_column: str = None,
+                          redemption_cpf: str = "usuario", redemption_time: str = "data_hora",
+                          store_column: str = "cnpj_empresa", value_column: str = "valor",
+                          workdir: str = None, batch_size: int = 1_000_000) -> pd.DataFrame:
+    """
+    Conversions of each campaign: for each send, the first redemption of the same CPF within
+    window_days after it. Redemptions before the send, or after the window, are not conversions.
+
+    Both sides are first split by CPF bucket into Parquet (bucket_by_cpf), then each bucket is
+    sorted by time once and joined with merge_asof, so memory holds one bucket at a time. The
+    metrics of every bucket are combined in a single grouped pass (aggregate_chunks).
+
+    :param sends: Sends (e.g. the SentMessageLedger path), with nome_projeto
+    :param redemptions: Redemptions (e.g. the report DataFrame or the movements of type R)
+    :param variant_column: Column of sends with the message variant, if there is one
+    :param store_column: Column of redemptions with the store
+    :param value_column: Column of redemptions with the points redeemed
+    :param workdir: Where the bucketed copies are written (a temporary folder by default)
+    :return: DataFrame per nome_projeto, variant and redemption store (SEM_RESGATE for the sends
+        without conversion) with envios, conversoes, pontos_resgatados, dias_ate_resgate
+        (mean) and taxa_conversao (over all sends of the project and variant)
+    """
+    grupos = ["nome_projeto"] + ([variant_column] if variant_column else []) + ["loja"]
+    colunas_envio = ["nome_projeto"] + ([variant_column] if variant_column else [])
+    janela = pd.Timedelta(days=window_days)
+
+    diretorio = workdir if workdir else tempfile.mkdtemp(prefix="attribution_")
+    try:
+        # Cópias de uma execução anterior no mesmo workdir seriam somadas às novas
+        for pasta in ["sends", "redemptions"]:
+            shutil.rmtree(os.path.join(diretorio, pasta), ignore_errors=True)
+
+        path_envios = bucket_by_cpf(
+            sends, os.path.join(diretorio, "sends"), send_cpf, send_time, colunas_envio, buckets, batch_size
+        )
+        path_resgates = bucket_by_cpf(
+            redemptions, os.path.join(diretorio, "redemptions"), redemption_cpf, redemption_time,
+            [store_column, value_column], buckets, batch_size
+        )
+
+        def atribuidos():
+            for bucket in range(buckets):
+                envios = _ler_bucket(path_envios, bucket, ["cpf", "momento"] + colunas_envio)
+                if envios.empty:
+                    continue
+                resgates = _ler_bucket(path_resgates, bucket, ["cpf", "momento", store_column, value_column])\
+                    .rename(columns={store_column: "loja", value_column: "pontos", "momento": "momento_resgate"})\
+                    .astype({"cpf": "int64", "momento_resgate": envios["momento"].dtype})
+
+                # merge_asof exige os dois lados ordenados pela chave de tempo
+                envios = envios.sort_values("momento", kind="stable")
+                resgates = resgates.sort_values("momento_resgate", kind="stable")
+
+                unido = pd.merge_asof(
+                    envios, resgates, left_on="momento", right_on="momento_resgate", by="cpf",
+                    direction="forward", tolerance=janela, allow_exact_matches=True
+                )
+                convertido = unido["momento_resgate"].notna()
+                yield pd.DataFrame({
+                    **{coluna: unido[coluna].astype(str) for coluna in colunas_envio},
+                    "loja": unido["loja"].astype(str).where(convertido, SEM_RESGATE),
+                    "envios": 1,
+                    "conversoes": convertido.astype("int64"),
+                    "pontos_resgatados": pd.to_numeric(unido["pontos"]).fillna(0.0).astype("float64"),
+                    "dias_ate_resgate": ((unido["momento_resgate"] - unido["momento"]).dt.total_seconds() / 86400).fillna(0.0),
+                })
+
+        resultado = aggregate_chunks(
+            atribuidos(), grupos,
+            envios=("envios", "sum"),
+            conversoes=("conversoes", "sum"),
+            pontos_resgatados=("pontos_resgatados", "sum"),
+            dias_ate_resgate=("dias_ate_resgate", "sum"),
+        )
+    finally:
+        if workdir is None:
+            shutil.rmtree(diretorio, ignore_errors=True)
+
+    if resultado.empty:
+        return resultado.assign(taxa_conversao=pd.Series(dtype="float64"))
+
+    envios_totais = resultado.groupby(grupos[:-1])["envios"].transform("sum")
+    return resultado.assign(
+        dias_ate_resgate=np.where(resultado["conversoes"] > 0, resultado["dias_ate_resgate"] / resultado["conversoes"].clip(lower=1), np.nan),
+        taxa_conversao=resultado["conversoes"] / envios_totais,
+    ).sort_values(grupos).reset_index(drop=True)
@@ -0,0 +1,15 @@
+"""
+Reproducible benchmarks on synthetic Sempre Leitura data.
+
+    python -m benchmarks run --sizes 10000 100000 --output benchmarks/baseline.json
+    python -m benchmarks compare benchmarks/baseline.json benchmarks/current.json --threshold 0.2
+    python -m benchmarks outage --outage-duration 2
+    python -m benchmarks webhooks --callbacks 20000 --concurrency 100
+    python -m benchmarks suppression --candidates 1000000
+    python -m benchmarks candidates --users 100000
+    python -m benchmarks schedule --messages 2000 --instances 2
+    python -m benchmarks attribution --sends 10000000 --redemptions 5000000
+    python -m benchmarks startup --max-ms 200
+    python -m benchmarks balances --rows 1000000
+    python -m benchmarks scaling --users 20000 --workers 1 2 4 8
+"""
@@ -0,0 +1,392 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+from benchmarks.synthetic import carregar_sqlite, DATA_REFERENCIA
+from benchmarks.stub_zapi import StubZAPIServer
+
+# Teto de itens para as versões linha a linha, que levariam horas em 1M de usuários
+AMOSTRA_ESCALAR = 2000
+AMOSTRA_CONSULTAS = 200
+AMOSTRA_ENVIO = 2000
+
+# Cada benchmark roda REPETICOES vezes e guarda o menor tempo, que é o menos afetado por ruído
+REPETICOES = 1
+
+def _medir(resultados, nome, tamanho, func, itens):
+    segundos = float("inf")
+    for _ in range(REPETICOES):
+        inicio = time.perf_counter()
+        retorno = func()
+        segundos = min(segundos, time.perf_counter() - inicio)
+
+    resultados[f"{nome}@{tamanho}"] = {
+        "seconds": segundos,
+        "items": itens,
+        "per_item": segundos / itens if itens else None,
+    }
+    print(f"{nome:<40} {tamanho:>9} {segundos:>10.3f}s {itens:>9} items", flush=True)
+    return retorno
+
+def executar_tamanho(tamanho, diretorio, workers, resultados):
+    from utils import (
+        SempreLeitura, ZAPIClient, select_phone_number, select_phone_numbers,
+        validar_cpf, validar_cpfs, TemplateMensagem, TemplateMensagemLote
+    )
+    from campaign_builder import build_campaign
+    from send_queue import SendQueue
+
+    db_path = os.path.join(diretorio, f"sempre_leitura_{tamanho}.db")
+    engine_url = f"sqlite:///{db_path}"
+    engine = carregar_sqlite(db_path, tamanho)
+
+    sempreleitura = SempreLeitura(engine=engine, data_referencia=DATA_REFERENCIA)
+    usuarios = pd.read_sql_query("SELECT * FROM sl_usuarios", engine)
+    amostra_consultas = usuarios["usuario"].iloc[:AMOSTRA_CONSULTAS].tolist()
+
+    _medir(
+        resultados, "getMovimentosContaCorrente", tamanho,
+        lambda: [sempreleitura.getMovimentosContaCorrente(u) for u in amostra_consultas], len(amostra_consultas)
+    )
+    movimentos = _medir(
+        resultados, "getMovimentosContaCorrenteBulk", tamanho,
+        lambda: sempreleitura.getMovimentosContaCorrenteBulk(usuarios["usuario"].tolist()), tamanho
+    )
+
+    amostra_escalar = usuarios["usuario"].iloc[:AMOSTRA_ESCALAR]
+    movimentos_amostra = movimentos[movimentos["usuario"].isin(amostra_escalar)]
+    _medir(
+        resultados, "calculate_balance", tamanho,
+        lambda: [sempreleitura.calculate_balance(df) for _, df in movimentos_amostra.groupby("usuario")],
+        movimentos_amostra["usuario"].nunique()
+    )
+    _medir(resultados, "calculate_balances", tamanho, lambda: sempreleitura.calculate_balances(movimentos), tamanho)
+
+    _medir(
+        resultados, "validar_cpf", tamanho,
+        lambda: [validar_cpf(cpf) for cpf in amostra_escalar], len(amostra_escalar)
+    )
+    _medir(resultados, "validar_cpfs", tamanho, lambda: validar_cpfs(usuarios["usuario"]), tamanho)
+
+    principal = usuarios["ddd"] + usuarios["telefone"]
+    secundario = usuarios["ddd2"].astype(str) + usuarios["telefone2"]
+    _medir(
+        resultados, "select_phone_number", tamanho,
+        lambda: [select_phone_number(p, s) for p, s in zip(principal[:AMOSTRA_ESCALAR], secundario[:AMOSTRA_ESCALAR])],
+        min(AMOSTRA_ESCALAR, tamanho)
+    )
+    _medir(resultados, "select_phone_numbers", tamanho, lambda: select_phone_numbers(principal, secundario), tamanho)
+
+    mensagens, erros = _medir(
+        resultados, "build_campaign", tamanho,
+        lambda: build_campaign(usuarios, workers=workers, engine_url=engine_url, data_referencia=DATA_REFERENCIA), tamanho
+    )
+    if erros:
+        raise RuntimeError(f"build_campaign failed on {len(erros)} shards: {erros}")
+    if mensagens.empty:
+        return
+
+    amostra_mensagens = mensagens.iloc[:AMOSTRA_ESCALAR]
+    _medir(
+        resultados, "TemplateMensagem.pontos_a_expirar", tamanho,
+        lambda: [
+            TemplateMensagem(linha.primeiro_nome, linha.cpf).pontos_a_expirar(
+                linha.data_min_a_expirar, linha.data_max_a_expirar, linha.creditos_a_expirar, linha.Saldo
+            )
+            for linha in amostra_mensagens.itertuples()
+        ],
+        len(amostra_mensagens)
+    )
+    _medir(
+        resultados, "TemplateMensagemLote.pontos_a_expirar", tamanho,
+        lambda: TemplateMensagemLote(mensagens).pontos_a_expirar(), len(mensagens)
+    )
+
+    amostra_envio = mensagens.iloc[:AMOSTRA_ENVIO]
+
+    def enviar(zapi_client):
+        # Uma fila nova a cada repetição, para todas enviarem as mesmas mensagens
+        with tempfile.TemporaryDirectory(dir=diretorio) as diretorio_fila:
+            send_queue = SendQueue(os.path.join(diretorio_fila, "send_queue.db"))
+            send_queue.enqueue(amostra_envio, nome_projeto="benchmark")
+            enviadas = send_queue.drain(zapi_client, nome_projeto="benchmark", delay_message=0)
+        if enviadas != len(amostra_envio):
+            raise RuntimeError(f"Sent {enviadas} of {len(amostra_envio)} messages to the stub")
+
+    with StubZAPIServer() as stub:
+        zapi_client = ZAPIClient("benchmark", "benchmark", "benchmark", base_url=stub.base_url)
+        _medir(resultados, "enqueue_and_drain", tamanho, lambda: enviar(zapi_client), len(amostra_envio))
+
+def run(args):
+    global REPETICOES
+    REPETICOES = args.repeat
+
+    diretorio = args.data_dir if args.data_dir else tempfile.mkdtemp(prefix="benchmarks_")
+    os.makedirs(diretorio, exist_ok=True)
+
+    resultados = {}
+    for tamanho in args.sizes:
+        executar_tamanho(tamanho, diretorio, args.workers, resultados)
+
+    baseline = {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "sizes": args.sizes,
+            "repeat": args.repeat,
+        },
+        "results": resultados,
+    }
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(baseline, f, indent=2)
+    print(f"Results written to {args.output}")
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)["results"]
+    with open(args.current) as f:
+        current = json.load(f)["results"]
+
+    regressoes = []
+    for nome in sorted(baseline.keys() & current.keys()):
+        antes, depois = baseline[nome]["seconds"], current[nome]["seconds"]
+        variacao = depois / antes - 1 if antes else 0.0
+        # Diferenças absolutas pequenas são ruído de medição, não regressão
+        regrediu = variacao > args.threshold and depois - antes > args.min_seconds
+        if regrediu:
+            regressoes.append(nome)
+        print(f"{nome:<50} {antes:>10.3f}s {depois:>10.3f}s {variacao:>+8.1%}{'  REGRESSION' if regrediu else ''}")
+
+    for nome in sorted(baseline.keys() - current.keys()):
+        print(f"{nome:<50} missing from {args.current}")
+
+    if regressoes:
+        print(f"{len(regressoes)} regression(s) above {args.threshold:.0%}")
+        return 1
+    return 0
+
+def outage(args):
+    from benchmarks.fault_injection import simular_queda
+
+    vazao, resumo = simular_queda(args.messages, args.outage_start, args.outage_duration, args.status)
+    print(vazao.to_string())
+    for chave, valor in resumo.items():
+        print(f"{chave:<28} {valor}")
+
+    recuperou = resumo["vazao_depois"] >= args.recovery * resumo["vazao_antes"]
+    if resumo["enviadas"] != resumo["mensagens"] or not recuperou:
+        print("Throughput did not recover after the outage or messages were lost")
+        return 1
+    return 0
+
+def webhooks(args):
+    from benchmarks.webhook_load import carga_webhooks
+
+    resultado = carga_webhooks(args.callbacks, args.concurrency)
+    for chave, valor in resultado.items():
+        print(f"{chave:<28} {valor}")
+
+    if resultado["events_written"] != resultado["events_expected"] or resultado["opt_outs"] != resultado["opt_outs_expected"]:
+        print("Webhook events were lost")
+        return 1
+    return 0
+
+def suppression(args):
+    from benchmarks.suppression_load import medir_supressao
+
+    resultado = medir_supressao(args.candidates, args.suppressed)
+    for chave, valor in resultado.items():
+        print(f"{chave:<32} {valor}")
+
+    if resultado["contains_int64_seconds"] > args.max_seconds:
+        print(f"Membership check took more than {args.max_seconds}s")
+        return 1
+    return 0
+
+def candidates(args):
+    from benchmarks.candidate_rows import contar_linhas
+    from candidates import covering_index_ddl
+
+    diretorio = args.data_dir if args.data_dir else tempfile.mkdtemp(prefix="benchmarks_")
+    os.makedirs(diretorio, exist_ok=True)
+
+    resultado = contar_linhas(args.users, args.movements_per_user, diretorio)
+    for chave, valor in resultado.items():
+        print(f"{chave:<28} {valor}")
+    print(f"\nRecommended SQL Server indexes:\n{covering_index_ddl()}")
+
+    if not resultado["same_candidates"]:
+        print("The SQL aggregation selected different candidates")
+        return 1
+    return 0
+
+def schedule(args):
+    from benchmarks.schedule_sim import simular_campanha
+
+    historico, resumo = simular_campanha(args.messages, args.start, args.instances)
+    for chave, valor in resumo.items():
+        print(f"{chave:<32} {valor}")
+
+    if resumo["enviadas"] != resumo["mensagens"] or resumo["envios_fora_da_janela"]:
+        print("Messages were lost or sent outside the sending windows")
+        return 1
+    return 0
+
+def attribution(args):
+    from benchmarks.attribution_load import medir_atribuicao
+
+    resultado = medir_atribuicao(args.sends, args.redemptions, args.customers, buckets=args.buckets)
+    for chave, valor in resultado.items():
+        print(f"{chave:<28} {valor}")
+
+    if resultado["matches_plain_merge"] is False:
+        print("The as-of join found different conversions than the plain merge")
+        return 1
+    return 0
+
+def balances(args):
+    from benchmarks.balances_load import medir_saldos
+
+    resultado = medir_saldos(args.rows, args.users, args.sample)
+    for chave, valor in resultado.items():
+        print(f"{chave:<36} {valor}")
+
+    if not resultado["same_balances"]:
+        print("calculate_balances differs from calculate_balance")
+        return 1
+    return 0
+
+def scaling(args):
+    from benchmarks.campaign_scaling import medir_escala
+
+    resultado = medir_escala(args.users, args.workers, shard_size=args.shard_size, diretorio=args.data_dir)
+    print(f"CPUs: {os.cpu_count()}")
+    print(resultado.to_string(index=False))
+
+    if not resultado["same_messages"].all():
+        print("build_campaign produced different messages with different numbers of workers")
+        return 1
+    return 0
+
+def startup(args):
+    from benchmarks.cli_startup import medir_inicializacao
+
+    resultado = medir_inicializacao(args.repeat)
+    print(f"{'case':<32} {'wall ms':>9} {'import ms':>10}")
+    for nome, medida in resultado.items():
+        print(f"{nome:<32} {medida['wall_ms']:>9.0f} {medida['import_ms']:>10.0f}")
+
+    lentos = [nome for nome, medida in resultado.items() if medida["light"] and medida["wall_ms"] > args.max_ms]
+    if lentos:
+        print(f"Light subcommands slower than {args.max_ms} ms: {', '.join(lentos)}")
+        return 1
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Benchmarks on synthetic Sempre Leitura data")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parser_run = subparsers.add_parser("run", help="Runs the benchmarks and writes the results to JSON")
+    parser_run.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000],
+                            help="Numbers of users to generate (1000000 is supported but takes a while)")
+    parser_run.add_argument("--output", default="benchmarks/baseline.json")
+    parser_run.add_argument("--data-dir", default=None, help="Where to keep the SQLite files (reused between runs)")
+    parser_run.add_argument("--repeat", type=int, default=3, help="Runs of each benchmark; the fastest one is kept")
+    parser_run.add_argument("--workers", type=int, default=None, help="Processes for build_campaign")
+
+    parser_compare = subparsers.add_parser("compare", help="Flags benchmarks slower than the baseline")
+    parser_compare.add_argument("baseline")
+    parser_compare.add_argument("current")
+    parser_compare.add_argument("--threshold", type=float, default=0.2,
+                                help="Allowed slowdown before flagging a regression (0.2 = 20%%)")
+    parser_compare.add_argument("--min-seconds", type=float, default=0.05,
+                                help="Ignores slowdowns smaller than this many seconds")
+
+    parser_outage = subparsers.add_parser("outage", help="Injects a Z-API outage and checks that sending recovers")
+    parser_outage.add_argument("--messages", type=int, default=2000)
+    parser_outage.add_argument("--outage-start", type=float, default=1.0, help="Seconds before the outage")
+    parser_outage.add_argument("--outage-duration", type=float, default=2.0)
+    parser_outage.add_argument("--status", type=int, default=503, help="Status returned during the outage")
+    parser_outage.add_argument("--recovery", type=float, default=0.8,
+                               help="Fraction of the throughput before the outage expected after it")
+
+    parser_webhooks = subparsers.add_parser("webhooks", help="Load test of the webhook receiver")
+    parser_webhooks.add_argument("--callbacks", type=int, default=20_000)
+    parser_webhooks.add_argument("--concurrency", type=int, default=100)
+
+    parser_suppression = subparsers.add_parser("suppression", help="Times the suppression filter on synthetic candidates")
+    parser_suppression.add_argument("--candidates", type=int, default=1_000_000)
+    parser_suppression.add_argument("--suppressed", type=int, default=200_000, help="Values of each suppression kind")
+    parser_suppression.add_argument("--max-seconds", type=float, default=0.5,
+                                    help="Longest acceptable membership check of all the candidates")
+
+    parser_candidates = subparsers.add_parser("candidates", help="Rows moved by the candidate selection, before and after")
+    parser_candidates.add_argument("--users", type=int, default=100_000)
+    parser_candidates.add_argument("--movements-per-user", type=int, default=10)
+    parser_candidates.add_argument("--data-dir", default=None, help="Where to keep the SQLite files (reused between runs)")
+
+    parser_schedule = subparsers.add_parser("schedule", help="Runs a campaign through the send scheduler on a simulated clock")
+    parser_schedule.add_argument("--messages", type=int, default=2000)
+    parser_schedule.add_argument("--start", default="2025-03-07 17:50", help="Simulated start, a Friday near closing by default")
+    parser_schedule.add_argument("--instances", type=int, default=2)
+
+    parser_attribution = subparsers.add_parser("attribution", help="Out-of-core attribution of sends to redemptions")
+    parser_attribution.add_argument("--sends", type=int, default=1_000_000)
+    parser_attribution.add_argument("--redemptions", type=int, default=500_000)
+    parser_attribution.add_argument("--customers", type=int, default=300_000)
+    parser_attribution.add_argument("--buckets", type=int, default=64)
+
+    parser_balances = subparsers.add_parser("balances", help="calculate_balances on synthetic movements, checked against calculate_balance")
+    parser_balances.add_argument("--rows", type=int, default=1_000_000)
+    parser_balances.add_argument("--users", type=int, default=100_000)
+    parser_balances.add_argument("--sample", type=int, default=1000, help="Users also run through calculate_balance")
+
+    parser_scaling = subparsers.add_parser("scaling", help="build_campaign with 1, 2, 4 and 8 worker processes")
+    parser_scaling.add_argument("--users", type=int, default=20_000)
+    parser_scaling.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser_scaling.add_argument("--shard-size", type=int, default=None, help="Users per shard (four shards per process by default)")
+    parser_scaling.add_argument("--data-dir", default=None, help="Where to keep the SQLite files (reused between runs)")
+
+    parser_startup = subparsers.add_parser("startup", help="Cold start of the cli.py subcommands (python -X importtime)")
+    parser_startup.add_argument("--repeat", type=int, default=5, help="Runs of each case; the fastest one is kept")
+    parser_startup.add_argument("--max-ms", type=float, default=200, help="Longest acceptable start of the light subcommands")
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        run(args)
+        return 0
+    if args.command == "outage":
+        return outage(args)
+    if args.command == "webhooks":
+        return webhooks(args)
+    if args.command == "suppression":
+        return suppression(args)
+    if args.command == "candidates":
+        return candidates(args)
+    if args.command == "schedule":
+        return schedule(args)
+    if args.command == "attribution":
+        return attribution(args)
+    if args.command == "balances":
+        return balances(args)
+    if args.command == "scaling":
+        return scaling(args)
+    if args.command == "startup":
+        return startup(args)
+    return compare(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+import os
+import resource
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+def _gerar(path, linhas, cpfs, inicio, dias, colunas, seed, chunk=1_000_000):
+    """Writes a Parquet dataset partitioned by month, chunk by chunk, with CPFs drawn from cpfs"""
+    rng = np.random.default_rng(seed)
+    for i in range(0, linhas, chunk):
+        n = min(chunk, linhas - i)
+        momento = pd.Timestamp(inicio) + pd.to_timedelta(rng.integers(0, dias * 86400, n), "s")
+        df = pd.DataFrame({"usuario": rng.choice(cpfs, n), "momento": momento, **colunas(rng, n)})
+        df["mes"] = df["momento"].dt.to_period("M").astype(str)
+        pq.write_to_dataset(pa.Table.from_pandas(df, preserve_index=False), path, partition_cols=["mes"],
+                            basename_template=f"part-{i}-{{i}}.parquet")
+
+def medir_atribuicao(envios: int = 1_000_000, resgates: int = 500_000, clientes: int = 300_000,
+                     janela: float = 7, buckets: int = 64, seed: int = 0, verificar: bool = None) -> dict:
+    """
+    Times attribute_conversions over synthetic partitioned Parquet sends and redemptions.
+
+    :param verificar: Compares with a plain merge of every send with every redemption of the
+        CPF (only feasible for small inputs; by default up to 200k sends)
+    :return: Dict with the timings, peak memory and the totals
+    """
+    from attribution import attribute_conversions
+
+    verificar = envios <= 200_000 if verificar is None else verificar
+    cpfs = np.arange(10**9, 10**9 + clientes)
+
+    with tempfile.TemporaryDirectory() as diretorio:
+        path_envios = os.path.join(diretorio, "sends")
+        path_resgates = os.path.join(diretorio, "redemptions")
+
+        inicio = time.perf_counter()
+        _gerar(path_envios, envios, cpfs, "2024-01-01", 360, lambda rng, n: {
+            "nome_projeto": rng.choice(["aviso_pontos_a_expirar", "pre_venda_copa", "loja_especifica"], n),
+            "variante": rng.choice(["A", "B"], n),
+        }, seed)
+        _gerar(path_resgates, resgates, cpfs, "2024-01-01", 370, lambda rng, n: {
+            "cnpj_empresa": rng.choice([f"{i:014d}" for i in range(1, 51)], n),
+            "valor": rng.integers(100, 5000, n).astype(float),
+        }, seed + 1)
+        segundos_gerar = time.perf_counter() - inicio
+        memoria_antes = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        inicio = time.perf_counter()
+        resultado = attribute_conversions(
+            path_envios, path_resgates, window_days=janela, buckets=buckets, variant_column="variante",
+            send_time="momento", redemption_time="momento", workdir=os.path.join(diretorio, "work")
+        )
+        segundos = time.perf_counter() - inicio
+        memoria_depois = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        conferido = None
+        if verificar:
+            e = pd.read_parquet(path_envios).reset_index(names="envio")
+            r = pd.read_parquet(path_resgates)
+            unido = e.merge(r, on="usuario", suffixes=("", "_resgate"))
+            delta = unido["momento_resgate"] - unido["momento"]
+            unido = unido[(delta >= pd.Timedelta(0)) & (delta <= pd.Timedelta(days=janela))]
+            esperado = unido.groupby("envio")["momento_resgate"].min().size
+            conferido = int(resultado["conversoes"].sum()) == esperado and int(resultado["envios"].sum()) == envios
+
+    return {
+        "sends": envios,
+        "redemptions": resgates,
+        "buckets": buckets,
+        "generate_seconds": segundos_gerar,
+        "attribution_seconds": segundos,
+        # ru_maxrss é o pico do processo (KB no Linux); o aumento é o que a atribuição somou ao pico
+        "peak_rss_mb": memoria_depois / 1024,
+        "peak_rss_increase_mb": (memoria_depois - memoria_antes) / 1024,
+        "conversions": int(resultado["conversoes"].sum()),
+        "groups": len(resultado),
+        "matches_plain_merge": conferido,
+    }
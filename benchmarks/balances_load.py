@@ -0,0 +1,48 @@
+import time
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine
+
+from benchmarks.synthetic import gerar_movimentos_saldo
+
+def medir_saldos(linhas: int = 1_000_000, usuarios: int = 100_000, amostra: int = 1000, seed: int = 0) -> dict:
+    """
+    Times calculate_balances on linhas synthetic movements, next to calculate_balance on a sample
+    of users, and checks that both give the same totals for the sample.
+
+    :return: Dict with the timings, in seconds, and the result of the comparison
+    """
+    from utils import SempreLeitura
+
+    sempreleitura = SempreLeitura(engine=create_engine("sqlite://"))
+    data_limite_expiracao, _ = sempreleitura.datas_limite()
+    movimentos = gerar_movimentos_saldo(linhas, usuarios, data_limite_expiracao, seed=seed)
+
+    inicio = time.perf_counter()
+    saldos = sempreleitura.calculate_balances(movimentos).set_index("usuario")
+    segundos = time.perf_counter() - inicio
+
+    rng = np.random.default_rng(seed)
+    usuarios_amostra = rng.choice(movimentos["usuario"].unique(), min(amostra, len(saldos)), replace=False)
+    grupos = movimentos[movimentos["usuario"].isin(usuarios_amostra)].groupby("usuario")
+
+    inicio = time.perf_counter()
+    esperado = pd.DataFrame([sempreleitura.calculate_balance(df) for _, df in grupos]).set_index("usuario")
+    segundos_escalar = time.perf_counter() - inicio
+
+    colunas = ["Créditos", "Débitos", "Saldo", "Créditos Expirados", "Créditos a Expirar"]
+    iguais = np.allclose(saldos.loc[esperado.index, colunas].to_numpy(float), esperado[colunas].to_numpy(float)) and all(
+        sorted(map(pd.Timestamp, saldos.at[usuario, "datas_a_expirar"])) == sorted(map(pd.Timestamp, datas))
+        for usuario, datas in esperado["datas_a_expirar"].items()
+    )
+
+    return {
+        "rows": linhas,
+        "users": len(saldos),
+        "calculate_balances_seconds": segundos,
+        "sample_users": len(esperado),
+        "calculate_balance_sample_seconds": segundos_escalar,
+        # Estimativa do laço por usuário em todos os usuários, a partir da amostra
+        "calculate_balance_projected_seconds": segundos_escalar / max(len(esperado), 1) * len(saldos),
+        "same_balances": bool(iguais),
+    }
@@ -0,0 +1,51 @@
+import os
+import tempfile
+import time
+import pandas as pd
+
+from benchmarks.synthetic import carregar_sqlite, DATA_REFERENCIA
+
+def medir_escala(usuarios: int = 20_000, workers=(1, 2, 4, 8), shard_size: int = None, diretorio: str = None) -> pd.DataFrame:
+    """
+    Times build_campaign on the same synthetic database with each number of workers.
+
+    :param usuarios: Candidate users
+    :param workers: Numbers of processes to run
+    :param shard_size: Users per shard (defaults to four shards per process of the largest run)
+    :param diretorio: Where to keep the SQLite file (reused between runs)
+    :return: DataFrame with the seconds, the speedup over the first run and the efficiency
+        (speedup per worker) of each number of workers
+    """
+    from campaign_builder import build_campaign
+
+    diretorio = diretorio if diretorio else tempfile.mkdtemp(prefix="benchmarks_")
+    os.makedirs(diretorio, exist_ok=True)
+    db_path = os.path.join(diretorio, f"sempre_leitura_{usuarios}.db")
+    engine = carregar_sqlite(db_path, usuarios)
+    candidatos = pd.read_sql_query("SELECT * FROM sl_usuarios", engine)
+    engine.dispose()
+
+    shard_size = shard_size if shard_size else max(1, usuarios // (max(workers) * 4))
+
+    linhas, mensagens_primeira = [], None
+    for n in workers:
+        inicio = time.perf_counter()
+        mensagens, erros = build_campaign(candidatos, workers=n, shard_size=shard_size, engine_url=f"sqlite:///{db_path}",
+                                          data_referencia=DATA_REFERENCIA)
+        segundos = time.perf_counter() - inicio
+        if erros:
+            raise RuntimeError(f"build_campaign failed on {len(erros)} shards with {n} workers: {erros}")
+
+        # Todas as rodadas têm que gerar as mesmas mensagens, só em tempos diferentes
+        mensagens = mensagens.sort_values("cpf").reset_index(drop=True)
+        if mensagens_primeira is None:
+            mensagens_primeira = mensagens
+        mesmas = mensagens[["cpf", "mensagem"]].equals(mensagens_primeira[["cpf", "mensagem"]])
+
+        linhas.append({"workers": n, "seconds": segundos, "messages": len(mensagens), "same_messages": mesmas})
+        print(f"{n:>3} workers {segundos:>9.3f}s {len(mensagens):>9} messages", flush=True)
+
+    resultado = pd.DataFrame(linhas)
+    resultado["speedup"] = resultado["seconds"].iloc[0] / resultado["seconds"]
+    resultado["efficiency"] = resultado["speedup"] / (resultado["workers"] / resultado["workers"].iloc[0])
+    return resultado
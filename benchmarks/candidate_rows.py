@@ -0,0 +1,74 @@
+import os
+import time
+import pandas as pd
+
+from benchmarks.synthetic import carregar_sqlite, DATA_REFERENCIA
+
+# O SELECT de pontuacao_periodo usado antes pelo build, sem o CONVERT que o SQLite não tem
+SQL_MOVIMENTOS_PERIODO = """
+SELECT mov.usuario, mov.data_hora, mov.valor, mov.tipo, mov.data_cupom, usr.nome_cliente, usr.ddd, usr.telefone, usr.ddd2, usr.telefone2
+FROM sl_movimentacao_conta_corrente mov
+LEFT JOIN sl_usuarios usr
+ON mov.usuario = usr.usuario
+WHERE mov.tipo = 'C'
+    AND mov.data_hora >= :data_inicio
+    AND mov.data_hora < :data_fim
+"""
+
+def contar_linhas(usuarios: int, movimentos_por_usuario: int, diretorio: str, min_pontos: float = 500, dias: int = 20) -> dict:
+    """
+    Rows moved from a SQLite copy of the tables by the old candidate selection (every credit of
+    the period, aggregated in pandas) and by select_candidates, checking both pick the same users.
+
+    :return: Dict with the rows, seconds and query plan of each side
+    """
+    from utils import SQLServer, aggregate_chunks
+    from candidates import select_candidates
+
+    db_path = os.path.join(diretorio, f"sempre_leitura_{usuarios}_{movimentos_por_usuario}.db")
+    sqlserver_db = SQLServer(engine=carregar_sqlite(db_path, usuarios, movimentos_por_usuario))
+
+    data_inicio = DATA_REFERENCIA - pd.DateOffset(months=12) + pd.DateOffset(days=10)
+    data_fim = data_inicio + pd.DateOffset(days=dias)
+    params = {"data_inicio": data_inicio.strftime("%Y-%m-%d"), "data_fim": data_fim.strftime("%Y-%m-%d")}
+
+    inicio = time.perf_counter()
+    linhas_antes = 0
+
+    def chunks():
+        nonlocal linhas_antes
+        for chunk in sqlserver_db.pandas_read_sql_iter(SQL_MOVIMENTOS_PERIODO, params=params, chunksize=200_000):
+            linhas_antes += len(chunk)
+            yield chunk
+
+    antes = aggregate_chunks(chunks(), "usuario", pontos_acumulados_periodo=("valor", "sum"))
+    antes = antes[antes["pontos_acumulados_periodo"] > min_pontos]
+    segundos_antes = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    depois = select_candidates(sqlserver_db, data_inicio, data_fim, min_pontos)
+    segundos_depois = time.perf_counter() - inicio
+
+    comparacao = antes.merge(depois, on="usuario", how="outer", suffixes=("_antes", "_depois"), indicator=True)
+    iguais = (comparacao["_merge"] == "both").all() and (
+        (comparacao["pontos_acumulados_periodo_antes"] - comparacao["pontos_acumulados_periodo_depois"]).abs() < 1e-6
+    ).all()
+
+    with sqlserver_db.engine.connect() as conn:
+        plano = conn.exec_driver_sql(
+            "EXPLAIN QUERY PLAN SELECT usuario, SUM(valor) FROM sl_movimentacao_conta_corrente "
+            "WHERE tipo = 'C' AND data_hora >= ? AND data_hora < ? GROUP BY usuario",
+            (params["data_inicio"], params["data_fim"])
+        ).fetchall()
+
+    return {
+        "users": usuarios,
+        "movements": usuarios * movimentos_por_usuario,
+        "rows_before": linhas_antes,
+        "rows_after": len(depois),
+        "reduction": linhas_antes / max(len(depois), 1),
+        "seconds_before": segundos_antes,
+        "seconds_after": segundos_depois,
+        "same_candidates": bool(iguais),
+        "sqlite_plan": " | ".join(linha[-1] for linha in plano),
+    }
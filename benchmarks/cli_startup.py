@@ -0,0 +1,73 @@
+import ast
+import inspect
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _importacoes(func) -> str:
+    """The imports at the top level of func, as one line of code; the ones in its branches are left out"""
+    funcao = ast.parse(textwrap.dedent(inspect.getsource(func))).body[0]
+    return "; ".join(
+        ast.unparse(no) for no in funcao.body if isinstance(no, (ast.Import, ast.ImportFrom))
+    )
+
+def _importtime_ms(stderr: str) -> float:
+    # Soma o tempo acumulado dos imports de primeiro nível (os aninhados já estão dentro deles)
+    total = 0
+    for linha in stderr.splitlines():
+        if not linha.startswith("import time:") or "cumulative" in linha:
+            continue
+        _, cumulativo, nome = linha.split("|")
+        if not nome[1:].startswith(" "):
+            total += int(cumulativo)
+    return total / 1000
+
+def _medir(argumentos, repeticoes, env):
+    segundos, importtime = float("inf"), None
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        processo = subprocess.run(
+            [sys.executable, "-X", "importtime", *argumentos], cwd=RAIZ, env=env,
+            capture_output=True, text=True
+        )
+        segundos = min(segundos, time.perf_counter() - inicio)
+        if processo.returncode != 0:
+            raise RuntimeError(f"{argumentos} failed: {processo.stderr[-2000:]}")
+        importtime = _importtime_ms(processo.stderr)
+    return {"wall_ms": segundos * 1000, "import_ms": importtime}
+
+def medir_inicializacao(repeticoes: int = 5) -> dict:
+    """
+    Cold start of each cli.py subcommand, measured with python -X importtime in a new process.
+
+    The light cases run the command itself (send with an empty queue is what the cron pays
+    when there is nothing to send); for the others only the imports of the subcommand are run.
+
+    :param repeticoes: Runs of each case; the fastest one is kept
+    :return: {case: {"wall_ms", "import_ms", "light"}}
+    """
+    import cli
+
+    resultados = {}
+    with tempfile.TemporaryDirectory() as diretorio:
+        env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+        fila = os.path.join(diretorio, "send_queue.db")
+        casos = [
+            ("python (no imports)", ["-c", "pass"], False),
+            ("import utils", ["-c", "import utils"], False),
+            ("cli.py --help", ["cli.py", "--help"], True),
+            ("cli.py send, nothing to send", ["cli.py", "--queue", fila, "send"], True),
+            ("cli.py send, sending", ["-c", f"import cli; {_importacoes(cli.send)}; import zapi_client, requests"], True),
+            ("cli.py build", ["-c", f"import cli; {_importacoes(cli.build)}"], False),
+            ("cli.py enrich", ["-c", f"import cli; {_importacoes(cli.enrich)}; import zapi_client, requests"], False),
+            ("cli.py report", ["-c", f"import cli; {_importacoes(cli.report)}"], False),
+        ]
+        for nome, argumentos, leve in casos:
+            resultados[nome] = {**_medir(argumentos, repeticoes, env), "light": leve}
+
+    return resultados
@@ -0,0 +1,89 @@
+import os
+import tempfile
+import threading
+import time
+import numpy as np
+import pandas as pd
+
+from benchmarks.stub_zapi import StubZAPIServer
+
+def simular_queda(mensagens: int = 2000, inicio_queda: float = 1.0, duracao_queda: float = 2.0,
+                  status_queda: int = 503, latencia: float = 0.002, intervalo: float = 0.25, cooldown: float = 0.5):
+    """
+    Sends messages through SendQueue and ZAPIClient to the stub while the stub goes down for a while.
+
+    Failed sends are requeued until every message is sent, as an operator would do with
+    SendQueue.retry_failed; the stub never delivers a message it answers with an error, so the
+    ambiguous failures (5xx) are requeued too.
+
+    :return: Tuple with the throughput per interval (DataFrame) and a dict with the summary
+    """
+    from utils import ZAPIClient
+    from send_queue import SendQueue
+    from zapi_transport import ZAPITransport, CircuitBreaker
+
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        "cpf": [f"{i:011d}" for i in range(mensagens)],
+        # Telefones distintos, para uma mensagem entregue duas vezes aparecer no stub
+        "telefone_contato": [f"55119{n:08d}" for n in rng.choice(10**8, mensagens, replace=False)],
+        "mensagem": "Mensagem de teste",
+    })
+
+    with StubZAPIServer(latency=latencia) as stub, tempfile.TemporaryDirectory() as diretorio:
+        breaker = CircuitBreaker(window=20, error_threshold=0.5, min_requests=10, cooldown=cooldown)
+        transport = ZAPITransport(connect_timeout=1, read_timeout=2, backoff=0.05, max_backoff=1, breaker=breaker)
+        zapi_client = ZAPIClient("fault", "fault", "fault", base_url=stub.base_url, transport=transport)
+
+        send_queue = SendQueue(os.path.join(diretorio, "send_queue.db"))
+        send_queue.enqueue(df, nome_projeto="fault_injection")
+
+        def queda():
+            time.sleep(inicio_queda)
+            stub.error_status, stub.error_rate = status_queda, 1.0
+            time.sleep(duracao_queda)
+            stub.error_rate = 0.0
+
+        inicio = time.time()
+        threading.Thread(target=queda, daemon=True).start()
+
+        enviadas, rodadas = 0, 0
+        while enviadas < mensagens and rodadas < 20:
+            enviadas += send_queue.drain(zapi_client, nome_projeto="fault_injection", delay_message=0)
+            send_queue.retry_failed("fault_injection", include_ambiguous=True)
+            rodadas += 1
+        fim = time.time()
+
+        outcomes = transport.outcomes_dataframe()
+        requisicoes = sum(stub.requests.values())
+        entregues = pd.Series([mensagem["phone"] for mensagem in stub.sent_messages], dtype=object)
+
+    outcomes["intervalo"] = ((outcomes["timestamp"] - inicio) // intervalo * intervalo).round(3)
+    vazao = (
+        outcomes
+            .assign(enviadas=outcomes["outcome"].isin(["ok", "retried_ok"]))
+            .groupby("intervalo")
+            .agg(enviadas=("enviadas", "sum"), falhas=("enviadas", lambda x: (~x).sum()))
+            .reindex(np.round(np.arange(0, fim - inicio, intervalo), 3), fill_value=0)
+            .assign(mensagens_por_segundo=lambda x: x["enviadas"] / intervalo)
+    )
+
+    fim_queda = inicio_queda + duracao_queda
+    antes = vazao.loc[vazao.index < inicio_queda, "mensagens_por_segundo"]
+    depois = vazao.loc[(vazao.index >= fim_queda + cooldown) & (vazao.index < fim - inicio - intervalo), "mensagens_por_segundo"]
+
+    resumo = {
+        "mensagens": mensagens,
+        "enviadas": enviadas,
+        "rodadas": rodadas,
+        "requisicoes_stub": requisicoes,
+        "entregues_stub": int(entregues.nunique()),
+        "entregues_em_dobro": int(entregues.duplicated().sum()),
+        "aberturas_circuit_breaker": breaker.times_opened,
+        "estado_final_circuit_breaker": breaker.state,
+        "vazao_antes": float(antes.mean()) if len(antes) else 0.0,
+        "vazao_durante": float(vazao.loc[(vazao.index >= inicio_queda) & (vazao.index < fim_queda), "mensagens_por_segundo"].mean()),
+        "vazao_depois": float(depois.mean()) if len(depois) else 0.0,
+        "segundos": fim - inicio,
+    }
+    return vazao, resumo
@@ -0,0 +1,88 @@
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+
+from benchmarks.stub_zapi import StubZAPIServer
+
+def simular_campanha(mensagens: int = 2000, inicio: str = "2025-03-07 17:50", instancias: int = 2,
+                     latencia: float = 0.005, fracao_falha: tuple = (0.3, 0.5), seed: int = 0):
+    """
+    Runs a campaign through SendScheduler against the stub, on a simulated clock.
+
+    The campaign starts close to the end of a business day, so it has to wait for the next
+    window, and the last instance fails during the fraction fracao_falha of the messages.
+
+    :return: Tuple with the history of sends (DataFrame) and a dict with the summary
+    """
+    from utils import ZAPIClient
+    from zapi_pool import ZAPIPool
+    from zapi_transport import ZAPITransport, CircuitBreaker
+    from send_queue import SendQueue
+    from scheduler import SendScheduler, SendingWindows, SimulatedClock, campaign_priority
+
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "cpf": [f"{i:011d}" for i in range(mensagens)],
+        "telefone_contato": [f"55119{n:08d}" for n in rng.integers(0, 10**8, mensagens)],
+        "mensagem": "Mensagem de teste",
+        "Saldo": rng.integers(500, 20_000, mensagens).astype(float),
+    })
+
+    clock = SimulatedClock(pd.Timestamp(inicio))
+    windows = SendingWindows()
+    ids = [f"instancia{i}" for i in range(instancias)]
+
+    with StubZAPIServer(latency=latencia) as stub, tempfile.TemporaryDirectory() as diretorio:
+        # Sem retries no transporte, o ritmo fica todo com o scheduler; o cooldown dos breakers corre no relógio simulado
+        pool = ZAPIPool([
+            ZAPIClient(instance_id, instance_id, "sim", base_url=stub.base_url, transport=ZAPITransport(
+                max_retries=0, block_when_open=False, breaker=CircuitBreaker(clock=lambda: clock.now().timestamp())
+            ))
+            for instance_id in ids
+        ])
+        send_queue = SendQueue(os.path.join(diretorio, "send_queue.db"))
+        send_queue.enqueue(df.assign(priority=campaign_priority(df, "Saldo")), "simulacao", priority_column="priority")
+
+        scheduler = SendScheduler(send_queue, pool, windows=windows, clock=clock, delay_message=1)
+        projetado = scheduler.projected_completion("simulacao")
+
+        antes_falha = int(mensagens * fracao_falha[0])
+        durante_falha = int(mensagens * fracao_falha[1]) - antes_falha
+        enviadas = scheduler.run("simulacao", max_messages=antes_falha)
+        taxas_antes = scheduler.stats().set_index("instance_id")["messages_per_second"]
+        projetado_com_ritmo = scheduler.projected_completion("simulacao")
+
+        stub.failing_instances.add(ids[-1])
+        enviadas += scheduler.run("simulacao", max_messages=durante_falha)
+        taxas_falha = scheduler.stats().set_index("instance_id")["messages_per_second"]
+        stub.failing_instances.clear()
+
+        # O stub não entrega as mensagens que responde com erro, então os 5xx também voltam à fila
+        send_queue.retry_failed("simulacao", include_ambiguous=True)
+        enviadas += scheduler.run("simulacao")
+        fim = clock.now()
+
+        historico = scheduler.history_dataframe()
+        stats = scheduler.stats()
+
+    fora_da_janela = (~historico["timestamp"].map(windows.is_open)).sum()
+    enviados = historico[historico["success"]]
+    ordem = enviados.merge(df.assign(idempotency_key="simulacao:" + df["cpf"]), on="idempotency_key")
+
+    resumo = {
+        "mensagens": mensagens,
+        "enviadas": enviadas,
+        "inicio": inicio,
+        "conclusao_projetada_no_inicio": projetado,
+        "conclusao_projetada_no_ritmo": projetado_com_ritmo,
+        "conclusao": fim,
+        "envios_fora_da_janela": int(fora_da_janela),
+        # Correlação entre a ordem de envio e o Saldo: perto de -1 quando os maiores saem primeiro
+        "correlacao_ordem_saldo": float(np.corrcoef(np.arange(len(ordem)), ordem["Saldo"])[0, 1]) if len(ordem) > 1 else 0.0,
+        "taxa_antes_da_falha": taxas_antes.to_dict(),
+        "taxa_durante_a_falha": taxas_falha.to_dict(),
+        "taxa_final": stats.set_index("instance_id")["messages_per_second"].to_dict(),
+        "horas_de_delay_fixo_de_10s": mensagens * 10 / 3600 / instancias,
+    }
+    return historico, resumo
@@ -0,0 +1,142 @@
+import asyncio
+import itertools
+import random
+import threading
+from collections import Counter
+from aiohttp import web
+
+class StubZAPIServer:
+    """
+    Local HTTP server that answers like Z-API, for benchmarks and fault-injection runs.
+
+    Runs its own event loop in a background thread. Latency, error rate and the
+    error status can be changed while it runs (e.g. to simulate an outage), and
+    instances listed in failing_instances always fail.
+
+        with StubZAPIServer(latency=0.02) as stub:
+            client = ZAPIClient("instance", "token", "client-token", base_url=stub.base_url)
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+                 error_rate: float = 0.0, error_status: int = 500, retry_after: int = None, seed: int = 0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+
+        self.failing_instances = set()
+        self.requests = Counter()
+        self.requests_by_instance = Counter()
+        self.responses = Counter()
+        self.sent_messages = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._random = random.Random(seed)
+        self._ids = itertools.count(1)
+        self._loop = None
+        self._runner = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def start(self):
+        iniciado = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self._start_site())
+            iniciado.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        iniciado.wait()
+
+    def stop(self):
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop = None
+
+    async def _start_site(self):
+        app = web.Application()
+        base = "/instances/{instance}/token/{token}"
+        app.router.add_post(f"{base}/send-text", self._send)
+        app.router.add_post(f"{base}/send-image", self._send)
+        app.router.add_post(f"{base}/read-message", self._read_message)
+        app.router.add_get(f"{base}/chats", self._chats)
+        app.router.add_get(f"{base}/chats/{{phone}}", self._chat_metadata)
+
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def _falha(self, request, endpoint):
+        instance = request.match_info["instance"]
+        self.requests[endpoint] += 1
+        self.requests_by_instance[instance] += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+        finally:
+            self.in_flight -= 1
+
+        if instance in self.failing_instances or (self.error_rate and self._random.random() < self.error_rate):
+            self.responses[self.error_status] += 1
+            headers = {"Retry-After": str(self.retry_after)} if self.retry_after is not None else None
+            return web.json_response({"error": "Internal server error"}, status=self.error_status, headers=headers)
+        return None
+
+    def _ok(self, body):
+        self.responses[200] += 1
+        return web.json_response(body)
+
+    async def _send(self, request):
+        data = await request.json()
+        falha = await self._falha(request, request.path.rsplit("/", 1)[-1])
+        if falha is not None:
+            return falha
+
+        message_id = next(self._ids)
+        self.sent_messages.append(data)
+        return self._ok({"zaapId": f"zaap{message_id}", "messageId": f"msg{message_id}", "id": f"msg{message_id}"})
+
+    async def _read_message(self, request):
+        falha = await self._falha(request, "read-message")
+        return falha if falha is not None else self._ok({})
+
+    async def _chats(self, request):
+        falha = await self._falha(request, "chats")
+        return falha if falha is not None else self._ok([])
+
+    async def _chat_metadata(self, request):
+        falha = await self._falha(request, "chat-metadata")
+        if falha is not None:
+            return falha
+
+        phone = request.match_info["phone"]
+        return self._ok({
+            "phone": phone,
+            "unread": "0",
+            "lastMessageTime": "1700000000000",
+            "isMuted": "0",
+            "isMarkedSpam": "false",
+            "name": None,
+        })
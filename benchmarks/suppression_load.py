@@ -0,0 +1,63 @@
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+def medir_supressao(candidatos: int = 1_000_000, suprimidos: int = 200_000, seed: int = 0) -> dict:
+    """
+    Times SuppressionIndex on synthetic candidates, next to the pandas isin on strings it replaces.
+
+    Half of the suppressed values of each kind are taken from the candidates, so the filter
+    has hits to find.
+
+    :return: Dict with the timings, in seconds, and the number of suppressed candidates
+    """
+    from suppression import SuppressionIndex, OPT_OUT_PHONE, OPT_OUT_CPF, INVALID_PHONE, FREQUENCY_CAP
+    from utils import normalize_phones
+
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "cpf": pd.Series(rng.integers(10**9, 10**11, candidatos)).astype(str).str.zfill(11),
+        "telefone_contato": pd.Series(rng.integers(11_900_000_000, 11_999_999_999, candidatos)).astype(str),
+    })
+
+    def amostra(coluna):
+        return pd.concat([
+            df[coluna].sample(suprimidos // 2, random_state=rng),
+            pd.Series(rng.integers(10**9, 10**11, suprimidos - suprimidos // 2)).astype(str),
+        ], ignore_index=True)
+
+    with tempfile.TemporaryDirectory() as diretorio:
+        suppression = SuppressionIndex(diretorio)
+        for kind in [OPT_OUT_PHONE, INVALID_PHONE]:
+            suppression.add(kind, amostra("telefone_contato"))
+        for kind in [OPT_OUT_CPF, FREQUENCY_CAP]:
+            suppression.add(kind, amostra("cpf"))
+
+        inicio = time.perf_counter()
+        phones = normalize_phones(df["telefone_contato"]).to_numpy()
+        normalizar = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        suppression.contains(OPT_OUT_PHONE, phones)
+        busca = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        mascara, contagem = suppression.mask(df)
+        filtro = time.perf_counter() - inicio
+
+        # Como o filtro era feito antes: isin de strings contra strings
+        opt_outs = pd.Series(suppression.values(OPT_OUT_PHONE)).astype(str)
+        inicio = time.perf_counter()
+        df["telefone_contato"].isin(opt_outs)
+        isin_strings = time.perf_counter() - inicio
+
+    return {
+        "candidates": candidatos,
+        "suppressed_per_kind": suprimidos,
+        "normalize_phones_seconds": normalizar,
+        "contains_int64_seconds": busca,
+        "mask_all_kinds_seconds": filtro,
+        "isin_strings_one_kind_seconds": isin_strings,
+        "rows_suppressed": int(mascara.sum()),
+    } | {f"rows_{kind}": linhas for kind, linhas in contagem.items()}
@@ -0,0 +1,162 @@
+import os
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from sqlalchemy import create_engine
+from sqlalchemy.exc import DatabaseError
+
+# Dia fixo em que os dados sintéticos terminam, para que toda execução gere as mesmas tabelas.
+# Os saldos sobre eles são calculados nesse dia: SempreLeitura(data_referencia=DATA_REFERENCIA)
+DATA_REFERENCIA = pd.Timestamp("2025-03-07")
+
+def gerar_cpfs(n: int, rng: np.random.Generator) -> np.ndarray:
+    """Generates n distinct valid CPFs"""
+    cpfs = np.empty(0, dtype=object)
+    while len(cpfs) < n:
+        faltam = n - len(cpfs)
+        digitos = rng.integers(0, 10, (int(faltam * 1.1) + 10, 9))
+        primeiro = (digitos @ np.arange(10, 1, -1) * 10 % 11) % 10
+        digitos = np.c_[digitos, primeiro]
+        segundo = (digitos @ np.arange(11, 1, -1) * 10 % 11) % 10
+        digitos = np.c_[digitos, segundo]
+
+        novos = np.ascontiguousarray(digitos + ord("0"), dtype=np.uint8).view("S11").ravel().astype(str).astype(object)
+        cpfs = pd.unique(np.concatenate([cpfs, novos]))
+
+    return cpfs[:n]
+
+def gerar_tabelas(usuarios: int, movimentos_por_usuario: int = 10, lojas: int = 50, seed: int = 42) -> dict:
+    """
+    Generates sl_usuarios, sl_movimentacao_conta_corrente, sl_historico_resgate and ss_empresas.
+
+    Movement dates spread over the 450 days before DATA_REFERENCIA, so the balances on that day
+    have expired credits, credits about to expire and recent ones.
+    """
+    rng = np.random.default_rng(seed)
+    cpfs = gerar_cpfs(usuarios, rng)
+
+    cnpjs = np.array([f"{i:014d}" for i in range(1, lojas + 1)], dtype=object)
+    ss_empresas = pd.DataFrame({"cnpj": cnpjs, "descricao": [f"Livraria Leitura {i}" for i in range(1, lojas + 1)]})
+
+    telefone_fixo = rng.random(usuarios) < 0.2
+    sl_usuarios = pd.DataFrame({
+        "usuario": cpfs,
+        "nome_cliente": rng.choice(["MARIA SILVA", "JOÃO SOUZA", "ANA LIMA", "PEDRO COSTA", "JÚLIA ROCHA"], usuarios),
+        "email": [f"cliente{i}@exemplo.com" for i in range(usuarios)],
+        "ddd": rng.choice(["11", "21", "31", "61"], usuarios),
+        "telefone": np.where(telefone_fixo, "3" + pd.Series(rng.integers(0, 10**7, usuarios)).astype(str).str.zfill(7),
+                             "9" + pd.Series(rng.integers(0, 10**8, usuarios)).astype(str).str.zfill(8)),
+        "ddd2": rng.choice(["11", "21", None], usuarios),
+        "telefone2": "9" + pd.Series(rng.integers(0, 10**8, usuarios)).astype(str).str.zfill(8),
+    })
+
+    n = usuarios * movimentos_por_usuario
+    data_hora = DATA_REFERENCIA - pd.to_timedelta(rng.integers(0, 450, n), "D") + pd.to_timedelta(rng.integers(0, 86400, n), "s")
+    tipo = rng.choice(["C", "C", "C", "D", "R"], n)
+    sl_movimentacao_conta_corrente = pd.DataFrame({
+        "id": np.arange(1, n + 1),
+        "usuario": rng.choice(cpfs, n),
+        "data_hora": data_hora.strftime("%Y-%m-%d %H:%M:%S"),
+        "data_cupom": np.where(rng.random(n) < 0.3, None, data_hora.strftime("%Y-%m-%d")),
+        "valor": rng.integers(50, 3000, n).astype(float),
+        "tipo": tipo,
+        "origem": np.where(tipo == "C", rng.choice(["1", "1", "1", "3"], n), "2"),
+        "extra_info": rng.integers(0, 10**9, n).astype(str),
+        "cnpj_empresa": rng.choice(cnpjs, n),
+    })
+
+    # Parte dos créditos de compra tem resgates ligados a eles por (usuario, extra_info, cnpj)
+    creditos = sl_movimentacao_conta_corrente.query("tipo == 'C'")
+    resgatados = creditos.sample(frac=0.2, random_state=seed)
+    sl_historico_resgate = pd.DataFrame({
+        "usuario": resgatados["usuario"].to_numpy(),
+        "extra_info": resgatados["extra_info"].to_numpy(),
+        "cnpj_empresa_credito": resgatados["cnpj_empresa"].to_numpy(),
+        "valor_resgate": np.floor(resgatados["valor"].to_numpy() * rng.random(len(resgatados))),
+    })
+
+    return {
+        "ss_empresas": ss_empresas,
+        "sl_usuarios": sl_usuarios,
+        "sl_movimentacao_conta_corrente": sl_movimentacao_conta_corrente,
+        "sl_historico_resgate": sl_historico_resgate,
+    }
+
+def gerar_movimentos_saldo(linhas: int, usuarios: int, data_limite_expiracao: datetime, seed: int = 0) -> pd.DataFrame:
+    """
+    Movements in the format calculate_balance reads, with coupon dates around the expiration limits.
+
+    There are expired credits, credits about to expire (including the boundary days), recent
+    ones, credits redeemed in part, in full and beyond their value, and about 10% of users
+    with debits and redemptions only.
+
+    :param data_limite_expiracao: First coupon date that is not expired (SempreLeitura.datas_limite)
+    """
+    rng = np.random.default_rng(seed)
+    usuario = rng.integers(0, usuarios, linhas)
+    so_debitos = usuario % 10 == 0
+
+    tipo = np.where(so_debitos, rng.choice(["D", "R"], linhas), rng.choice(["C", "C", "C", "D", "R"], linhas))
+    valor = rng.integers(1, 3000, linhas).astype(float)
+
+    # Resgatado: nada, parte, tudo ou mais que o valor do crédito
+    caso = rng.choice(4, linhas, p=[0.55, 0.3, 0.1, 0.05])
+    valor_resgatado = np.select(
+        [caso == 1, caso == 2, caso == 3],
+        [np.floor(valor * rng.random(linhas)), valor, valor + rng.integers(1, 100, linhas)],
+        0.0
+    )
+
+    # Dias desde o limite de expiração: antes dele (expirado), nos 30 seguintes (a expirar) e depois
+    dias = np.concatenate([[-1, 0, 29, 30], rng.integers(-120, 400, max(linhas - 4, 0))])[:linhas]
+    data_cupom = pd.Timestamp(data_limite_expiracao).normalize() + pd.to_timedelta(dias, "D")
+
+    return pd.DataFrame({
+        "id": np.arange(1, linhas + 1),
+        "usuario": pd.Series(usuario).astype(str).str.zfill(11).to_numpy(),
+        "tipo": tipo,
+        "origem": np.where(tipo == "C", rng.choice(["1", "1", "1", "3"], linhas), "2"),
+        "valor": valor,
+        "valor_resgatado": valor_resgatado,
+        "data_cupom_mod": data_cupom.strftime("%Y-%m-%d"),
+    })
+
+def carregar_sqlite(path: str, usuarios: int, movimentos_por_usuario: int = 10, seed: int = 42, recriar: bool = False):
+    """
+    Generates the tables and loads them into a SQLite file. An existing file is reused only if it
+    was generated with the same parameters; otherwise it is generated again.
+
+    :return: SQLAlchemy engine for the database
+    """
+    parametros = {
+        "usuarios": usuarios, "movimentos_por_usuario": movimentos_por_usuario, "seed": seed,
+        "data_referencia": DATA_REFERENCIA.isoformat(),
+    }
+
+    engine = create_engine(f"sqlite:///{path}")
+    if os.path.exists(path) and not recriar and _parametros_sqlite(engine) == parametros:
+        return engine
+    engine.dispose()
+    if os.path.exists(path):
+        os.remove(path)
+
+    for tabela, df in gerar_tabelas(usuarios, movimentos_por_usuario, seed=seed).items():
+        df.to_sql(tabela, engine, index=False, chunksize=100_000)
+
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE INDEX idx_mov_usuario ON sl_movimentacao_conta_corrente (usuario)")
+        conn.exec_driver_sql("CREATE INDEX idx_mov_id ON sl_movimentacao_conta_corrente (id)")
+        conn.exec_driver_sql("CREATE INDEX idx_mov_data_hora ON sl_movimentacao_conta_corrente (data_hora)")
+        conn.exec_driver_sql("CREATE INDEX idx_usuarios ON sl_usuarios (usuario)")
+        conn.exec_driver_sql("CREATE INDEX idx_empresas ON ss_empresas (cnpj)")
+        conn.exec_driver_sql("CREATE INDEX idx_resgate ON sl_historico_resgate (usuario, extra_info, cnpj_empresa_credito)")
+    pd.DataFrame([parametros]).to_sql("parametros_sinteticos", engine, index=False)
+
+    return engine
+
+def _parametros_sqlite(engine):
+    # Arquivos gerados antes da tabela de parâmetros não têm como ser conferidos e são gerados de novo
+    try:
+        return pd.read_sql_query("SELECT * FROM parametros_sinteticos", engine).iloc[0].to_dict()
+    except (DatabaseError, IndexError):
+        return None
@@ -0,0 +1,99 @@
+import asyncio
+import os
+import random
+import tempfile
+import threading
+import time
+import aiohttp
+from aiohttp import web
+
+def _callbacks(n: int, seed: int = 0):
+    """Mix of Z-API callbacks: status updates, deliveries, replies and some "Sair" opt-outs"""
+    rng = random.Random(seed)
+    for i in range(n):
+        phone = f"55119{rng.randrange(10**8):08d}"
+        sorteio = rng.random()
+        if sorteio < 0.2:
+            yield {"type": "DeliveryCallback", "phone": phone, "zaapId": f"zaap{i}", "messageId": f"msg{i}", "instanceId": "load"}
+        elif sorteio < 0.9:
+            yield {
+                "type": "MessageStatusCallback", "phone": phone, "instanceId": "load",
+                "status": rng.choice(["SENT", "RECEIVED", "READ"]), "ids": [f"msg{rng.randrange(max(i, 1))}"],
+                "momment": int(time.time() * 1000),
+            }
+        else:
+            texto = "Sair" if sorteio > 0.99 else "Obrigado!"
+            yield {
+                "type": "ReceivedCallback", "phone": phone, "fromMe": False, "instanceId": "load",
+                "messageId": f"in{i}", "momment": int(time.time() * 1000), "text": {"message": texto},
+            }
+
+def carga_webhooks(callbacks: int = 20_000, concurrency: int = 100):
+    """
+    Posts callbacks to a WebhookReceiver running in a background thread and measures how fast
+    they are acknowledged and written.
+
+    :return: Dict with the rates and the counts found in the store
+    """
+    from webhooks import WebhookReceiver, WebhookStore
+
+    with tempfile.TemporaryDirectory() as diretorio:
+        store = WebhookStore(os.path.join(diretorio, "send_queue.db"))
+        receiver = WebhookReceiver(store)
+        pronto = threading.Event()
+        estado = {}
+
+        def servidor():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            runner = web.AppRunner(receiver.app(), access_log=None)
+            loop.run_until_complete(runner.setup())
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            loop.run_until_complete(site.start())
+            estado["port"] = site._server.sockets[0].getsockname()[1]
+            estado["loop"], estado["runner"] = loop, runner
+            pronto.set()
+            loop.run_forever()
+
+        thread = threading.Thread(target=servidor, daemon=True)
+        thread.start()
+        pronto.wait()
+        url = f"http://127.0.0.1:{estado['port']}/webhooks/zapi"
+        payloads = list(_callbacks(callbacks))
+
+        async def enviar():
+            fila = iter(payloads)
+            async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency)) as session:
+                async def trabalhador():
+                    for payload in fila:
+                        async with session.post(url, json=payload) as response:
+                            response.raise_for_status()
+                await asyncio.gather(*(trabalhador() for _ in range(concurrency)))
+
+        inicio = time.perf_counter()
+        asyncio.run(enviar())
+        confirmados = time.perf_counter() - inicio
+
+        eventos = sum(max(len(p.get("ids", [])), 1) for p in payloads if not p.get("fromMe"))
+        while receiver.written < eventos and time.perf_counter() - inicio < 120:
+            time.sleep(0.05)
+        gravados = time.perf_counter() - inicio
+
+        asyncio.run_coroutine_threadsafe(estado["runner"].cleanup(), estado["loop"]).result()
+        estado["loop"].call_soon_threadsafe(estado["loop"].stop)
+        thread.join()
+
+        esperados_opt_out = len({p["phone"] for p in payloads if p["type"] == "ReceivedCallback" and p["text"]["message"] == "Sair"})
+        resultado = {
+            "callbacks": callbacks,
+            "concurrency": concurrency,
+            "acknowledged_per_second": callbacks / confirmados,
+            "written_per_second": callbacks / gravados,
+            "events_written": store.conn.execute("SELECT COUNT(*) FROM webhook_events").fetchone()[0],
+            "events_expected": eventos,
+            "messages_with_status": store.conn.execute("SELECT COUNT(*) FROM message_status").fetchone()[0],
+            "opt_outs": len(store.opt_outs()),
+            "opt_outs_expected": esperados_opt_out,
+        }
+        store.conn.close()
+        return resultado
@@ -0,0 +1,169 @@
+import os
+import logging
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from artifacts import CAMPAIGN_SCHEMA
+from utils import (
+    SempreLeitura, get_engine, dispose_engines,
+    select_phone_numbers, validar_cpfs, primeiros_nomes, TemplateMensagemLote
+)
+
+def preparar_mensagens_pontos_a_expirar(saldos: pd.DataFrame, candidatos: pd.DataFrame) -> pd.DataFrame:
+    """
+    Filters the users with points about to expire and renders their message.
+
+    :param saldos: Balances, as returned by SempreLeitura.calculate_balances
+    :param candidatos: One row per user with usuario, nome_cliente, ddd, telefone, ddd2 and telefone2
+    :return: Pandas DataFrame with one row per message to send
+    """
+    pontos_clientes = (
+        saldos
+            .merge(
+                candidatos,
+                on="usuario",
+                how="left"
+            )
+            .rename(columns={
+                "Créditos a Expirar": "creditos_a_expirar",
+            })
+            .query("creditos_a_expirar > 1000")
+            .query("Saldo > 2000")
+            .sort_values("Saldo", ascending=False)
+            .assign(
+                telefone_principal = lambda x: x["ddd"].astype(str) + x["telefone"].astype(str),
+                telefone_secundario = lambda x: x["ddd2"].astype(str) + x["telefone2"].astype(str)
+            )
+            .assign(
+                telefone_contato = lambda x: select_phone_numbers(x["telefone_principal"], x["telefone_secundario"]),
+                data_min_a_expirar = lambda x: x["datas_a_expirar"].apply(
+                    lambda x: min(x) if isinstance(x, list) and len(x) > 0 else pd.NA
+                ),
+                data_max_a_expirar = lambda df: df["datas_a_expirar"].apply(
+                    lambda x: max(x) if isinstance(x, list) and len(x) > 1 else pd.NA
+                )
+            )
+            .reset_index(drop=True)
+    )
+
+    mensagens = pontos_clientes.query("telefone_contato.notnull()")
+
+    cpfs_validos, _ = validar_cpfs(mensagens["usuario"])
+
+    mensagens = (
+        mensagens[cpfs_validos]
+            .assign(
+                cpf = lambda x: x["usuario"].astype(str),
+                dinheiro = lambda x: np.floor(x["Saldo"] / 100),
+                primeiro_nome = lambda x: primeiros_nomes(x["nome_cliente"]),
+                telefone_contato = lambda x: x["telefone_contato"].astype(str)
+            )
+            .reset_index(drop=True)
+    )
+
+    mensagens["mensagem"] = TemplateMensagemLote(mensagens).pontos_a_expirar(
+        "data_min_a_expirar", "data_max_a_expirar",
+        "creditos_a_expirar", "Saldo"
+    ).str.strip().to_list()
+
+    return mensagens
+
+# Colunas da campanha que o build_campaign não devolve: as listas de datas ficam no worker
+# e os filtros do período são acrescentados depois
+COLUNAS_FORA_DO_SHARD = ["datas_a_expirar", "filtro_pontuacao_data_inicio", "filtro_pontuacao_data_fim"]
+
+# Cada processo do pool tem o seu próprio engine, criado uma vez na inicialização
+_sempreleitura = None
+
+def _init_worker(engine_url, data_referencia):
+    global _sempreleitura
+    # O fork copia o pool de conexões do processo pai; usar o mesmo socket nos dois lados corrompe a conexão
+    dispose_engines(close=False)
+    _sempreleitura = SempreLeitura(engine=get_engine(engine_url) if engine_url else None, data_referencia=data_referencia)
+
+def _processar_shard(candidatos_ipc: bytes) -> bytes:
+    candidatos = _ler_ipc(candidatos_ipc)
+
+    movimentos = _sempreleitura.getMovimentosContaCorrenteBulk(candidatos["usuario"].tolist())
+    saldos = _sempreleitura.calculate_balances(movimentos)
+    mensagens = preparar_mensagens_pontos_a_expirar(saldos, candidatos)
+
+    # As listas de datas não são necessárias depois da renderização
+    return _escrever_ipc(mensagens.drop(columns=["datas_a_expirar"]))
+
+def _escrever_ipc(df: pd.DataFrame) -> bytes:
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+def _ler_tabela_ipc(buffer: bytes) -> pa.Table:
+    return pa.ipc.open_stream(buffer).read_all()
+
+def _ler_ipc(buffer: bytes) -> pd.DataFrame:
+    return _ler_tabela_ipc(buffer).to_pandas()
+
+def _executar(shards, indices, workers, initargs, resultados, erros):
+    """
+    Runs the shards of indices in a new pool, filling resultados and erros.
+
+    :return: Indices of the shards lost because a worker process died
+    """
+    perdidos = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as executor:
+        futures = {executor.submit(_processar_shard, shards[i]): i for i in indices}
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                resultados[i] = _ler_tabela_ipc(future.result())
+            except BrokenProcessPool:
+                perdidos.append(i)
+            except Exception as e:
+                logging.error(f"Error processing shard {i}: {e}")
+                erros[i] = str(e)
+    return sorted(perdidos)
+
+def build_campaign(candidatos: pd.DataFrame, workers: int = None, shard_size: int = 5000, engine_url: str = None,
+                   data_referencia=None):
+    """
+    Runs fetch -> calculate_balances -> filter -> render for the candidates, sharded across processes.
+
+    Shards travel to and from the workers as Arrow IPC streams. A shard that fails is logged
+    and reported, and the other shards are still returned. A worker that dies (e.g. killed for
+    memory) breaks every shard running in the pool, so those are run again one at a time and
+    only the shard that kills its worker is reported.
+
+    :param candidatos: One row per user with usuario and the contact columns
+    :param workers: Number of processes (defaults to the number of cores)
+    :param shard_size: Users per shard
+    :param engine_url: Database URL used by the workers (defaults to the DB_* environment variables)
+    :param data_referencia: Day the balances are computed for (defaults to today)
+    :return: Tuple with the messages DataFrame and a dict {shard index: error message}
+    """
+    workers = workers if workers else os.cpu_count()
+    shards = [
+        _escrever_ipc(candidatos.iloc[i:i + shard_size])
+        for i in range(0, len(candidatos), shard_size)
+    ]
+
+    resultados, erros = {}, {}
+    initargs = (engine_url, data_referencia)
+    for i in _executar(shards, range(len(shards)), workers, initargs, resultados, erros):
+        if _executar(shards, [i], 1, initargs, resultados, erros):
+            logging.error(f"Error processing shard {i}: the worker process died")
+            erros[i] = "The worker process died"
+
+    # Shards sem nenhum usuário a avisar voltam vazios; a concatenação é feita no Arrow, que
+    # promove as colunas só de nulos de um shard (ex.: data_max_a_expirar) para o tipo das outras
+    resultados = [resultados[i] for i in sorted(resultados) if resultados[i].num_rows]
+    if not resultados:
+        return CAMPAIGN_SCHEMA.empty_table().drop_columns(COLUNAS_FORA_DO_SHARD).to_pandas(), erros
+
+    mensagens = pa.concat_tables(resultados, promote_options="permissive").to_pandas()\
+        .sort_values("Saldo", ascending=False)\
+        .reset_index(drop=True)
+
+    return mensagens, erros
@@ -0,0 +1,98 @@
+import pandas as pd
+from utils import SQLServer, SempreLeitura, queries
+
+COLUNAS_CONTATO = ["nome_cliente", "ddd", "telefone", "ddd2", "telefone2"]
+
+# Tipos do SQL Server em que data_hora é guardada como texto
+TIPOS_TEXTO = {"char", "varchar", "nchar", "nvarchar", "text", "ntext"}
+
+_SQL_CANDIDATOS = f"""
+WITH pontos AS (
+    SELECT mov.usuario, SUM(mov.valor) AS pontos_acumulados_periodo
+    FROM sl_movimentacao_conta_corrente mov {{nolock}}
+    WHERE mov.tipo = :tipo
+        AND mov.data_hora >= {{data_inicio}}
+        AND mov.data_hora < {{data_fim}}
+    GROUP BY mov.usuario
+    HAVING SUM(mov.valor) > :min_pontos
+)
+SELECT pontos.usuario, pontos.pontos_acumulados_periodo, {", ".join(f"usr.{coluna}" for coluna in COLUNAS_CONTATO)}
+FROM pontos
+LEFT JOIN sl_usuarios usr {{nolock}}
+ON usr.usuario = pontos.usuario
+ORDER BY pontos.pontos_acumulados_periodo DESC
+"""
+
+# A data fica na coluna crua, então o servidor faz um seek no intervalo de data_hora;
+# a soma por usuário e o corte de pontos rodam no servidor e só os usuários que passam voltam.
+# O parâmetro precisa ter o tipo da coluna: comparar uma data_hora varchar com CONVERT(DATETIME, ...)
+# converte a coluna em todas as linhas, então nesse caso a string vai como texto, no mesmo formato (120)
+queries.register("candidatos_pontuacao", _SQL_CANDIDATOS.format(
+    nolock="{nolock}", data_inicio="{param_data_inicio}", data_fim="{param_data_fim}"
+))
+queries.register("candidatos_pontuacao_data_texto", _SQL_CANDIDATOS.format(
+    nolock="{nolock}", data_inicio="{param_data_inicio_texto}", data_fim="{param_data_fim_texto}"
+))
+
+queries.register("tipo_data_hora", """
+SELECT DATA_TYPE AS tipo
+FROM INFORMATION_SCHEMA.COLUMNS
+WHERE TABLE_NAME = 'sl_movimentacao_conta_corrente' AND COLUMN_NAME = 'data_hora'
+""")
+
+_tipos_data_hora = {}
+
+def _data_hora_texto(sqlserver_db: SQLServer) -> bool:
+    """
+    Whether sl_movimentacao_conta_corrente.data_hora is a text column, checked once per database.
+    Only SQL Server converts the parameter; the other dialects already bind the string as is.
+    """
+    if sqlserver_db.engine.dialect.name != "mssql":
+        return False
+
+    chave = str(sqlserver_db.engine.url)
+    if chave not in _tipos_data_hora:
+        tipo = sqlserver_db.pandas_read_sql("tipo_data_hora")["tipo"]
+        _tipos_data_hora[chave] = not tipo.empty and tipo.iloc[0].lower() in TIPOS_TEXTO
+    return _tipos_data_hora[chave]
+
+def select_candidates(sqlserver_db: SQLServer, data_inicio, data_fim, min_pontos: float = 500,
+                      tipo: str = SempreLeitura.TIPO_MOVIMENTO_CREDITO) -> pd.DataFrame:
+    """
+    Users with more than min_pontos points of the movement type between data_inicio (inclusive)
+    and data_fim (exclusive), with their contact fields, sorted by points.
+
+    Only the qualifying users leave the database, one row each, instead of every movement of the period.
+    The dates are bound as "YYYY-MM-DD HH:MM:SS" strings, converted on the server only when data_hora
+    is a datetime column.
+    """
+    df = sqlserver_db.pandas_read_sql(
+        "candidatos_pontuacao_data_texto" if _data_hora_texto(sqlserver_db) else "candidatos_pontuacao",
+        params={
+            "tipo": tipo,
+            "data_inicio": pd.Timestamp(data_inicio).strftime("%Y-%m-%d %H:%M:%S"),
+            "data_fim": pd.Timestamp(data_fim).strftime("%Y-%m-%d %H:%M:%S"),
+            "min_pontos": min_pontos,
+        }
+    )
+    return df.assign(
+        usuario=df["usuario"].astype(str),
+        pontos_acumulados_periodo=df["pontos_acumulados_periodo"].astype("float64"),
+    )
+
+def covering_index_ddl(schema: str = "dbo") -> str:
+    """
+    SQL Server indexes that cover candidatos_pontuacao, for the DBA to review and create.
+
+    Movements are sought by (tipo, data_hora) and carry usuario and valor, so the aggregation
+    never touches the base table; users are looked up by usuario with the contact fields included.
+    """
+    return f"""
+CREATE NONCLUSTERED INDEX IX_sl_movimentacao_conta_corrente_tipo_data_hora
+ON {schema}.sl_movimentacao_conta_corrente (tipo, data_hora)
+INCLUDE (usuario, valor);
+
+CREATE NONCLUSTERED INDEX IX_sl_usuarios_usuario_contato
+ON {schema}.sl_usuarios (usuario)
+INCLUDE ({", ".join(COLUNAS_CONTATO)});
+""".strip()
@@ -0,0 +1,246 @@
+import argparse
+import logging
+import os
+import sys
+from datetime import datetime
+import dotenv
+
+# Cada subcomando importa o que usa dentro da própria função: pandas, pyarrow, SQLAlchemy e babel
+# custam quase um segundo para carregar, e o send (chamado pelo cron) não precisa de nenhum deles
+# quando a janela está fechada ou a fila está vazia. python -m benchmarks startup mede o tempo de início
+
+def _zapi_client():
+    """ZAPIPool over ZAPI_INSTANCES when it is set, otherwise the ZAPIClient of ZAPI_INSTANCE_ID"""
+    if os.getenv("ZAPI_INSTANCES"):
+        from zapi_pool import ZAPIPool
+        return ZAPIPool.from_env()
+
+    from zapi_client import ZAPIClient
+    return ZAPIClient()
+
+def _exportar_metricas(nome_projeto, today_ts):
+    from metrics import metrics
+
+    if metrics.enabled:
+        metrics.export_json(f"data/metrics/{nome_projeto}_{today_ts}.json")
+        metrics.export_prometheus("data/metrics/whatsapp_interactor.prom")
+
+def _registrar_enviadas(send_queue, ledger, nome_projeto=None):
+    """Copies the sent messages of the queue to the ledger; the ones already there are skipped"""
+    from send_queue import STATUS_SENT
+
+    enviadas = send_queue.to_dataframe(nome_projeto, STATUS_SENT)\
+        .rename(columns={"cpf": "usuario", "updated_at": "data_envio"})
+    return ledger.append(enviadas)
+
+def build(args):
+    """Selects the users with points about to expire, renders their messages and enqueues them"""
+    import pandas as pd
+    from utils import SQLServer, SempreLeitura
+    from candidates import select_candidates
+    from campaign_builder import preparar_mensagens_pontos_a_expirar, build_campaign
+    from send_queue import SendQueue
+    from scheduler import campaign_priority
+    from ledger import SentMessageLedger
+    from snapshots import BalanceSnapshot
+    from table_cache import LoyaltyTableCache
+    from artifacts import write_campaign, read_campaign, export_excel
+    from webhooks import WebhookStore
+    from suppression import SuppressionIndex
+
+    data_inicio_pontuacao = pd.Timestamp.now() - pd.DateOffset(months=12) + pd.DateOffset(days=10)
+    data_fim_pontuacao = data_inicio_pontuacao + pd.DateOffset(days=args.period_days)
+
+    sqlserver_db = SQLServer()
+    table_cache = LoyaltyTableCache(sqlserver_db.engine)
+    table_cache.sync(max_age_minutes=args.cache_max_age)
+
+    pontos_acumulados = select_candidates(
+        sqlserver_db, data_inicio_pontuacao.normalize(), data_fim_pontuacao.normalize(), min_pontos=args.min_points
+    )
+
+    if args.workers:
+        mensagens, shards_com_erro = build_campaign(pontos_acumulados, workers=args.workers)
+        if shards_com_erro:
+            raise RuntimeError(f"build_campaign failed on {len(shards_com_erro)} shards: {shards_com_erro}")
+    else:
+        snapshot = BalanceSnapshot(SempreLeitura(cache=table_cache))
+        snapshot.update()
+        saldos = snapshot.saldos(pontos_acumulados["usuario"].to_list())
+        mensagens = preparar_mensagens_pontos_a_expirar(saldos, pontos_acumulados)
+
+    sempreleitura = mensagens\
+        .assign(
+            filtro_pontuacao_data_inicio=data_inicio_pontuacao,
+            filtro_pontuacao_data_fim=data_fim_pontuacao
+        )
+
+    # Envios de uma execução do send que parou antes de chegar ao ledger entram antes do filtro;
+    # na primeira execução o ledger também importa os arquivos antigos de data/messages_sent/
+    send_queue = SendQueue(args.queue)
+    send_queue.recover()
+    ledger = SentMessageLedger()
+    _registrar_enviadas(send_queue, ledger)
+
+    sempreleitura = ledger.filter_unsent(sempreleitura, args.project).reset_index(drop=True)
+
+    suppression = SuppressionIndex()
+    suppression.sync_opt_outs(WebhookStore(args.queue))
+    suppression.sync_frequency_caps(ledger, max_messages=args.max_messages_per_user, days=args.frequency_days)
+    sempreleitura, suprimidos = suppression.filter(sempreleitura)
+    print(f"Suppressed: {suprimidos}")
+
+    today_ts = pd.Timestamp.now().strftime('%Y-%m-%d %H-%M-%S')
+    campaign_path = write_campaign(sempreleitura, f"data/campaigns/{args.project}_{today_ts}.arrow", args.project)
+    if args.excel:
+        export_excel(sempreleitura, f"sempre_leitura_com_mensagem_{today_ts}.xlsx")
+
+    campanha = read_campaign(campaign_path)
+    enfileiradas = send_queue.enqueue(
+        campanha.assign(priority=campaign_priority(campanha, "data_min_a_expirar")), args.project,
+        priority_column="priority"
+    )
+    print(f"Campaign {campaign_path}: {len(campanha)} messages, {enfileiradas} newly queued")
+
+    _exportar_metricas(args.project, today_ts)
+
+def send(args):
+    """Sends the queued messages inside the sending window and records them in the ledger"""
+    from send_queue import SendQueue
+    from scheduler import SendScheduler, SendingWindows
+
+    send_queue = SendQueue(args.queue)
+    windows = SendingWindows()
+
+    agora = datetime.now()
+    inicio, fim = windows.next_open(agora)
+    if inicio > agora and not args.wait:
+        print(f"Sending window closed until {inicio}")
+        return
+    if not send_queue.pending_count(args.project):
+        print("No pending messages")
+        return
+
+    zapi_client = _zapi_client()
+    scheduler = SendScheduler(send_queue, zapi_client, windows=windows, delay_message=args.delay_message)
+    print(f"Projected completion: {scheduler.projected_completion(args.project)}")
+
+    # Sem --wait para na janela atual; o próximo disparo do cron continua de onde parou
+    enviadas = scheduler.run(args.project, until=None if args.wait else fim, max_messages=args.max_messages)
+    print(f"Sent {enviadas} messages: {send_queue.status_counts(args.project)}")
+
+    if enviadas:
+        from ledger import SentMessageLedger
+
+        today_ts = datetime.now().strftime('%Y-%m-%d %H-%M-%S')
+        print(scheduler.stats().to_string())
+        zapi_client.outcomes_dataframe().to_csv(f"data/send_outcomes_{args.project or 'all'}_{today_ts}.csv", index=False)
+        _registrar_enviadas(send_queue, SentMessageLedger(), args.project)
+        _exportar_metricas(args.project or "all", today_ts)
+
+def enrich(args):
+    """Adds the chat metadata of each phone in the ledger and suppresses the phones not found"""
+    from ledger import SentMessageLedger
+    from enrichment import enrich_chat_metadata, MetadataCache
+    from suppression import SuppressionIndex
+
+    messages_sent = SentMessageLedger().read(nome_projeto=args.project)
+    if messages_sent.empty:
+        print("No sent messages")
+        return
+
+    # O transporte do cliente já repete as requisições, então sem retries por cima
+    messages_sent = enrich_chat_metadata(messages_sent, _zapi_client(), cache=MetadataCache(), max_retries=0)
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    messages_sent.to_parquet(args.output, index=False)
+    SuppressionIndex().sync_invalid_phones(messages_sent)
+    print(f"Metadata of {len(messages_sent)} sends written to {args.output}")
+
+def report(args):
+    """Delivery status per project and, given a redemption report, the conversions of each campaign"""
+    import pandas as pd
+    from ledger import SentMessageLedger
+    from webhooks import WebhookStore
+    from artifacts import read_report
+    from attribution import attribute_conversions
+
+    message_status = WebhookStore(args.queue).message_status()
+    print(message_status.groupby(["nome_projeto", "status"], dropna=False).size().to_string())
+
+    if not args.redemptions:
+        return
+
+    resgates = read_report(args.redemptions, dtype={"Cliente": str}, decimal=",", thousands=".")
+    resgates = resgates[["Cliente", "Data/Hora", "Pontos", "Loja"]].rename(columns={"Data/Hora": "Data Resgate"})
+    resgates["Data Resgate"] = pd.to_datetime(resgates["Data Resgate"], dayfirst=True)
+
+    # A atribuição lê os arquivos do ledger direto, então os envios antigos são importados antes
+    ledger = SentMessageLedger()
+    ledger.import_legacy()
+    conversoes = attribute_conversions(
+        ledger.path, resgates, window_days=args.window_days,
+        redemption_cpf="Cliente", redemption_time="Data Resgate", store_column="Loja", value_column="Pontos"
+    )
+    if args.project:
+        conversoes = conversoes[conversoes["nome_projeto"] == args.project]
+
+    print(
+        conversoes
+            .groupby("nome_projeto")[["envios", "conversoes", "pontos_resgatados"]]
+            .sum()
+            .assign(taxa_conversao=lambda x: x["conversoes"] / x["envios"])
+            .to_string()
+    )
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        conversoes.to_csv(args.output, index=False)
+        print(f"Conversions per store written to {args.output}")
+
+def _parser():
+    parser = argparse.ArgumentParser(prog="cli.py", description="Sempre Leitura WhatsApp campaigns")
+    parser.add_argument("--queue", default="data/send_queue.db", help="SQLite file of the send queue and webhooks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parser_build = subparsers.add_parser("build", help=build.__doc__)
+    parser_build.add_argument("--project", default="aviso_pontos_a_expirar")
+    parser_build.add_argument("--min-points", type=float, default=500, help="Points earned in the period to be a candidate")
+    parser_build.add_argument("--period-days", type=int, default=20, help="Days of the period whose points expire")
+    parser_build.add_argument("--max-messages-per-user", type=int, default=2, help="Frequency cap across projects")
+    parser_build.add_argument("--frequency-days", type=int, default=30, help="Days counted by the frequency cap")
+    parser_build.add_argument("--cache-max-age", type=float, default=60, help="Minutes before the table cache is synced again")
+    parser_build.add_argument("--workers", type=int, default=None,
+                              help="Recomputes every balance from the database with this many processes instead of updating the snapshot")
+    parser_build.add_argument("--excel", action="store_true", help="Also writes an Excel copy of the campaign for review")
+    parser_build.set_defaults(func=build)
+
+    parser_send = subparsers.add_parser("send", help=send.__doc__)
+    parser_send.add_argument("--project", default=None, help="Only this project (all of them by default)")
+    parser_send.add_argument("--wait", action="store_true", help="Waits for the next windows instead of stopping when the current one closes")
+    parser_send.add_argument("--max-messages", type=int, default=None)
+    parser_send.add_argument("--delay-message", type=int, default=1, help="delayMessage sent to Z-API")
+    parser_send.set_defaults(func=send)
+
+    parser_enrich = subparsers.add_parser("enrich", help=enrich.__doc__)
+    parser_enrich.add_argument("--project", default=None, help="Only this project (all of them by default)")
+    parser_enrich.add_argument("--output", default="data/messages_sent_with_metadata.parquet")
+    parser_enrich.set_defaults(func=enrich)
+
+    parser_report = subparsers.add_parser("report", help=report.__doc__)
+    parser_report.add_argument("--project", default=None, help="Only this project (all of them by default)")
+    parser_report.add_argument("--redemptions", default=None, help="Redemption report (.xls) exported from Sempre Leitura")
+    parser_report.add_argument("--window-days", type=float, default=7, help="Days after a send in which a redemption counts")
+    parser_report.add_argument("--output", default=None, help="CSV for the conversions per project and store")
+    parser_report.set_defaults(func=report)
+
+    return parser
+
+def main(argv=None):
+    args = _parser().parse_args(argv)
+    dotenv.load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
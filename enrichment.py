@@ -0,0 +1,120 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from tqdm import tqdm
+
+from zapi_transport import RETRY_STATUS
+
+class MetadataCache:
+    def __init__(self, path: str = "data/chat_metadata_cache.db", ttl_hours: float = 24):
+        self.path = path
+        self.ttl_seconds = ttl_hours * 3600
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+        CREATE TABLE IF NOT EXISTS chat_metadata (
+            phone TEXT PRIMARY KEY,
+            metadata TEXT NOT NULL,
+            fetched_at REAL NOT NULL
+        )
+        """)
+
+    def get_many(self, phones):
+        """Returns {phone: metadata} for the phones cached within the TTL"""
+        limite = time.time() - self.ttl_seconds
+        phones = list(phones)
+        found = {}
+        with self._lock:
+            # SQLite aceita no máximo 999 parâmetros por query nas versões antigas
+            for i in range(0, len(phones), 900):
+                chunk = phones[i:i + 900]
+                rows = self._conn.execute(
+                    f"SELECT phone, metadata FROM chat_metadata WHERE fetched_at >= ? AND phone IN ({','.join('?' * len(chunk))})",
+                    [limite] + chunk
+                ).fetchall()
+                found.update({phone: json.loads(metadata) for phone, metadata in rows})
+        return found
+
+    def set_many(self, results):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chat_metadata (phone, metadata, fetched_at) VALUES (?, ?, ?)",
+                [(phone, json.dumps(metadata), now) for phone, metadata in results.items()]
+            )
+
+def fetch_chat_metadata(zapi_client, phone, max_retries: int = 5, backoff: float = 1.0):
+    """
+    Calls get_chat_metadata, retrying 429 and 5xx responses with exponential backoff.
+
+    Other error responses are returned like a success: their body says why (for example, a phone
+    not on WhatsApp). Raises only on transport errors and when the retries run out.
+    """
+    for attempt in range(max_retries + 1):
+        response = zapi_client.get_chat_metadata(phone)
+        if response.status_code not in RETRY_STATUS or attempt == max_retries:
+            break
+
+        espera = backoff * 2 ** attempt
+        retry_after = response.headers.get("Retry-After")
+        if response.status_code == 429 and retry_after and retry_after.isdigit():
+            espera = max(espera, float(retry_after))
+        time.sleep(espera)
+
+    if response.status_code in RETRY_STATUS:
+        response.raise_for_status()
+    try:
+        return response.json()
+    except ValueError:
+        # Resposta de erro sem corpo JSON: não há motivo para guardar
+        response.raise_for_status()
+        raise
+
+def enrich_chat_metadata(
+    messages_sent: pd.DataFrame, zapi_client, phone_column: str = "telefone_contato",
+    max_workers: int = 8, cache: MetadataCache = None, max_retries: int = 5, backoff: float = 1.0
+) -> pd.DataFrame:
+    """
+    Adds the chat metadata of each phone to messages_sent.
+
+    Each distinct phone is requested once, concurrently, and phones found in the cache are
+    not requested again. Phones whose request fails are left without metadata.
+    """
+    phones = messages_sent[phone_column].dropna().astype(str).unique().tolist()
+
+    metadata = cache.get_many(phones) if cache is not None else {}
+    pendentes = [phone for phone in phones if phone not in metadata]
+
+    fetched = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(fetch_chat_metadata, zapi_client, phone, max_retries, backoff): phone
+            for phone in pendentes
+        }
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            phone = futures[future]
+            try:
+                fetched[phone] = future.result()
+            except Exception as e:
+                logging.error(f"Error while getting the metadata of {phone}: {e}")
+
+    if cache is not None and fetched:
+        cache.set_many(fetched)
+    metadata.update(fetched)
+
+    if not metadata:
+        return messages_sent.copy()
+
+    metadata_df = pd.DataFrame([
+        {key: value for key, value in result.items() if key != phone_column} | {phone_column: phone}
+        for phone, result in metadata.items()
+    ])
+
+    return messages_sent\
+        .assign(**{phone_column: messages_sent[phone_column].astype(str)})\
+        .merge(metadata_df, on=phone_column, how="left")
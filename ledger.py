@@ -0,0 +1,172 @@
+import os
+import re
+import uuid
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from utils import cpfs_to_int
+
+class SentMessageLedger:
+    """
+    History of sent messages stored as a Parquet dataset partitioned by nome_projeto and month.
+
+    New sends are written as new files inside their partition, so old partitions are never
+    rewritten. Lookups read only the CPF column of the requested project.
+
+    The loose parquet files of legacy_folder, written before the ledger existed, are imported
+    the first time an empty ledger is read, looked up or appended to.
+    """
+    PARTITION_COLUMNS = ["nome_projeto", "mes"]
+
+    def __init__(self, path: str = "data/messages_sent_ledger/", cpf_column: str = "usuario", date_column: str = "data_envio",
+                 legacy_folder: str = "data/messages_sent/"):
+        self.path = path
+        self.cpf_column = cpf_column
+        self.date_column = date_column
+        self.legacy_folder = legacy_folder
+        self._sent_cpfs = {}
+        self._legado_verificado = False
+
+    def _dataset(self):
+        return ds.dataset(self.path, format="parquet", partitioning="hive")
+
+    def _exists(self):
+        return os.path.isdir(self.path) and any(
+            name.endswith(".parquet") for _, _, files in os.walk(self.path) for name in files
+        )
+
+    def append(self, df: pd.DataFrame, nome_projeto: str = None, skip_existing: bool = True):
+        """
+        Appends sends to the ledger.
+
+        :param df: Sent messages; must have the CPF column and nome_projeto (or pass nome_projeto).
+            Without date_column the sends are recorded as sent now
+        :param nome_projeto: Project of all rows in df, if df has no nome_projeto column
+        :param skip_existing: Ignores CPFs already recorded for the same project
+        :return: Number of rows written
+        """
+        self.import_legacy()
+        df = df.copy()
+        if nome_projeto is not None:
+            df["nome_projeto"] = nome_projeto
+        if "nome_projeto" not in df.columns:
+            raise ValueError("The sends must have a nome_projeto")
+
+        df[self.cpf_column] = df[self.cpf_column].astype(str)
+        if self.date_column not in df.columns:
+            df[self.date_column] = pd.Timestamp.now()
+        df[self.date_column] = pd.to_datetime(df[self.date_column])
+        df["mes"] = df[self.date_column].dt.strftime("%Y-%m")
+
+        if skip_existing:
+            df = pd.concat([
+                group[~cpfs_to_int(group[self.cpf_column]).isin(self.sent_cpfs(projeto))]
+                for projeto, group in df.groupby("nome_projeto")
+            ]) if not df.empty else df
+
+        if df.empty:
+            return 0
+
+        pq.write_to_dataset(
+            pa.Table.from_pandas(df, preserve_index=False),
+            root_path=self.path,
+            partition_cols=self.PARTITION_COLUMNS,
+            basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet"
+        )
+
+        for projeto, group in df.groupby("nome_projeto"):
+            if projeto in self._sent_cpfs:
+                self._sent_cpfs[projeto] = self._sent_cpfs[projeto].append(pd.Index(cpfs_to_int(group[self.cpf_column]).unique()))
+
+        return len(df)
+
+    def import_folder(self, folder: str = "data/messages_sent/"):
+        """
+        Imports the loose parquet files written before the ledger existed; the sends already in the
+        ledger are skipped, so importing the same folder twice is safe.
+
+        :return: Number of rows written
+        """
+        parquet_files = sorted(f for f in os.listdir(folder) if f.endswith(".parquet"))
+        return sum(self.append(self._ler_legado(os.path.join(folder, file))) for file in parquet_files)
+
+    def _ler_legado(self, path: str) -> pd.DataFrame:
+        """
+        Reads a legacy file; sends without date_column get the date of the file, from its name
+        (YYYY-MM-DD, optionally followed by HH-MM-SS) or else its modification time.
+        """
+        df = pd.read_parquet(path)
+        if self.date_column in df.columns and df[self.date_column].notna().all():
+            return df
+
+        # Sem a data os envios antigos ficariam com a data da importação, o que distorce o limite
+        # de frequência e a atribuição
+        nome = re.search(r"(\d{4}-\d{2}-\d{2})(?:[ _T](\d{2})-(\d{2})-(\d{2}))?", os.path.basename(path))
+        if nome:
+            data = pd.Timestamp(nome.group(1) + (" " + ":".join(nome.groups()[1:]) if nome.group(2) else ""))
+        else:
+            data = pd.Timestamp.fromtimestamp(os.path.getmtime(path))
+
+        if self.date_column not in df.columns:
+            return df.assign(**{self.date_column: data})
+        return df.assign(**{self.date_column: pd.to_datetime(df[self.date_column]).fillna(data)})
+
+    def import_legacy(self) -> int:
+        """
+        Imports legacy_folder if the ledger is still empty; checked once per instance.
+
+        :return: Number of rows imported
+        """
+        if self._legado_verificado:
+            return 0
+        # Marcado antes de importar, pois import_folder passa de novo por aqui via append
+        self._legado_verificado = True
+        if not self.legacy_folder or not os.path.isdir(self.legacy_folder) or self._exists():
+            return 0
+        return self.import_folder(self.legacy_folder)
+
+    def sent_cpfs(self, nome_projeto: str) -> pd.Index:
+        """CPFs (as int64) that already received a message of the project, kept in memory after the first read"""
+        self.import_legacy()
+        if nome_projeto not in self._sent_cpfs:
+            cpfs = pd.Series([], dtype="int64")
+            if self._exists():
+                coluna = self._dataset().to_table(
+                    columns=[self.cpf_column],
+                    filter=ds.field("nome_projeto") == nome_projeto
+                ).column(self.cpf_column)
+                try:
+                    cpfs = pd.Series(pc.unique(pc.cast(coluna, pa.int64())).to_numpy(zero_copy_only=False))
+                except pa.ArrowInvalid:
+                    cpfs = cpfs_to_int(coluna.to_pandas())
+            self._sent_cpfs[nome_projeto] = pd.Index(cpfs.unique())
+
+        return self._sent_cpfs[nome_projeto]
+
+    def filter_unsent(self, df: pd.DataFrame, nome_projeto: str, cpf_column: str = "cpf") -> pd.DataFrame:
+        """Keeps only the rows whose CPF has not received a message of the project yet"""
+        return df[~cpfs_to_int(df[cpf_column]).isin(self.sent_cpfs(nome_projeto))]
+
+    def read(self, nome_projeto: str = None, columns: list = None, mes_inicio: str = None, mes_fim: str = None) -> pd.DataFrame:
+        """
+        Reads the ledger, pushing the project and month filters down to the partitions.
+
+        :param mes_inicio: First month to read, as YYYY-MM
+        :param mes_fim: Last month to read, as YYYY-MM
+        """
+        self.import_legacy()
+        if not self._exists():
+            return pd.DataFrame(columns=columns)
+
+        filtro = None
+        for condicao in [
+            ds.field("nome_projeto") == nome_projeto if nome_projeto is not None else None,
+            ds.field("mes") >= mes_inicio if mes_inicio is not None else None,
+            ds.field("mes") <= mes_fim if mes_fim is not None else None,
+        ]:
+            if condicao is not None:
+                filtro = condicao if filtro is None else filtro & condicao
+
+        return self._dataset().to_table(columns=columns, filter=filtro).to_pandas()
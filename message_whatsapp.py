@@ -1,15 +1,27 @@
 #%%
-from utils import (
-    ZAPIClient, SQLServer, SempreLeitura,
-    select_phone_number, validar_cpf, TemplateMensagem
-)
+from utils import SQLServer, SempreLeitura
+from candidates import select_candidates
+from campaign_builder import preparar_mensagens_pontos_a_expirar, build_campaign
+from send_queue import SendQueue
+from scheduler import campaign_priority
+from ledger import SentMessageLedger
+from snapshots import BalanceSnapshot
+from table_cache import LoyaltyTableCache
+from artifacts import write_campaign, read_campaign, export_excel
+from webhooks import WebhookStore
+from suppression import SuppressionIndex
+from metrics import metrics
 import pandas as pd
-import numpy as np
-from tqdm import tqdm
-import os
-import logging
 
 nome_projeto = "aviso_pontos_a_expirar"
+# The Excel copy of the campaign is only for people reviewing it; sending reads the Arrow file
+exportar_excel = True
+# Frequency cap across projects
+max_mensagens_usuario = 2
+janela_frequencia_dias = 30
+# Processes to recompute every balance from the database with build_campaign, instead of updating
+# the snapshot (e.g. to rebuild it from scratch); python -m benchmarks scaling measures the speedup
+workers_campanha = None
 
 data_inicio_pontuacao = pd.Timestamp.now() - pd.DateOffset(months=12) + pd.DateOffset(days=10)
 data_fim_pontuacao = data_inicio_pontuacao + pd.DateOffset(days=20)
@@ -17,134 +29,93 @@ data_fim_pontuacao = data_inicio_pontuacao + pd.DateOffset(days=20)
 #%%
 sqlserver_db = SQLServer()
 
-query_pontuacao = f"""
-SELECT mov.usuario, mov.data_hora, mov.valor, mov.tipo, mov.data_cupom, usr.nome_cliente, usr.ddd, usr.telefone, usr.ddd2, usr.telefone2
-FROM sl_movimentacao_conta_corrente mov
-LEFT JOIN sl_usuarios usr
-ON mov.usuario = usr.usuario
-WHERE mov.tipo = 'C'
-    AND CONVERT(DATETIME, mov.data_hora, 120) >= CONVERT(DATETIME, '{data_inicio_pontuacao.strftime("%Y-%m-%d")}', 120)
-    AND CONVERT(DATETIME, mov.data_hora, 120) < CONVERT(DATETIME, '{data_fim_pontuacao.strftime("%Y-%m-%d")}', 120)
-"""
-
-df_pontuacao = sqlserver_db.pandas_read_sql(query_pontuacao)
+# Local Parquet copy of the loyalty tables; if it was synced before, only the new movements and the
+# users, redemptions and stores they touch are pulled. Use table_cache.refresh() to reload it whole
+table_cache = LoyaltyTableCache(sqlserver_db.engine)
+table_cache.sync(max_age_minutes=60)
+table_cache.staleness()
 
 #%%
-pontos_acumulados= df_pontuacao.copy()\
-    .groupby("usuario")\
-    .agg(
-        pontos_acumulados_periodo=("valor", "sum")
-    )\
-    .reset_index()\
-    .merge(
-        df_pontuacao.drop_duplicates(subset="usuario"),
-        on="usuario",
-        how="left"
-    )\
-    .query("pontos_acumulados_periodo > 500")\
-    .sort_values("pontos_acumulados_periodo", ascending=False)\
-    .reset_index(drop=True)
+# Users with more than 500 points in the period, summed in the database; only those users
+# (with their contact fields) are transferred. candidates.covering_index_ddl() has the indexes for it
+pontos_acumulados = select_candidates(
+    sqlserver_db, data_inicio_pontuacao.normalize(), data_fim_pontuacao.normalize(), min_pontos=500
+)
 
 #%%
 usuarios = pontos_acumulados["usuario"].to_list()
 
 #%%
-saldos = []
-for usuario in tqdm(usuarios, total=len(usuarios)):
-    try:
-        sempreleitura = SempreLeitura()
-
-        df = sempreleitura.getMovimentosContaCorrente(
-            usuario=usuario
-        )
-
-        saldos.append(
-            sempreleitura.calculate_balance(df)
-        )
-    except Exception as e:
-        logging.error(f"Error processing user {usuario}: {e}")
+# Filter the users with points about to expire and prepare the message that is going to be sent.
+# Only the movements created since the last run are folded into the snapshot, read from the local cache
+if workers_campanha:
+    mensagens, shards_com_erro = build_campaign(pontos_acumulados, workers=workers_campanha)
+    if shards_com_erro:
+        raise RuntimeError(f"build_campaign failed on {len(shards_com_erro)} shards: {shards_com_erro}")
+else:
+    snapshot = BalanceSnapshot(SempreLeitura(cache=table_cache))
+    snapshot.update()
+    mensagens = preparar_mensagens_pontos_a_expirar(snapshot.saldos(usuarios), pontos_acumulados)
 
-saldos = pd.DataFrame(saldos)
+#%%
+# Sanity check of the snapshot against a full recompute of a sample of users from the database
+if not workers_campanha:
+    inconsistencias = snapshot.verificar_consistencia(amostra=50)
 
 #%%
-pontos_clientes = (
-    saldos
-        .merge(
-            pontos_acumulados,
-            on="usuario",
-            how="left"
-        )
-        .rename(columns={
-            "Créditos a Expirar": "creditos_a_expirar",
-        })
-        .query("creditos_a_expirar > 1000")
-        .query("Saldo > 2000")
-        .sort_values("Saldo", ascending=False)
-        .assign(
-            filtro_pontuacao_data_inicio = data_inicio_pontuacao,
-            filtro_pontuacao_data_fim = data_fim_pontuacao,
-            telefone_principal = lambda x: x["ddd"].astype(str) + x["telefone"].astype(str),
-            telefone_secundario = lambda x: x["ddd2"].astype(str) + x["telefone2"].astype(str)
-        )
-        .assign(
-            telefone_contato = lambda x: x.apply(
-                lambda row: select_phone_number(row["telefone_principal"], row["telefone_secundario"]),
-                axis=1
-            ),
-            data_min_a_expirar = lambda x: x["datas_a_expirar"].apply(
-                lambda x: min(x) if isinstance(x, list) and len(x) > 0 else pd.NA
-            ),
-            data_max_a_expirar = lambda df: df["datas_a_expirar"].apply(
-                lambda x: max(x) if isinstance(x, list) and len(x) > 1 else pd.NA
-            )
-        )
-        .reset_index(drop=True)
-)
+sempreleitura = mensagens\
+    .assign(
+        filtro_pontuacao_data_inicio = data_inicio_pontuacao,
+        filtro_pontuacao_data_fim = data_fim_pontuacao
+    )
 
 #%%
-# Prepare the message that is going to be sent
+# Filter clients that have already received the message; on the first run the old files of
+# data/messages_sent/ are imported into the ledger
+ledger = SentMessageLedger()
+
 sempreleitura = (
-    pontos_clientes
-        .query("telefone_contato.notnull()")
-        .assign(
-            cpf = lambda x: x["usuario"].apply(validar_cpf),
-            dinheiro = lambda x: np.floor(x["Saldo"] / 100),
-            primeiro_nome = lambda x: x["nome_cliente"].str.split(" ").str[0].str.capitalize(),
-            telefone_contato = lambda x: x["telefone_contato"].astype(str)
-        ).
-        query("cpf.notnull()")
+    ledger
+        .filter_unsent(sempreleitura, nome_projeto)
         .reset_index(drop=True)
 )
 
-sempreleitura['mensagem'] = sempreleitura.apply(
-    lambda row: TemplateMensaegm(row['primeiro_nome'], row["cpf"]).pontos_a_expirar(
-        row["data_min_a_expirar"], row["data_max_a_expirar"],
-        row["creditos_a_expirar"], row['Saldo']
-    ), axis=1
-).str.strip().to_list()
-
 #%%
-# Filter clients that have already received the message
-messages_sent_dir = os.listdir("data/messages_sent/")
-
-if len(messages_sent_dir) > 0:
-    messages_sent = pd.concat(
-        [pd.read_parquet(f"data/messages_sent/{file}") for file in messages_sent_dir]
-    )\
-        .query("nome_projeto == @nome_projeto")
-
-    sempreleitura = (
-        sempreleitura
-            .query("cpf not in @messages_sent['usuario']")
-            .reset_index(drop=True)
-    )
+# Drop the phones and CPFs that replied "SAIR" (recorded by the webhook receiver, python webhooks.py),
+# the phones found invalid when enriching (process_message.py) and the users that already got
+# max_mensagens_usuario messages of any project in the last janela_frequencia_dias days
+suppression = SuppressionIndex()
+suppression.sync_opt_outs(WebhookStore())
+suppression.sync_frequency_caps(ledger, max_messages=max_mensagens_usuario, days=janela_frequencia_dias)
+
+sempreleitura, suprimidos = suppression.filter(sempreleitura)
+sempreleitura = sempreleitura.reset_index(drop=True)
+suprimidos
 
 #%%
 # Export the data to be sent
 today_ts = pd.Timestamp.now().strftime('%Y-%m-%d %H-%M-%S')
 
-sempreleitura.to_excel(
-    f"sempre_leitura_com_mensagem_{today_ts}.xlsx", index=False
+campaign_path = write_campaign(sempreleitura, f"data/campaigns/{nome_projeto}_{today_ts}.arrow", nome_projeto)
+
+if exportar_excel:
+    export_excel(sempreleitura, f"sempre_leitura_com_mensagem_{today_ts}.xlsx")
+
+#%%
+# Enqueue the messages; rerunning this cell does not queue the same CPF twice.
+# Sending is a separate step: python cli.py send, inside the sending window, records the sent ones in the ledger
+send_queue = SendQueue()
+send_queue.recover()
+campanha = read_campaign(campaign_path)
+# The points expiring soonest go out first
+send_queue.enqueue(
+    campanha.assign(priority=campaign_priority(campanha, "data_min_a_expirar")), nome_projeto, priority_column="priority"
 )
 
+#%%
+# Stage timings of the run (collected only when METRICS_ENABLED=1)
+if metrics.enabled:
+    metrics.export_json(f"data/metrics/{nome_projeto}_{today_ts}.json")
+    metrics.export_prometheus("data/metrics/whatsapp_interactor.prom")
+
 # %%
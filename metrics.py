@@ -0,0 +1,203 @@
+import functools
+import json
+import os
+import random
+import threading
+import time
+from collections import Counter
+
+class _Serie:
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.rows = 0
+        self.total_seconds = 0.0
+        self.latencies = []
+        self.status = Counter()
+
+class _Timer:
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+        self.rows = 0
+        self.status = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.record(
+            self.name, time.perf_counter() - self.start,
+            rows=self.rows, status=self.status, error=exc_type is not None
+        )
+        return False
+
+class _NullTimer:
+    rows = 0
+    status = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+class Metrics:
+    """
+    Per-run counters and latency histograms for the pipeline stages.
+
+    When disabled (the default), timers and decorated functions only pay for one attribute check.
+
+    :param enabled: None reads METRICS_ENABLED the first time it is checked, so a .env loaded
+        after this module is imported still counts
+    :param max_samples: Latencies kept per series (reservoir sampling past it)
+    """
+    def __init__(self, enabled: bool = None, max_samples: int = 100_000):
+        self._enabled = enabled
+        self.max_samples = max_samples
+        self._series = {}
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+
+    @property
+    def enabled(self) -> bool:
+        if self._enabled is None:
+            self._enabled = os.getenv("METRICS_ENABLED", "").lower() in ("1", "true")
+        return self._enabled
+
+    def enable(self):
+        self._enabled = True
+
+    def disable(self):
+        self._enabled = False
+
+    def reset(self):
+        with self._lock:
+            self._series = {}
+            self.started_at = time.time()
+
+    def timer(self, name: str):
+        """Context manager that times its block; set .rows and .status on it to record them"""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name)
+
+    def timed(self, name: str = None, rows=None, status=None):
+        """
+        Decorator that times every call of the function.
+
+        :param name: Metric name (defaults to the function's qualified name)
+        :param rows: Function of the return value giving the number of rows processed
+        :param status: Function of the return value giving an HTTP status code
+        """
+        def decorator(func):
+            metric = name if name else func.__qualname__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+
+                with self.timer(metric) as timer:
+                    result = func(*args, **kwargs)
+                    if rows is not None:
+                        timer.rows = rows(result)
+                    if status is not None:
+                        timer.status = status(result)
+                return result
+
+            return wrapper
+
+        return decorator
+
+    def record(self, name: str, seconds: float, rows: int = 0, status: int = None, error: bool = False):
+        with self._lock:
+            serie = self._series.setdefault(name, _Serie())
+            serie.count += 1
+            serie.rows += rows or 0
+            serie.total_seconds += seconds
+
+            if status is not None:
+                serie.status[int(status)] += 1
+            if error or (status is not None and int(status) >= 400):
+                serie.errors += 1
+
+            # Amostragem de reservatório para limitar a memória em execuções longas
+            if len(serie.latencies) < self.max_samples:
+                serie.latencies.append(seconds)
+            else:
+                i = random.randrange(serie.count)
+                if i < self.max_samples:
+                    serie.latencies[i] = seconds
+
+    def summary(self) -> dict:
+        import numpy as np
+
+        with self._lock:
+            series = {}
+            for name, serie in sorted(self._series.items()):
+                p50, p95, p99 = np.percentile(serie.latencies, [50, 95, 99]) if serie.latencies else (0, 0, 0)
+                series[name] = {
+                    "count": serie.count,
+                    "errors": serie.errors,
+                    "rows": serie.rows,
+                    "total_seconds": serie.total_seconds,
+                    "p50_seconds": float(p50),
+                    "p95_seconds": float(p95),
+                    "p99_seconds": float(p99),
+                    "status": {str(code): count for code, count in sorted(serie.status.items())},
+                }
+
+        return {
+            "started_at": self.started_at,
+            "finished_at": time.time(),
+            "series": series,
+        }
+
+    def export_json(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def export_prometheus(self, path: str, prefix: str = "whatsapp_interactor"):
+        """Writes the summary in the Prometheus text format (e.g. for the node_exporter textfile collector)"""
+        series = self.summary()["series"]
+        familias = {
+            "calls_total": ("counter", []),
+            "errors_total": ("counter", []),
+            "rows_total": ("counter", []),
+            "duration_seconds": ("summary", []),
+            "http_responses_total": ("counter", []),
+        }
+        for name, serie in series.items():
+            label = f'stage="{name}"'
+            familias["calls_total"][1].append(f"{prefix}_calls_total{{{label}}} {serie['count']}")
+            familias["errors_total"][1].append(f"{prefix}_errors_total{{{label}}} {serie['errors']}")
+            familias["rows_total"][1].append(f"{prefix}_rows_total{{{label}}} {serie['rows']}")
+            for quantile in ["50", "95", "99"]:
+                familias["duration_seconds"][1].append(
+                    f"{prefix}_duration_seconds{{{label},quantile=\"{int(quantile) / 100:g}\"}} {serie[f'p{quantile}_seconds']}"
+                )
+            familias["duration_seconds"][1].append(f"{prefix}_duration_seconds_sum{{{label}}} {serie['total_seconds']}")
+            familias["duration_seconds"][1].append(f"{prefix}_duration_seconds_count{{{label}}} {serie['count']}")
+            for code, count in serie["status"].items():
+                familias["http_responses_total"][1].append(f"{prefix}_http_responses_total{{{label},code=\"{code}\"}} {count}")
+
+        # O formato exige as amostras de cada métrica juntas, logo depois do seu # TYPE
+        linhas = []
+        for metrica, (tipo, amostras) in familias.items():
+            linhas.append(f"# TYPE {prefix}_{metrica} {tipo}")
+            linhas.extend(amostras)
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        # Escreve em um arquivo temporário e renomeia, para o coletor nunca ler um arquivo pela metade
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write("\n".join(linhas) + "\n")
+        os.replace(tmp_path, path)
+
+metrics = Metrics()
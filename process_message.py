@@ -1,54 +1,44 @@
 #%%
 import pandas as pd
-import os
 from utils import ZAPIClient
-from tqdm import tqdm
-import logging
+from ledger import SentMessageLedger
+from enrichment import enrich_chat_metadata, MetadataCache
+from artifacts import read_report
+from webhooks import WebhookStore
+from suppression import SuppressionIndex
+from attribution import attribute_conversions
 
 zapi_client = ZAPIClient()
 
 #%%
-messages_sent_folder = "data/messages_sent/"
-
-# List all Parquet files in the folder
-parquet_files = [f for f in os.listdir(messages_sent_folder) if f.endswith('.parquet')]
-
-# Read and concatenate all Parquet files
-messages_sent = pd.concat(
-    [pd.read_parquet(os.path.join(messages_sent_folder, file)) for file in parquet_files],
-    ignore_index=True
-)
+# On the first run the old files of data/messages_sent/ are imported into the ledger
+ledger = SentMessageLedger()
+messages_sent = ledger.read()
 
 #%%
-# Get the metadata of the messages sent
-messages_results = []
-for index, row in tqdm(messages_sent.iterrows(), total=messages_sent.shape[0]):
-    try:
-        message_result = zapi_client.get_chat_metadata(row["telefone_contato"]).json() 
-        messages_results.append(
-            message_result | {"zaapId": row["zaapId"], "messageId": row["messageId"]}
-        )
-    except Exception as e:
-        logging.error(
-            f"Error while getting the metadata: {e}"
-        )
+# Delivery, read and reply status pushed by Z-API to the webhook receiver (python webhooks.py), without API calls
+message_status = WebhookStore().message_status()
+message_status.groupby(["nome_projeto", "status"], dropna=False).size()
 
 #%%
-messages_sent = messages_sent\
-    .merge(
-        pd.DataFrame(messages_results), 
-        on=["zaapId", "messageId"], 
-        how="left"
-    )
+# Get the metadata of the phones that received messages (cached for 24h).
+# The client's transport already retries these requests, so no retries on top of it
+messages_sent = enrich_chat_metadata(
+    messages_sent, zapi_client, cache=MetadataCache(), max_retries=0
+)
 
 #%%
 messages_sent.to_parquet("data/messages_sent_with_metadata.parquet", index=False)
 
+# Phones reported as not found are suppressed from the next campaigns
+SuppressionIndex().sync_invalid_phones(messages_sent)
+
 messages_sent = pd.read_parquet("data/messages_sent_with_metadata.parquet")
 
 # %%
 # Read info on the redemption of points
-resgate_sempreleitura = pd.read_excel(
+# The report is converted to Parquet on the first read and read from there afterwards
+resgate_sempreleitura = read_report(
     "data/resgate_sempre_leitura_20250210194104.xls",
     dtype={"Cliente": str},
     decimal=",",
@@ -61,23 +51,27 @@ resgate_sempreleitura = resgate_sempreleitura[[
     .rename(columns={"Data/Hora": "Data Resgate"})
 
 #%%
-# Merge the messages sent with the redemption of points
-messages_sent = messages_sent\
-    .merge(
-        resgate_sempreleitura, 
-        on="Cliente", 
-        how="left"
-    )
+# Conversions: the first redemption of the CPF within 7 days after each send. Redemptions before
+# the message are not counted; the ledger is read from its Parquet files, bucket by bucket
+resgate_sempreleitura["Data Resgate"] = pd.to_datetime(resgate_sempreleitura["Data Resgate"], dayfirst=True)
+
+conversoes = attribute_conversions(
+    ledger.path, resgate_sempreleitura, window_days=7,
+    redemption_cpf="Cliente", redemption_time="Data Resgate", store_column="Loja", value_column="Pontos"
+)
+conversoes
+
 # %%
-results = messages_sent\
-    .query("message != 'Internal server error'")\
-    .assign(
-        message=lambda x: x["message"].apply(lambda y: "Phone found" if pd.isna(y) else y),
-        has_redeemed=lambda x: x["ID Resgate"].notna()
-    )
+conversoes\
+    .groupby("nome_projeto")[["envios", "conversoes", "pontos_resgatados"]]\
+    .sum()\
+    .assign(taxa_conversao=lambda x: x["conversoes"] / x["envios"])
 
 # %%
-results\
+# Result of the metadata lookup of each phone
+messages_sent\
+    .query("message != 'Internal server error'")\
+    .assign(message=lambda x: x["message"].apply(lambda y: "Phone found" if pd.isna(y) else y))\
     .groupby("message")\
-    .sum()
+    .size()
 # %%
@@ -0,0 +1,346 @@
+from __future__ import annotations
+import logging
+import time
+from datetime import datetime, timedelta, time as dtime
+from send_queue import SendQueue
+from zapi_transport import CircuitOpenError, RETRY_STATUS, _retry_after_seconds
+
+# Segunda a sexta das 9h às 18h e sábado das 9h às 13h
+BUSINESS_HOURS = {
+    **{dia: [("09:00", "18:00")] for dia in range(5)},
+    5: [("09:00", "13:00")],
+}
+
+class SystemClock:
+    def now(self) -> datetime:
+        return datetime.now()
+
+    def sleep(self, seconds: float):
+        if seconds > 0:
+            time.sleep(seconds)
+
+class SimulatedClock:
+    """Clock whose sleep only moves the time forward, to run a whole campaign plan in seconds"""
+    def __init__(self, start: datetime):
+        import pandas as pd
+
+        self._now = pd.Timestamp(start).to_pydatetime()
+
+    def now(self) -> datetime:
+        return self._now
+
+    def sleep(self, seconds: float):
+        if seconds > 0:
+            self._now += timedelta(seconds=seconds)
+
+class SendingWindows:
+    """
+    Periods of the week when messages may be sent.
+
+    :param windows: {weekday (0 = Monday): [("HH:MM", "HH:MM"), ...]}; days left out are closed
+    :param holidays: Dates with no sending
+    """
+    def __init__(self, windows: dict = None, holidays=()):
+        windows = BUSINESS_HOURS if windows is None else windows
+        self.windows = {
+            dia: sorted((dtime.fromisoformat(inicio), dtime.fromisoformat(fim)) for inicio, fim in periodos)
+            for dia, periodos in windows.items()
+        }
+        self.holidays = set()
+        if holidays:
+            import pandas as pd
+
+            self.holidays = {pd.Timestamp(dia).date() for dia in holidays}
+        if not any(inicio < fim for periodos in self.windows.values() for inicio, fim in periodos):
+            raise ValueError("The sending windows have no open period")
+
+    def _periodos(self, dia):
+        """Open periods of the day as datetimes"""
+        if dia in self.holidays:
+            return []
+        return [
+            (datetime.combine(dia, inicio), datetime.combine(dia, fim))
+            for inicio, fim in self.windows.get(dia.weekday(), [])
+            if inicio < fim
+        ]
+
+    def _proximos(self, momento: datetime):
+        """Open periods from momento on, the first one cut at momento"""
+        dia = momento.date()
+        # Um ano sem janela aberta só acontece com feriados cobrindo tudo
+        for _ in range(370):
+            for inicio, fim in self._periodos(dia):
+                if fim > momento:
+                    yield max(inicio, momento), fim
+            dia += timedelta(days=1)
+
+    def is_open(self, momento: datetime) -> bool:
+        return any(inicio <= momento < fim for inicio, fim in self._periodos(momento.date()))
+
+    def next_open(self, momento: datetime):
+        """Start of the next open period (momento itself when open) and its end"""
+        for inicio, fim in self._proximos(momento):
+            return inicio, fim
+        raise ValueError(f"No sending window open in the year after {momento}")
+
+    def advance(self, momento: datetime, seconds: float) -> datetime:
+        """Moment when seconds of open time have passed since momento"""
+        for inicio, fim in self._proximos(momento):
+            disponivel = (fim - inicio).total_seconds()
+            if seconds <= disponivel:
+                return inicio + timedelta(seconds=seconds)
+            seconds -= disponivel
+        raise ValueError(f"The sending windows of the year after {momento} are not enough")
+
+def campaign_priority(df: pd.DataFrame, by: str = "Saldo") -> pd.Series:
+    """
+    Priority of each message for SendQueue.enqueue(priority_column=...), higher first.
+
+    :param by: "Saldo" (largest balance first) or "data_min_a_expirar" (nearest expiry first)
+    """
+    import pandas as pd
+
+    if by == "Saldo":
+        prioridade = pd.to_numeric(df["Saldo"]).astype(float)
+    elif by == "data_min_a_expirar":
+        # Quanto mais perto a expiração, maior a prioridade
+        prioridade = -(pd.to_datetime(df["data_min_a_expirar"]) - pd.Timestamp("1970-01-01")).dt.total_seconds()
+    else:
+        raise ValueError(f"Unknown priority {by}, expected Saldo or data_min_a_expirar")
+    # Sem valor vai por último
+    return prioridade.fillna(float("-inf"))
+
+class InstancePacer:
+    """
+    Send rate of one Z-API instance, adjusted after every send (AIMD).
+
+    Fast successful sends raise the rate by a fixed step; sends slower than target_latency
+    lower it a little and errors cut it in half. A 429 with Retry-After pauses the instance.
+    """
+    def __init__(self, rate: float, min_rate: float, max_rate: float, increase: float,
+                 target_latency: float, slow_factor: float = 0.8, error_factor: float = 0.5):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.target_latency = target_latency
+        self.slow_factor = slow_factor
+        self.error_factor = error_factor
+
+        self.next_at = None
+        self.latency = None
+        self.requests = 0
+        self.errors = 0
+        self.recent = []
+
+    def record(self, agora: datetime, sucesso: bool, latencia: float, pausa: float = 0.0):
+        """
+        :param sucesso: False when the instance failed (5xx, 429, timeout), not for errors of the message itself
+        :param pausa: Seconds the instance must wait, e.g. Retry-After
+        """
+        # Média móvel exponencial da latência, para um envio lento isolado não derrubar o ritmo
+        self.latency = latencia if self.latency is None else 0.8 * self.latency + 0.2 * latencia
+        self.recent = (self.recent + [sucesso])[-20:]
+
+        self.requests += 1
+        if sucesso:
+            if self.latency > self.target_latency:
+                self.rate *= self.slow_factor
+            else:
+                self.rate += self.increase
+        else:
+            self.errors += 1
+            self.rate *= self.error_factor
+
+        self.rate = min(max(self.rate, self.min_rate), self.max_rate)
+        self.next_at = agora + timedelta(seconds=max(1 / self.rate, pausa))
+
+    def error_rate(self) -> float:
+        return self.recent.count(False) / len(self.recent) if self.recent else 0.0
+
+class SendScheduler:
+    """
+    Sends a campaign from the SendQueue inside the sending windows, pacing each Z-API instance on its own.
+
+    Messages leave the queue by priority (see campaign_priority). Each instance gets the next
+    message when its pacer allows, so a slow or failing instance slows down without holding the
+    others; with a ZAPIPool, phones stay on the instance the pool routes them to. Z-API's own
+    delayMessage is kept at delay_message, as the pacing is done here.
+
+        scheduler = SendScheduler(SendQueue(), ZAPIPool.from_env())
+        print(scheduler.projected_completion(nome_projeto))
+        scheduler.run(nome_projeto)
+
+    :param send_queue: Queue with the campaign
+    :param zapi_client: ZAPIClient or ZAPIPool
+    :param windows: SendingWindows (business hours by default)
+    :param clock: SystemClock, or SimulatedClock to plan or test a campaign without waiting
+    :param rate: Initial messages per second of each instance
+    :param min_rate: Lowest messages per second of an instance
+    :param max_rate: Highest messages per second of an instance
+    :param increase: Messages per second added after each fast successful send
+    :param target_latency: Seconds above which a send is considered slow
+    :param delay_message: delayMessage sent to Z-API
+    :param batch_size: Messages claimed from the queue at a time
+    :param max_claimed: Most messages held out of the queue, waiting for their instance
+    """
+    def __init__(self, send_queue: SendQueue, zapi_client, windows: SendingWindows = None, clock=None,
+                 rate: float = 0.2, min_rate: float = 0.02, max_rate: float = 2.0, increase: float = 0.01,
+                 target_latency: float = 2.0, delay_message: int = 1, batch_size: int = 50, max_claimed: int = 500):
+        self.send_queue = send_queue
+        self.zapi_client = zapi_client
+        self.windows = windows if windows else SendingWindows()
+        self.clock = clock if clock else SystemClock()
+        self.delay_message = delay_message
+        self.batch_size = batch_size
+        self.max_claimed = max_claimed
+
+        # Com um ZAPIPool cada instância tem seu ritmo; com um ZAPIClient há um só
+        self.clients = getattr(zapi_client, "clients", None) or {zapi_client.instance_id: zapi_client}
+        self.pacers = {
+            instance_id: InstancePacer(rate, min_rate, max_rate, increase, target_latency)
+            for instance_id in self.clients
+        }
+        self.history = []
+        self._filas = {}
+
+    def _instancia(self, phone):
+        if hasattr(self.zapi_client, "instance_for"):
+            return self.zapi_client.instance_for(phone)
+        return next(iter(self.clients))
+
+    def _send_text(self, instance_id, phone, message):
+        # Pelo pool, para o envio contar na saúde da instância e na rota usada por read_message
+        if hasattr(self.zapi_client, "send_text_on"):
+            return self.zapi_client.send_text_on(instance_id, phone, message, delay_message=self.delay_message)
+        return self.clients[instance_id].send_text(phone, message, delay_message=self.delay_message)
+
+    def rate(self) -> float:
+        """Current messages per second of all instances together"""
+        return sum(pacer.rate for pacer in self.pacers.values())
+
+    def projected_completion(self, nome_projeto: str = None) -> datetime:
+        """When the pending messages will be sent at the current rates, counting only open windows"""
+        pendentes = self.send_queue.pending_count(nome_projeto)
+        pendentes += sum(len(fila) for fila in self._filas.values())
+        return self.windows.advance(self.clock.now(), pendentes / self.rate())
+
+    def run(self, nome_projeto: str = None, until: datetime = None, max_messages: int = None) -> int:
+        """
+        Sends until the queue is empty, the clock reaches until or max_messages were sent.
+
+        Messages claimed but not sent when it stops go back to pending.
+
+        :return: Number of messages sent
+        """
+        self._filas = {instance_id: [] for instance_id in self.clients}
+        enviadas, fila_vazia = 0, False
+        try:
+            while max_messages is None or enviadas < max_messages:
+                agora = self.clock.now()
+                if until is not None and agora >= until:
+                    break
+
+                inicio, fim = self.windows.next_open(agora)
+                if inicio > agora:
+                    if until is not None and inicio >= until:
+                        break
+                    logging.info(f"Sending window closed, waiting until {inicio}")
+                    self.clock.sleep((inicio - agora).total_seconds())
+                    continue
+
+                # Busca mais mensagens quando alguma instância ficou sem, para uma instância lenta
+                # não segurar as outras; o total em mãos é limitado a max_claimed
+                em_maos = sum(len(fila) for fila in self._filas.values())
+                if not fila_vazia and em_maos < self.max_claimed and not all(self._filas.values()):
+                    lote = self.send_queue.claim(self.batch_size, nome_projeto)
+                    fila_vazia = not lote
+                    for mensagem in lote:
+                        self._filas[self._instancia(mensagem[1])].append(mensagem)
+                if not any(self._filas.values()):
+                    # Mensagens devolvidas à fila depois que ela esvaziou (429, breaker aberto) são buscadas de novo
+                    if fila_vazia and self.send_queue.pending_count(nome_projeto):
+                        fila_vazia = False
+                        continue
+                    break
+
+                # A instância com fila que pode enviar primeiro
+                instance_id = min(
+                    (instance_id for instance_id, fila in self._filas.items() if fila),
+                    key=lambda instance_id: self.pacers[instance_id].next_at or agora
+                )
+                proximo = self.pacers[instance_id].next_at or agora
+                if proximo > agora:
+                    self.clock.sleep((min(proximo, fim) - agora).total_seconds())
+                    continue
+
+                mensagem = self._filas[instance_id].pop(0)
+                # O pool pode ter tirado a instância da rotação depois que a mensagem foi distribuída
+                destino = self._instancia(mensagem[1])
+                if destino != instance_id:
+                    self._filas[destino].append(mensagem)
+                    continue
+
+                if self._enviar(instance_id, mensagem):
+                    enviadas += 1
+        finally:
+            self.send_queue.release([key for fila in self._filas.values() for key, _, _ in fila])
+            self._filas = {}
+
+        return enviadas
+
+    def _enviar(self, instance_id, mensagem):
+        key, phone, message = mensagem
+        pacer = self.pacers[instance_id]
+        inicio = time.perf_counter()
+        enviada, pausa, response = False, 0.0, None
+        try:
+            response = self._send_text(instance_id, phone, message)
+            response.raise_for_status()
+            self.send_queue.mark_sent_response(key, response)
+            enviada = True
+        except CircuitOpenError:
+            # A requisição não saiu: a mensagem volta para a fila e a instância fica parada
+            self.send_queue.release([key])
+            pausa = 1 / pacer.min_rate
+        except Exception as e:
+            if response is not None and response.status_code == 429:
+                # Recusada por limite de taxa, então não foi enviada
+                self.send_queue.release([key])
+                pausa = _retry_after_seconds(response) or 0.0
+            else:
+                logging.error(f"Error sending message {key}: {e}")
+                self.send_queue.mark_failed(key, e)
+
+        # Erros da mensagem (ex.: telefone inválido) não dizem nada sobre a instância
+        saudavel = enviada or (response is not None and response.status_code not in RETRY_STATUS)
+        latencia = time.perf_counter() - inicio
+        agora = self.clock.now()
+        pacer.record(agora, saudavel, latencia, pausa)
+        self.history.append({
+            "timestamp": agora, "instance_id": instance_id, "idempotency_key": key,
+            "success": enviada, "latency": latencia, "rate": pacer.rate,
+        })
+        return enviada
+
+    def stats(self) -> pd.DataFrame:
+        """Rate, latency and request counts of each instance; errors are the instance's, not the messages'"""
+        import pandas as pd
+
+        return pd.DataFrame([
+            {
+                "instance_id": instance_id,
+                "messages_per_second": pacer.rate,
+                "latency": pacer.latency,
+                "requests": pacer.requests,
+                "errors": pacer.errors,
+                "recent_error_rate": pacer.error_rate(),
+                "next_send_at": pacer.next_at,
+            }
+            for instance_id, pacer in self.pacers.items()
+        ])
+
+    def history_dataframe(self) -> pd.DataFrame:
+        import pandas as pd
+
+        return pd.DataFrame(self.history, columns=["timestamp", "instance_id", "idempotency_key", "success", "latency", "rate"])
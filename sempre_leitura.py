@@ -6,9 +6,10 @@ from utils import (
     whatsapp_link, template_mensagem, 
     validar_cpf
 )
+from artifacts import read_report
 
 #%%
-sempreleitura = pd.read_excel(
+sempreleitura = read_report(
     "ranking_sempre_leitura_20241220201721.xls",
     decimal=",",
     thousands=".",
@@ -0,0 +1,232 @@
+from __future__ import annotations
+import sqlite3
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from zapi_transport import not_delivered
+
+STATUS_PENDING = "pending"
+STATUS_SENDING = "sending"
+STATUS_SENT = "sent"
+STATUS_FAILED = "failed"
+# Mensagens que estavam sendo enviadas quando o processo caiu: podem ou não ter sido entregues
+STATUS_UNKNOWN = "unknown"
+
+class SendQueue:
+    def __init__(self, path: str = "data/send_queue.db"):
+        self.path = path
+        self._local = threading.local()
+        self._create_table()
+
+    def _connection(self):
+        if not hasattr(self._local, "conn"):
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return self._local.conn
+
+    def _create_table(self):
+        self._connection().executescript("""
+        CREATE TABLE IF NOT EXISTS send_queue (
+            idempotency_key TEXT PRIMARY KEY,
+            nome_projeto TEXT NOT NULL,
+            cpf TEXT NOT NULL,
+            telefone_contato TEXT NOT NULL,
+            mensagem TEXT NOT NULL,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            zaapId TEXT,
+            messageId TEXT,
+            error TEXT,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            priority REAL NOT NULL DEFAULT 0,
+            retryable INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_send_queue_status ON send_queue (status, nome_projeto);
+        """)
+
+        # Filas criadas antes das colunas de prioridade e de falha repetível
+        colunas = [linha[1] for linha in self._connection().execute("PRAGMA table_info(send_queue)")]
+        if "priority" not in colunas:
+            self._connection().execute("ALTER TABLE send_queue ADD COLUMN priority REAL NOT NULL DEFAULT 0")
+        if "retryable" not in colunas:
+            self._connection().execute("ALTER TABLE send_queue ADD COLUMN retryable INTEGER NOT NULL DEFAULT 0")
+        self._connection().execute(
+            "CREATE INDEX IF NOT EXISTS idx_send_queue_priority ON send_queue (status, nome_projeto, priority DESC)"
+        )
+
+    @staticmethod
+    def idempotency_key(nome_projeto, cpf):
+        return f"{nome_projeto}:{cpf}"
+
+    def enqueue(self, df: pd.DataFrame, nome_projeto: str, phone_column="telefone_contato", message_column="mensagem",
+                priority_column=None):
+        """
+        Adds the campaign messages to the queue. Messages already queued for the same
+        (nome_projeto, cpf) are ignored, so enqueueing the same campaign twice is safe.
+
+        :param priority_column: Column with the priority of each message; higher ones are claimed first
+        :return: Number of new messages queued
+        """
+        now = datetime.now().isoformat()
+        priorities = df[priority_column].fillna(0).astype(float) if priority_column else [0.0] * len(df)
+        rows = [
+            (self.idempotency_key(nome_projeto, cpf), nome_projeto, str(cpf), str(phone), message, STATUS_PENDING, now, now, priority)
+            for cpf, phone, message, priority in zip(df["cpf"], df[phone_column], df[message_column], priorities)
+        ]
+
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            before = conn.total_changes
+            conn.executemany("""
+            INSERT OR IGNORE INTO send_queue
+                (idempotency_key, nome_projeto, cpf, telefone_contato, mensagem, status, created_at, updated_at, priority)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+            return conn.total_changes - before
+
+    def recover(self):
+        """Marks messages left in flight by a crashed worker as unknown, so they are never sent twice"""
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            return conn.execute(
+                "UPDATE send_queue SET status = ?, updated_at = ? WHERE status = ?",
+                (STATUS_UNKNOWN, datetime.now().isoformat(), STATUS_SENDING)
+            ).rowcount
+
+    def claim(self, batch_size: int = 50, nome_projeto: str = None):
+        """Atomically moves up to batch_size pending messages, highest priority first, to sending and returns them"""
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            query = "SELECT idempotency_key, telefone_contato, mensagem FROM send_queue WHERE status = ?"
+            params = [STATUS_PENDING]
+            if nome_projeto is not None:
+                query += " AND nome_projeto = ?"
+                params.append(nome_projeto)
+            rows = conn.execute(query + " ORDER BY priority DESC, rowid LIMIT ?", params + [batch_size]).fetchall()
+
+            conn.executemany(
+                "UPDATE send_queue SET status = ?, attempts = attempts + 1, updated_at = ? WHERE idempotency_key = ?",
+                [(STATUS_SENDING, datetime.now().isoformat(), key) for key, _, _ in rows]
+            )
+        return rows
+
+    def mark_sent(self, key, zaap_id, message_id):
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "UPDATE send_queue SET status = ?, zaapId = ?, messageId = ?, error = NULL, updated_at = ? WHERE idempotency_key = ?",
+                (STATUS_SENT, zaap_id, message_id, datetime.now().isoformat(), key)
+            )
+
+    def mark_sent_response(self, key, response):
+        """Marks the message sent from its 2xx response; a body that is not JSON leaves the ids empty, as it was delivered"""
+        try:
+            body = response.json()
+        except ValueError:
+            logging.warning(f"Message {key} sent, but the response body is not JSON")
+            body = {}
+        self.mark_sent(key, body.get("zaapId"), body.get("messageId"))
+
+    def mark_failed(self, key, error):
+        """Marks the message as failed, recording whether the error shows it was certainly not delivered"""
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "UPDATE send_queue SET status = ?, error = ?, retryable = ?, updated_at = ? WHERE idempotency_key = ?",
+                (STATUS_FAILED, str(error), int(not_delivered(error)), datetime.now().isoformat(), key)
+            )
+
+    def release(self, keys):
+        """Moves claimed messages that were not sent back to pending, without counting the attempt"""
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                "UPDATE send_queue SET status = ?, attempts = attempts - 1, updated_at = ? WHERE idempotency_key = ? AND status = ?",
+                [(STATUS_PENDING, datetime.now().isoformat(), key, STATUS_SENDING) for key in keys]
+            )
+
+    def pending_count(self, nome_projeto: str = None) -> int:
+        return self.status_counts(nome_projeto).get(STATUS_PENDING, 0)
+
+    def retry_failed(self, nome_projeto: str = None, include_ambiguous: bool = False):
+        """
+        Moves the failed messages that certainly were not delivered (refused, 4xx or no connection)
+        back to pending.
+
+        :param include_ambiguous: Also requeues the ones that may have been delivered (timeouts,
+            dropped connections, 5xx), which can send them twice; only after checking them, e.g.
+            against the webhook status
+        :return: Number of messages requeued
+        """
+        conn = self._connection()
+        query = "UPDATE send_queue SET status = ?, updated_at = ? WHERE status = ?"
+        params = [STATUS_PENDING, datetime.now().isoformat(), STATUS_FAILED]
+        if not include_ambiguous:
+            query += " AND retryable = 1"
+        if nome_projeto is not None:
+            query += " AND nome_projeto = ?"
+            params.append(nome_projeto)
+        with conn:
+            return conn.execute(query, params).rowcount
+
+    def drain(self, zapi_client, batch_size: int = 50, nome_projeto: str = None, delay_message=10, workers: int = 1):
+        """
+        Sends pending messages with a ZAPIClient (or ZAPIPool) until the queue is empty.
+
+        :param workers: Threads sending at the same time; each one claims its own batches
+        :return: Number of messages sent
+        """
+        if workers <= 1:
+            return self._drain(zapi_client, batch_size, nome_projeto, delay_message)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(self._drain, zapi_client, batch_size, nome_projeto, delay_message)
+                for _ in range(workers)
+            ]
+            return sum(future.result() for future in futures)
+
+    def _drain(self, zapi_client, batch_size, nome_projeto, delay_message):
+        sent = 0
+        while True:
+            batch = self.claim(batch_size, nome_projeto)
+            if not batch:
+                return sent
+
+            for key, phone, message in batch:
+                try:
+                    response = zapi_client.send_text(phone, message, delay_message=delay_message)
+                    response.raise_for_status()
+                    self.mark_sent_response(key, response)
+                    sent += 1
+                except Exception as e:
+                    logging.error(f"Error sending message {key}: {e}")
+                    self.mark_failed(key, e)
+
+    def status_counts(self, nome_projeto: str = None):
+        query = "SELECT status, COUNT(*) FROM send_queue"
+        params = []
+        if nome_projeto is not None:
+            query += " WHERE nome_projeto = ?"
+            params.append(nome_projeto)
+        return dict(self._connection().execute(query + " GROUP BY status", params).fetchall())
+
+    def to_dataframe(self, nome_projeto: str = None, status: str = None):
+        import pandas as pd
+
+        query = "SELECT * FROM send_queue WHERE 1 = 1"
+        params = []
+        if nome_projeto is not None:
+            query += " AND nome_projeto = ?"
+            params.append(nome_projeto)
+        if status is not None:
+            query += " AND status = ?"
+            params.append(status)
+        return pd.read_sql_query(query, self._connection(), params=params)
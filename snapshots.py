@@ -0,0 +1,245 @@
+import sqlite3
+import logging
+import numpy as np
+import pandas as pd
+from datetime import timedelta
+from utils import SempreLeitura
+
+COLUNAS_SALDO = [
+    "usuario", "datas_a_expirar", "Créditos", "Débitos", "Saldo",
+    "Créditos Expirados", "Créditos a Expirar"
+]
+
+class BalanceSnapshot:
+    """
+    Local store of per-user balance aggregates, updated only with the movements created since the last run.
+
+    Totals of credits and debits are kept per user. Purchase credits that can still expire are kept
+    one per movement, with the redeemed sums of their (usuario, extra_info, cnpj) key, so expiry is
+    derived locally. Once a credit is past its expiry date it is folded into the user's expired total.
+    """
+    def __init__(self, sempreleitura: SempreLeitura = None, path: str = "data/balance_snapshot.db"):
+        self.sempreleitura = sempreleitura if sempreleitura else SempreLeitura()
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self._create_tables()
+
+    def _create_tables(self):
+        self.conn.executescript("""
+        CREATE TABLE IF NOT EXISTS usuarios (
+            usuario TEXT PRIMARY KEY,
+            creditos REAL NOT NULL DEFAULT 0,
+            debitos REAL NOT NULL DEFAULT 0,
+            expirados_consolidados REAL NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS creditos_compra (
+            id INTEGER PRIMARY KEY,
+            usuario TEXT NOT NULL,
+            extra_info TEXT,
+            cnpj_empresa TEXT,
+            data_cupom TEXT NOT NULL,
+            valor REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_creditos_compra_usuario ON creditos_compra (usuario);
+        CREATE INDEX IF NOT EXISTS idx_creditos_compra_data ON creditos_compra (data_cupom);
+        CREATE TABLE IF NOT EXISTS resgates (
+            usuario TEXT NOT NULL,
+            extra_info TEXT NOT NULL,
+            cnpj_empresa_credito TEXT NOT NULL,
+            valor_resgatado REAL NOT NULL,
+            PRIMARY KEY (usuario, extra_info, cnpj_empresa_credito)
+        );
+        CREATE TABLE IF NOT EXISTS watermark (
+            chave INTEGER PRIMARY KEY CHECK (chave = 1),
+            ultimo_id INTEGER NOT NULL,
+            ultima_data_hora TEXT
+        );
+        """)
+
+    def watermark(self):
+        row = self.conn.execute("SELECT ultimo_id, ultima_data_hora FROM watermark").fetchone()
+        return row if row else (0, None)
+
+    def update(self):
+        """
+        Fetches the movements newer than the watermark and folds them into the snapshot.
+
+        :return: Number of movements processed
+        """
+        ultimo_id, _ = self.watermark()
+        novos = self.sempreleitura.getMovimentosDesde(ultimo_id)
+
+        with self.conn:
+            if not novos.empty:
+                self._fold(novos)
+            self._consolidar_expirados()
+
+        logging.info(f"{len(novos)} new movements folded into the balance snapshot")
+        return len(novos)
+
+    def _fold(self, novos: pd.DataFrame):
+        sl = self.sempreleitura
+        novos = novos.assign(usuario=novos["usuario"].astype(str))
+
+        credito = novos["tipo"].eq(sl.TIPO_MOVIMENTO_CREDITO)
+        debito = novos["tipo"].isin([sl.TIPO_MOVIMENTO_DEBITO, sl.TIPO_MOVIMENTO_RESGATE])
+        totais = pd.DataFrame({
+            "usuario": novos["usuario"],
+            "creditos": novos["valor"].where(credito, 0),
+            "debitos": novos["valor"].where(debito, 0),
+        }).groupby("usuario", sort=False).sum().reset_index()
+
+        self.conn.executemany("""
+        INSERT INTO usuarios (usuario, creditos, debitos) VALUES (?, ?, ?)
+        ON CONFLICT (usuario) DO UPDATE SET
+            creditos = creditos + excluded.creditos,
+            debitos = debitos + excluded.debitos
+        """, totais.itertuples(index=False, name=None))
+
+        compras = novos[credito & novos["origem"].eq(sl.ORIGEM_PONTUACAO_COMPRA)]
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO creditos_compra (id, usuario, extra_info, cnpj_empresa, data_cupom, valor) VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (int(id_), usuario, _chave(extra_info), _chave(cnpj), data_cupom, float(valor))
+                for id_, usuario, extra_info, cnpj, data_cupom, valor in compras[
+                    ["id", "usuario", "extra_info", "cnpj_empresa", "data_cupom_mod", "valor"]
+                ].itertuples(index=False, name=None)
+            ]
+        )
+
+        # Todo resgate gera um movimento, então só os usuários com movimentos novos podem ter resgates novos
+        usuarios = totais["usuario"].tolist()
+        resgates = sl.getResgatesAgrupados(usuarios)
+        resgates = resgates.dropna(subset=["usuario", "extra_info", "cnpj_empresa_credito"])
+
+        self.conn.executemany("DELETE FROM resgates WHERE usuario = ?", [(usuario,) for usuario in usuarios])
+        self.conn.executemany(
+            "INSERT INTO resgates (usuario, extra_info, cnpj_empresa_credito, valor_resgatado) VALUES (?, ?, ?, ?)",
+            [
+                (str(usuario), _chave(extra_info), _chave(cnpj), float(valor))
+                for usuario, extra_info, cnpj, valor in resgates[
+                    ["usuario", "extra_info", "cnpj_empresa_credito", "valor_resgatado"]
+                ].itertuples(index=False, name=None)
+            ]
+        )
+
+        self.conn.execute(
+            "INSERT OR REPLACE INTO watermark (chave, ultimo_id, ultima_data_hora) VALUES (1, ?, ?)",
+            (int(novos["id"].max()), str(novos["data_hora"].max()))
+        )
+
+    def _consolidar_expirados(self):
+        data_limite_expiracao, _ = self.sempreleitura.datas_limite()
+        data_limite = data_limite_expiracao.strftime("%Y-%m-%d")
+
+        self.conn.execute("""
+        UPDATE usuarios SET expirados_consolidados = expirados_consolidados + (
+            SELECT SUM(MAX(c.valor - COALESCE(r.valor_resgatado, 0), 0))
+            FROM creditos_compra c
+            LEFT JOIN resgates r
+                ON r.usuario = c.usuario
+                AND r.extra_info = c.extra_info
+                AND r.cnpj_empresa_credito = c.cnpj_empresa
+            WHERE c.usuario = usuarios.usuario AND c.data_cupom < ?
+        )
+        WHERE usuario IN (SELECT usuario FROM creditos_compra WHERE data_cupom < ?)
+        """, (data_limite, data_limite))
+        self.conn.execute("DELETE FROM creditos_compra WHERE data_cupom < ?", (data_limite,))
+
+    def saldos(self, usuarios=None) -> pd.DataFrame:
+        """
+        Balances from the snapshot, in the same format as SempreLeitura.calculate_balances.
+
+        :param usuarios: Users to return (all users if None)
+        """
+        filtro_totais, filtro_creditos = "", ""
+        if usuarios is not None:
+            self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS filtro_usuarios (usuario TEXT PRIMARY KEY)")
+            self.conn.execute("DELETE FROM filtro_usuarios")
+            self.conn.executemany("INSERT OR IGNORE INTO filtro_usuarios VALUES (?)", [(str(usuario),) for usuario in usuarios])
+            filtro_totais = "WHERE usuario IN (SELECT usuario FROM filtro_usuarios)"
+            filtro_creditos = "WHERE c.usuario IN (SELECT usuario FROM filtro_usuarios)"
+
+        totais = pd.read_sql_query(f"SELECT * FROM usuarios {filtro_totais}", self.conn)
+        creditos = pd.read_sql_query(f"""
+        SELECT c.id, c.usuario, c.data_cupom, c.valor - COALESCE(r.valor_resgatado, 0) AS valor_disponivel
+        FROM creditos_compra c
+        LEFT JOIN resgates r
+            ON r.usuario = c.usuario
+            AND r.extra_info = c.extra_info
+            AND r.cnpj_empresa_credito = c.cnpj_empresa
+        {filtro_creditos}
+        ORDER BY c.usuario, c.data_cupom, c.id
+        """, self.conn)
+
+        data_limite_expiracao, data_limite_a_expirar = self.sempreleitura.datas_limite()
+        data_cupom = pd.to_datetime(creditos["data_cupom"], format="%Y-%m-%d")
+        disponivel = creditos["valor_disponivel"] > 0
+        expirado = disponivel & (data_cupom < data_limite_expiracao)
+        a_expirar = disponivel & (data_cupom >= data_limite_expiracao) & (data_cupom < data_limite_a_expirar)
+
+        expiracao = pd.DataFrame({
+            "usuario": creditos["usuario"],
+            "Créditos Expirados": creditos["valor_disponivel"].where(expirado, 0),
+            "Créditos a Expirar": creditos["valor_disponivel"].where(a_expirar, 0),
+        }).groupby("usuario").sum()
+
+        datas_a_expirar = (
+            (data_cupom[a_expirar] + timedelta(days=SempreLeitura.VALIDADE_PONTOS_DIAS))
+                .groupby(creditos["usuario"][a_expirar], sort=False)
+                .agg(list)
+        )
+
+        saldos = totais.set_index("usuario").join(expiracao, how="left").fillna(
+            {"Créditos Expirados": 0, "Créditos a Expirar": 0}
+        )
+        saldos["Créditos Expirados"] += saldos["expirados_consolidados"]
+        saldos = saldos.rename(columns={"creditos": "Créditos", "debitos": "Débitos"})
+        saldos["Saldo"] = saldos["Créditos"] - saldos["Débitos"] - saldos["Créditos Expirados"]
+        saldos["datas_a_expirar"] = [datas_a_expirar.get(usuario, []) for usuario in saldos.index]
+
+        return saldos.reset_index()[COLUNAS_SALDO]
+
+    def verificar_consistencia(self, amostra: int = 100, seed: int = None, tolerancia: float = 1e-6,
+                               origem: SempreLeitura = None) -> pd.DataFrame:
+        """
+        Compares the snapshot with a full recompute for a random sample of users.
+
+        :param origem: SempreLeitura the balances are recomputed from. Defaults to the database: when the
+            snapshot reads from a LoyaltyTableCache, the cache's engine, so a stale cache shows up as a difference
+        :return: Pandas DataFrame with the users whose balances differ (empty if consistent)
+        """
+        if origem is None:
+            sl = self.sempreleitura
+            origem = sl if sl.cache is None else SempreLeitura(engine=sl.cache.engine, data_referencia=sl.data_referencia)
+
+        usuarios = pd.read_sql_query("SELECT usuario FROM usuarios", self.conn)["usuario"]
+        usuarios = usuarios.sample(min(amostra, len(usuarios)), random_state=seed).tolist()
+
+        snapshot = self.saldos(usuarios).set_index("usuario")
+        completo = origem.calculate_balances(origem.getMovimentosContaCorrenteBulk(usuarios))
+        completo = completo.assign(usuario=completo["usuario"].astype(str)).set_index("usuario")
+        completo = completo.reindex(snapshot.index)
+
+        colunas = ["Créditos", "Débitos", "Saldo", "Créditos Expirados", "Créditos a Expirar"]
+        diferenca = ~np.isclose(
+            snapshot[colunas].to_numpy(float), completo[colunas].to_numpy(float), atol=tolerancia
+        ).all(axis=1)
+        diferenca |= np.array([
+            list(a) != list(b) if isinstance(b, list) else True
+            for a, b in zip(snapshot["datas_a_expirar"], completo["datas_a_expirar"])
+        ])
+
+        divergentes = snapshot[diferenca].join(completo[diferenca], rsuffix="_completo")
+        if not divergentes.empty:
+            logging.error(f"{len(divergentes)} of {len(snapshot)} users differ from the full recompute")
+        return divergentes.reset_index()
+
+def _chave(valor):
+    # Normaliza extra_info/cnpj para texto, sem o ".0" que o pandas adiciona a inteiros em colunas com nulos
+    if valor is None or pd.isna(valor):
+        return None
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return str(valor)
@@ -0,0 +1,228 @@
+import logging
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from utils import normalize_phones, cpfs_to_int
+
+OPT_OUT_PHONE = "opt_out_phone"
+OPT_OUT_CPF = "opt_out_cpf"
+INVALID_PHONE = "invalid_phone"
+FREQUENCY_CAP = "frequency_cap"
+
+# Respostas de get_chat_metadata que são falhas passageiras, não telefones inválidos
+TRANSIENT_METADATA_MESSAGES = {"Internal server error"}
+
+class SuppressionIndex:
+    """
+    Phones and CPFs that must not receive messages, kept as sorted int64 arrays (one .npy file per kind).
+
+    Membership is a binary search (np.searchsorted) over the arrays, so checking 1M candidates
+    takes milliseconds and a million suppressed numbers take 8 MB. Phones are compared as
+    normalize_phones values and CPFs as integers.
+
+        suppression = SuppressionIndex()
+        suppression.sync_opt_outs(WebhookStore())
+        suppression.sync_frequency_caps(SentMessageLedger(), max_messages=2, days=30)
+        campanha, contagem = suppression.filter(campanha)
+
+    Kinds:
+        opt_out_phone: phones that replied with an opt-out keyword
+        opt_out_cpf: CPFs that were sent to a phone that opted out
+        invalid_phone: phones that get_chat_metadata reported as not on WhatsApp
+        frequency_cap: CPFs that already got the maximum number of messages in the window
+
+    :param path: Folder of the .npy files
+    """
+    PHONE_KINDS = [OPT_OUT_PHONE, INVALID_PHONE]
+    CPF_KINDS = [OPT_OUT_CPF, FREQUENCY_CAP]
+    KINDS = PHONE_KINDS + CPF_KINDS
+
+    def __init__(self, path: str = "data/suppression/"):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._arrays = {}
+
+    def _caminho(self, kind):
+        return os.path.join(self.path, f"{kind}.npy")
+
+    def _validar_kind(self, kind):
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown suppression kind {kind}, expected one of {self.KINDS}")
+
+    def values(self, kind: str) -> np.ndarray:
+        """Sorted, unique int64 values of the kind (memory-mapped, read only)"""
+        self._validar_kind(kind)
+        if kind not in self._arrays:
+            caminho = self._caminho(kind)
+            self._arrays[kind] = np.load(caminho, mmap_mode="r") if os.path.exists(caminho) else np.empty(0, dtype="int64")
+        return self._arrays[kind]
+
+    def _salvar(self, kind, valores):
+        tmp_path = f"{self._caminho(kind)}.tmp.npy"
+        np.save(tmp_path, valores)
+        os.replace(tmp_path, self._caminho(kind))
+        self._arrays[kind] = valores
+
+    def _converter(self, kind, valores, manter_invalidos=False):
+        self._validar_kind(kind)
+        valores = valores if isinstance(valores, pd.Series) else pd.Series(valores)
+        if kind in self.PHONE_KINDS:
+            valores = normalize_phones(valores).to_numpy()
+        else:
+            valores = _cpfs_para_int(valores)
+        # Valores inválidos viram -1 e nunca são suprimidos
+        return valores if manter_invalidos else valores[valores >= 0]
+
+    def add(self, kind: str, values) -> int:
+        """
+        Adds phones or CPFs to the kind, merged with the ones already there.
+
+        :param values: Phones in any format accepted by normalize_phones, or CPFs
+        :return: Number of new values
+        """
+        self._validar_kind(kind)
+        atuais = self.values(kind)
+        novos = np.union1d(atuais, self._converter(kind, values))
+        self._salvar(kind, novos)
+        return len(novos) - len(atuais)
+
+    def replace(self, kind: str, values) -> int:
+        """Replaces the values of the kind, for the ones recomputed from scratch (frequency caps)"""
+        self._validar_kind(kind)
+        novos = np.unique(self._converter(kind, values))
+        self._salvar(kind, novos)
+        return len(novos)
+
+    def contains(self, kind: str, values) -> np.ndarray:
+        """Boolean array, True where the value is in the kind; int64 arrays are taken as already normalized"""
+        if not (isinstance(values, np.ndarray) and values.dtype == np.int64):
+            values = self._converter(kind, values, manter_invalidos=True)
+        ordem, ordenados = _ordenar(values)
+        pertence = np.empty(len(values), dtype=bool)
+        pertence[ordem] = _contem(self.values(kind), ordenados)
+        return pertence
+
+    def mask(self, df: pd.DataFrame, cpf_column: str = "cpf", phone_column: str = "telefone_contato", kinds=None):
+        """
+        Rows of df that are suppressed by any of the kinds.
+
+        :param kinds: Kinds to apply (all of them by default)
+        :return: Tuple with the boolean Series and a dict with the rows suppressed by each kind
+        """
+        kinds = self.KINDS if kinds is None else kinds
+        for kind in kinds:
+            self._validar_kind(kind)
+
+        # Cada coluna é ordenada uma vez e a ordem serve para todas as buscas dela
+        colunas = {}
+        if any(kind in self.PHONE_KINDS for kind in kinds):
+            colunas["phone"] = _ordenar(normalize_phones(df[phone_column]).to_numpy())
+        if any(kind in self.CPF_KINDS for kind in kinds):
+            colunas["cpf"] = _ordenar(_cpfs_para_int(df[cpf_column]))
+
+        suprimidos = np.zeros(len(df), dtype=bool)
+        contagem = {}
+        for kind in kinds:
+            ordem, ordenados = colunas["phone" if kind in self.PHONE_KINDS else "cpf"]
+            pertence = np.empty(len(df), dtype=bool)
+            pertence[ordem] = _contem(self.values(kind), ordenados)
+            contagem[kind] = int(pertence.sum())
+            suprimidos |= pertence
+
+        return pd.Series(suprimidos, index=df.index), contagem
+
+    def filter(self, df: pd.DataFrame, cpf_column: str = "cpf", phone_column: str = "telefone_contato", kinds=None):
+        """
+        Drops the suppressed rows of df.
+
+        :return: Tuple with the filtered DataFrame and a dict with the rows dropped by each kind
+        """
+        suprimidos, contagem = self.mask(df, cpf_column, phone_column, kinds)
+        logging.info(f"Suppressed {int(suprimidos.sum())} of {len(df)} rows: {contagem}")
+        return df[~suprimidos.to_numpy()], contagem
+
+    def sync_opt_outs(self, store=None) -> dict:
+        """
+        Adds the opt-outs recorded by the webhook receiver. The CPFs sent to those phones are
+        suppressed too, so the user stays out if the phone on file changes.
+
+        :param store: WebhookStore with the opt-outs; its file is searched for the send_queue table
+        :return: Number of new phones and CPFs
+        """
+        if store is None:
+            from webhooks import WebhookStore
+            store = WebhookStore()
+
+        phones = normalize_phones(store.opt_outs()["phone"])
+        novos = {OPT_OUT_PHONE: self.add(OPT_OUT_PHONE, phones), OPT_OUT_CPF: 0}
+
+        tem_fila = store.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'send_queue'"
+        ).fetchone()
+        if tem_fila and len(phones):
+            fila = pd.read_sql_query("SELECT DISTINCT cpf, telefone_contato FROM send_queue", store.conn)
+            enviados = _contem(self.values(OPT_OUT_PHONE), normalize_phones(fila["telefone_contato"]).to_numpy())
+            novos[OPT_OUT_CPF] = self.add(OPT_OUT_CPF, fila.loc[enviados, "cpf"])
+
+        return novos
+
+    def sync_invalid_phones(self, messages_sent: pd.DataFrame, phone_column: str = "telefone_contato",
+                            message_column: str = "message") -> int:
+        """
+        Adds the phones whose chat metadata came back with an error message (see enrich_chat_metadata).
+
+        Transient errors (TRANSIENT_METADATA_MESSAGES) are not considered invalid.
+
+        :return: Number of new phones
+        """
+        if message_column not in messages_sent.columns:
+            return 0
+        invalidos = messages_sent[
+            messages_sent[message_column].notna()
+            & ~messages_sent[message_column].isin(TRANSIENT_METADATA_MESSAGES)
+        ]
+        return self.add(INVALID_PHONE, invalidos[phone_column])
+
+    def sync_frequency_caps(self, ledger=None, max_messages: int = 1, days: int = 7, now=None) -> int:
+        """
+        Recomputes the CPFs that got max_messages or more messages, of any project, in the last days.
+
+        :param ledger: SentMessageLedger with the sends
+        :return: Number of capped CPFs
+        """
+        if ledger is None:
+            from ledger import SentMessageLedger
+            ledger = SentMessageLedger()
+
+        inicio = (pd.Timestamp.now() if now is None else pd.Timestamp(now)) - pd.Timedelta(days=days)
+        enviados = ledger.read(columns=[ledger.cpf_column, ledger.date_column], mes_inicio=inicio.strftime("%Y-%m"))
+        if enviados.empty:
+            return self.replace(FREQUENCY_CAP, [])
+
+        enviados = enviados[pd.to_datetime(enviados[ledger.date_column]) >= inicio]
+        cpfs, envios = np.unique(_cpfs_para_int(enviados[ledger.cpf_column]), return_counts=True)
+        return self.replace(FREQUENCY_CAP, cpfs[envios >= max_messages])
+
+    def counts(self) -> dict:
+        return {kind: len(self.values(kind)) for kind in self.KINDS}
+
+def _contem(ordenado: np.ndarray, valores: np.ndarray) -> np.ndarray:
+    """Binary search of each value in the sorted array; much faster when the values are sorted too"""
+    if len(ordenado) == 0:
+        return np.zeros(len(valores), dtype=bool)
+    posicoes = np.searchsorted(ordenado, valores)
+    posicoes[posicoes == len(ordenado)] = 0
+    return ordenado[posicoes] == valores
+
+def _ordenar(valores: np.ndarray):
+    ordem = np.argsort(valores)
+    return ordem, valores[ordem]
+
+def _cpfs_para_int(cpfs: pd.Series) -> np.ndarray:
+    """CPFs as int64 (-1 when not a number), through pyarrow when they are all numeric"""
+    try:
+        return pc.cast(pa.array(cpfs, from_pandas=True), pa.int64()).fill_null(-1).to_numpy()
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        return cpfs_to_int(cpfs).to_numpy()
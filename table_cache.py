@@ -0,0 +1,443 @@
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+import zlib
+from datetime import datetime
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from utils import SQLServer, queries
+
+MOVIMENTOS = "sl_movimentacao_conta_corrente"
+USUARIOS = "sl_usuarios"
+RESGATES = "sl_historico_resgate"
+EMPRESAS = "ss_empresas"
+
+class LoyaltyTableCache:
+    """
+    Local Parquet mirror of the Sempre Leitura tables, kept current with delta pulls.
+
+    Movements are append-only, so each sync only pulls the rows with id greater than the
+    highest id already cached and writes them as new files of their month partition. Users and
+    redemptions follow the movements: every redemption and every new user comes with a movement,
+    so a sync pulls again only the users with movements newer than the table's watermark (an id
+    of the movements) and rewrites only their hash buckets. Stores are reloaded when a new movement
+    points to a store that is not cached, or when their last full load is older than the sync's
+    max_age_minutes (stores_max_age_minutes if not given), so renamed stores are picked up too;
+    staleness() shows that load as full_sync_at. The first sync and refresh() load the tables
+    whole and swap them in atomically. Reads go through pyarrow datasets, so user, id and month
+    filters are pushed down to the files.
+
+        cache = LoyaltyTableCache(SQLServer().engine)
+        cache.sync(max_age_minutes=60)
+        sempreleitura = SempreLeitura(cache=cache)
+
+    :param engine: Engine of the source database (only needed to sync)
+    :param path: Root folder of the cache
+    :param incremental: {table: column} with the increasing column (id or data_hora) used in the
+        delta pulls; tables left out are reloaded whole
+    :param stores_max_age_minutes: Age of the last full load of the stores after which a sync
+        without max_age_minutes reloads them
+    """
+    TABELAS = [MOVIMENTOS, USUARIOS, RESGATES, EMPRESAS]
+    INCREMENTAL = {MOVIMENTOS: "id"}
+    # Tabelas puxadas de novo só para os usuários com movimentos novos
+    POR_USUARIO = [USUARIOS, RESGATES]
+    # Colunas usadas para particionar: os movimentos pelo mês de data_hora e as tabelas por usuário
+    # por um hash do usuário, para uma sincronização reescrever só os buckets dos usuários alterados
+    PARTICOES = {MOVIMENTOS: "mes", USUARIOS: "bucket", RESGATES: "bucket"}
+    BUCKETS = 32
+    # Ordem das linhas dentro dos arquivos, para as estatísticas dos row groups filtrarem por usuário
+    ORDENACAO = {MOVIMENTOS: "usuario", USUARIOS: "usuario", RESGATES: "usuario"}
+
+    def __init__(self, engine=None, path: str = "data/table_cache/", incremental: dict = None,
+                 stores_max_age_minutes: float = 24 * 60):
+        self.engine = engine
+        self.path = path
+        self.incremental = self.INCREMENTAL | (incremental or {})
+        self.stores_max_age_minutes = stores_max_age_minutes
+        os.makedirs(path, exist_ok=True)
+
+        for tabela in self.TABELAS:
+            coluna = self.incremental.get(tabela)
+            if f"cache_{tabela}" not in queries:
+                queries.register(f"cache_{tabela}", _sql_tabela(tabela))
+            if coluna and f"cache_{tabela}_{coluna}" not in queries:
+                queries.register(f"cache_{tabela}_{coluna}", _sql_tabela(tabela, coluna))
+            if tabela in self.POR_USUARIO and f"cache_{tabela}_usuarios" not in queries:
+                queries.register(
+                    f"cache_{tabela}_usuarios", f"SELECT * FROM {tabela} {{nolock}} WHERE usuario IN :usuarios",
+                    expanding=["usuarios"]
+                )
+
+    def _caminho(self, tabela):
+        return os.path.join(self.path, tabela)
+
+    def _metadata_path(self):
+        return os.path.join(self.path, "_sync.json")
+
+    def metadata(self) -> dict:
+        if not os.path.exists(self._metadata_path()):
+            return {}
+        with open(self._metadata_path()) as f:
+            return json.load(f)
+
+    def _salvar_metadata(self, tabela, **valores):
+        metadata = self.metadata()
+        metadata[tabela] = metadata.get(tabela, {}) | valores
+
+        tmp_path = f"{self._metadata_path()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(metadata, f, indent=2, default=str)
+        os.replace(tmp_path, self._metadata_path())
+
+    def _existe(self, tabela):
+        caminho = self._caminho(tabela)
+        return os.path.isdir(caminho) and any(
+            name.endswith(".parquet") for _, _, files in os.walk(caminho) for name in files
+        )
+
+    def dataset(self, tabela):
+        return ds.dataset(self._caminho(tabela), format="parquet", partitioning="hive")
+
+    def sync(self, tabelas=None, force: bool = False, max_age_minutes: float = None):
+        """
+        Brings the cached tables up to date.
+
+        :param tabelas: Tables to sync (all of them if None)
+        :param force: Reloads the tables whole, including the incremental ones
+        :param max_age_minutes: Skips the tables synced less than this many minutes ago (movements
+            first, so the tables that follow them see the new ones), and reloads the stores whole
+            when their last full load is older than that
+        :return: {table: rows pulled}
+        """
+        if self.engine is None:
+            raise ValueError("The cache needs a database engine to sync")
+
+        metadata = self.metadata()
+        puxadas = {}
+        for tabela in tabelas if tabelas else self.TABELAS:
+            sincronizado_em = metadata.get(tabela, {}).get("synced_at")
+            if not force and max_age_minutes is not None and sincronizado_em is not None:
+                if _idade_minutos(sincronizado_em) < max_age_minutes:
+                    continue
+
+            inicio = time.perf_counter()
+            coluna = self.incremental.get(tabela)
+            watermark = metadata.get(tabela, {}).get("watermark")
+            if force or not self._existe(tabela):
+                puxadas[tabela], modo = self._sync_completo(tabela, coluna), "full"
+            elif coluna:
+                puxadas[tabela], modo = self._sync_delta(tabela, coluna, watermark), "delta"
+            elif tabela in self.POR_USUARIO and watermark is not None and self._particionado(tabela):
+                puxadas[tabela], modo = self._sync_usuarios(tabela, watermark), "users"
+            elif tabela == EMPRESAS and watermark is not None:
+                idade_maxima = max_age_minutes if max_age_minutes is not None else self.stores_max_age_minutes
+                puxadas[tabela], modo = self._sync_empresas(watermark, idade_maxima), "on demand"
+            else:
+                # Caches anteriores aos buckets, ou carregados antes dos movimentos
+                puxadas[tabela], modo = self._sync_completo(tabela, coluna), "full"
+
+            logging.info(f"{tabela}: {puxadas[tabela]} rows pulled ({modo}) in {time.perf_counter() - inicio:.1f}s")
+
+        return puxadas
+
+    def refresh(self, tabelas=None):
+        """Reloads the tables whole, discarding what is cached"""
+        return self.sync(tabelas, force=True)
+
+    def _ler_origem(self, query, params=None):
+        return SQLServer(engine=self.engine).pandas_read_sql_iter(query, params)
+
+    def _sync_delta(self, tabela, coluna, watermark):
+        if watermark is None:
+            watermark = pc.max(self.dataset(tabela).to_table(columns=[coluna]).column(coluna)).as_py()
+
+        schema = self.dataset(tabela).schema
+        linhas = 0
+        for chunk in self._ler_origem(f"cache_{tabela}_{coluna}", {"watermark": watermark}):
+            if chunk.empty:
+                continue
+            self._escrever(tabela, chunk, self._caminho(tabela), schema)
+            watermark = chunk[coluna].max()
+            linhas += len(chunk)
+
+        metadata = self.metadata().get(tabela, {})
+        self._salvar_metadata(
+            tabela,
+            synced_at=datetime.now().isoformat(timespec="seconds"),
+            mode="delta",
+            watermark=_json(watermark),
+            last_pull_rows=linhas,
+            rows=metadata.get("rows", 0) + linhas,
+        )
+        return linhas
+
+    def _ultimo_movimento(self):
+        if not self._existe(MOVIMENTOS):
+            return None
+        return pc.max(self.dataset(MOVIMENTOS).to_table(columns=["id"]).column("id")).as_py()
+
+    def _particionado(self, tabela):
+        return self.PARTICOES[tabela] in self.dataset(tabela).schema.names
+
+    def _movimentos_apos(self, watermark, coluna):
+        """Distinct values of coluna in the cached movements with id greater than watermark, and their highest id"""
+        novos = self.read(MOVIMENTOS, ["id", coluna], ds.field("id") > watermark)
+        ultimo = _json(novos["id"].max()) if not novos.empty else watermark
+        return novos[coluna].dropna().astype(str).unique().tolist(), ultimo
+
+    def _sync_usuarios(self, tabela, watermark, chunk_size: int = 1000):
+        usuarios, ultimo = self._movimentos_apos(watermark, "usuario")
+
+        novas = [
+            chunk
+            for i in range(0, len(usuarios), chunk_size)
+            for chunk in self._ler_origem(f"cache_{tabela}_usuarios", {"usuarios": usuarios[i:i + chunk_size]})
+            if not chunk.empty
+        ]
+        novas = pd.concat(novas, ignore_index=True) if novas else pd.DataFrame(columns=["usuario"])
+        removidas = self._substituir_usuarios(tabela, usuarios, novas) if usuarios else 0
+
+        metadata = self.metadata().get(tabela, {})
+        self._salvar_metadata(
+            tabela,
+            synced_at=datetime.now().isoformat(timespec="seconds"),
+            mode="users",
+            watermark=ultimo,
+            last_pull_rows=len(novas),
+            rows=metadata.get("rows", 0) - removidas + len(novas),
+        )
+        return len(novas)
+
+    def _substituir_usuarios(self, tabela, usuarios, novas):
+        """Rewrites the buckets of usuarios with their rows in novas; returns the number of rows removed"""
+        caminho = self._caminho(tabela)
+        schema = self.dataset(tabela).schema
+        novas = novas.assign(bucket=_bucket(novas["usuario"], self.BUCKETS))
+        tmp = f"{caminho}.tmp-{uuid.uuid4().hex}"
+
+        removidas = 0
+        for bucket, usuarios_bucket in pd.Series(usuarios).groupby(_bucket(pd.Series(usuarios), self.BUCKETS)):
+            destino = os.path.join(caminho, f"bucket={bucket}")
+            atuais = (
+                ds.dataset(destino, format="parquet").to_table().to_pandas()
+                if os.path.isdir(destino) else pd.DataFrame(columns=["usuario"])
+            )
+            mantidas = atuais[~atuais["usuario"].astype(str).isin(usuarios_bucket)]
+            removidas += len(atuais) - len(mantidas)
+
+            partes = [df for df in [mantidas.assign(bucket=bucket), novas[novas["bucket"] == bucket]] if not df.empty]
+            if partes:
+                self._escrever(tabela, pd.concat(partes, ignore_index=True), tmp, schema)
+
+            # Mesma troca de pastas do _sync_completo, um bucket de cada vez
+            antigo = f"{destino}.old-{uuid.uuid4().hex}"
+            if os.path.isdir(destino):
+                os.replace(destino, antigo)
+            if partes:
+                os.replace(os.path.join(tmp, f"bucket={bucket}"), destino)
+            shutil.rmtree(antigo, ignore_errors=True)
+
+        shutil.rmtree(tmp, ignore_errors=True)
+        return removidas
+
+    def _sync_empresas(self, watermark, max_age_minutes):
+        # Uma loja renomeada não gera movimento de loja nova: a tabela é recarregada também pela idade
+        carregada_em = self.metadata().get(EMPRESAS, {}).get("full_sync_at")
+        if carregada_em is None or _idade_minutos(carregada_em) >= max_age_minutes:
+            return self._sync_completo(EMPRESAS, None)
+
+        cnpjs, ultimo = self._movimentos_apos(watermark, "cnpj_empresa")
+        conhecidos = set(self.read(EMPRESAS, ["cnpj"])["cnpj"].astype(str))
+        if any(cnpj not in conhecidos for cnpj in cnpjs):
+            return self._sync_completo(EMPRESAS, None)
+
+        self._salvar_metadata(
+            EMPRESAS, synced_at=datetime.now().isoformat(timespec="seconds"), mode="on demand",
+            watermark=ultimo, last_pull_rows=0
+        )
+        return 0
+
+    def _sync_completo(self, tabela, coluna):
+        # Escreve numa pasta temporária e troca no fim, para leituras concorrentes nunca verem a tabela pela metade
+        destino = self._caminho(tabela)
+        tmp = f"{destino}.tmp-{uuid.uuid4().hex}"
+
+        linhas, schema, watermark = 0, None, None
+        if coluna is None:
+            # As tabelas que seguem os movimentos ficam em dia até o último movimento já em cache
+            watermark = self._ultimo_movimento()
+        for chunk in self._ler_origem(f"cache_{tabela}"):
+            if chunk.empty:
+                continue
+            schema = self._escrever(tabela, chunk, tmp, schema)
+            if coluna:
+                watermark = chunk[coluna].max() if watermark is None else max(watermark, chunk[coluna].max())
+            linhas += len(chunk)
+
+        antigo = f"{destino}.old-{uuid.uuid4().hex}"
+        if os.path.isdir(destino):
+            os.replace(destino, antigo)
+        if os.path.isdir(tmp):
+            os.replace(tmp, destino)
+        shutil.rmtree(antigo, ignore_errors=True)
+
+        self._salvar_metadata(
+            tabela,
+            synced_at=datetime.now().isoformat(timespec="seconds"),
+            full_sync_at=datetime.now().isoformat(timespec="seconds"),
+            mode="full",
+            watermark=_json(watermark),
+            last_pull_rows=linhas,
+            rows=linhas,
+        )
+        return linhas
+
+    def _escrever(self, tabela, df, caminho, schema=None):
+        particao = self.PARTICOES.get(tabela)
+        if particao == "mes":
+            df = df.assign(mes=pd.to_datetime(df["data_hora"]).dt.strftime("%Y-%m"))
+        elif particao == "bucket" and "bucket" not in df.columns:
+            df = df.assign(bucket=_bucket(df["usuario"], self.BUCKETS))
+        if tabela in self.ORDENACAO:
+            df = df.sort_values(self.ORDENACAO[tabela], kind="stable")
+
+        # Os arquivos novos seguem o schema dos existentes (um chunk só com nulos não vira outra coluna)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if schema is not None:
+            table = table.select(schema.names).cast(schema)
+
+        pq.write_to_dataset(
+            table,
+            root_path=caminho,
+            partition_cols=[particao] if particao else None,
+            basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet"
+        )
+        return schema if schema is not None else table.schema
+
+    def staleness(self) -> pd.DataFrame:
+        """
+        When each table was last synced, how old that is, its watermark and row count.
+
+        full_sync_at is the last time the table was loaded whole: rows changed in place at the
+        source (a renamed store, for example) are only as fresh as that load.
+        """
+        metadata = self.metadata()
+        return pd.DataFrame([
+            {
+                "tabela": tabela,
+                "synced_at": metadata.get(tabela, {}).get("synced_at"),
+                "age_minutes": _idade_minutos(metadata[tabela]["synced_at"]) if tabela in metadata else None,
+                "full_sync_at": metadata.get(tabela, {}).get("full_sync_at"),
+                "mode": metadata.get(tabela, {}).get("mode"),
+                "watermark": metadata.get(tabela, {}).get("watermark"),
+                "rows": metadata.get(tabela, {}).get("rows"),
+            }
+            for tabela in self.TABELAS
+        ])
+
+    def read(self, tabela, columns=None, filter=None) -> pd.DataFrame:
+        """Reads a cached table, pushing the columns and the pyarrow filter down to the files"""
+        if not self._existe(tabela):
+            raise FileNotFoundError(f"{tabela} is not cached yet, run sync() first")
+        df = self.dataset(tabela).to_table(columns=columns, filter=filter).to_pandas()
+        particao = self.PARTICOES.get(tabela)
+        return df.drop(columns=[particao]) if columns is None and particao else df
+
+    def movimentos_conta_corrente(self, usuarios) -> pd.DataFrame:
+        """Same result as the movimentos_conta_corrente_bulk query, read from the cache"""
+        usuarios = list(dict.fromkeys(str(usuario) for usuario in usuarios))
+        filtro = ds.field("usuario").isin(usuarios)
+
+        movimentos = self.read(MOVIMENTOS, filter=filtro)
+        colunas = movimentos.columns.tolist()
+
+        movimentos = (
+            movimentos
+                .merge(self.read(USUARIOS, ["usuario", "nome_cliente", "email"], filtro), on="usuario")
+                .merge(
+                    self.read(EMPRESAS, ["cnpj", "descricao"]).rename(columns={"cnpj": "cnpj_empresa", "descricao": "nome_loja"}),
+                    on="cnpj_empresa"
+                )
+                .merge(
+                    self.resgates_agrupados(usuarios).rename(columns={"cnpj_empresa_credito": "cnpj_empresa"}),
+                    on=["usuario", "extra_info", "cnpj_empresa"],
+                    how="left"
+                )
+                .assign(
+                    data_cupom_mod=lambda x: x["data_cupom"].fillna(_data_hora_texto(x["data_hora"])),
+                    valor_resgatado=lambda x: x["valor_resgatado"].fillna(0)
+                )
+                .sort_values(["usuario", "data_cupom_mod", "id"])
+                .reset_index(drop=True)
+        )
+        return movimentos[colunas + ["nome_cliente", "nome_loja", "data_cupom_mod", "valor_resgatado", "email"]]
+
+    def movimentos_desde(self, ultimo_id: int = 0) -> pd.DataFrame:
+        """Same result as the movimentos_desde query, read from the cache"""
+        movimentos = self.read(
+            MOVIMENTOS,
+            ["id", "usuario", "data_hora", "valor", "tipo", "origem", "extra_info", "cnpj_empresa", "data_cupom"],
+            ds.field("id") > ultimo_id
+        )
+        usuarios = self.read(USUARIOS, ["usuario"], ds.field("usuario").isin(movimentos["usuario"].unique()))
+        empresas = self.read(EMPRESAS, ["cnpj"])
+
+        movimentos = movimentos[
+            movimentos["usuario"].isin(usuarios["usuario"]) & movimentos["cnpj_empresa"].isin(empresas["cnpj"])
+        ]
+        return (
+            movimentos
+                .assign(data_cupom_mod=movimentos["data_cupom"].fillna(_data_hora_texto(movimentos["data_hora"])))
+                .drop(columns=["data_cupom"])
+                .sort_values("id")
+                .reset_index(drop=True)
+        )
+
+    def resgates_agrupados(self, usuarios) -> pd.DataFrame:
+        """Same result as the resgates_agrupados query, read from the cache"""
+        usuarios = list(dict.fromkeys(str(usuario) for usuario in usuarios))
+        resgates = self.read(
+            RESGATES, ["usuario", "extra_info", "cnpj_empresa_credito", "valor_resgate"],
+            ds.field("usuario").isin(usuarios)
+        )
+        return (
+            resgates
+                .assign(valor_resgatado=resgates["valor_resgate"].fillna(0))
+                .groupby(["usuario", "extra_info", "cnpj_empresa_credito"], as_index=False)["valor_resgatado"]
+                .sum()
+        )
+
+def _sql_tabela(tabela, coluna=None):
+    fonte = "{tabela_empresas}" if tabela == EMPRESAS else tabela
+    if coluna is None:
+        return f"SELECT * FROM {fonte} {{nolock}}"
+    return f"SELECT * FROM {fonte} {{nolock}} WHERE {coluna} > :watermark ORDER BY {coluna}"
+
+def _bucket(usuarios: pd.Series, buckets: int) -> pd.Series:
+    # crc32 é estável entre execuções e versões, ao contrário do hash() do Python
+    return pd.Series(
+        [zlib.crc32(str(usuario).encode()) % buckets for usuario in usuarios], index=usuarios.index, dtype="int64"
+    )
+
+def _data_hora_texto(data_hora: pd.Series) -> pd.Series:
+    # Igual ao CONVERT(VARCHAR(10), data_hora, 120) das queries: a data como YYYY-MM-DD
+    if pd.api.types.is_datetime64_any_dtype(data_hora):
+        return data_hora.dt.strftime("%Y-%m-%d")
+    return data_hora.astype(str).str[:10]
+
+def _idade_minutos(quando: str) -> float:
+    return (datetime.now() - datetime.fromisoformat(quando)).total_seconds() / 60
+
+def _json(valor):
+    if valor is None or pd.isna(valor):
+        return None
+    if isinstance(valor, (int, float)):
+        return valor
+    return valor.item() if hasattr(valor, "item") else str(valor)
@@ -0,0 +1,13 @@
+import os
+import sys
+import pytest
+
+# Os módulos ficam na raiz do repositório, sem pacote
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def sqlite_engine(tmp_path):
+    """SQLite stand-in of the Sempre Leitura tables, with 300 users and 8 movements each"""
+    from benchmarks.synthetic import carregar_sqlite
+
+    return carregar_sqlite(str(tmp_path / "sempre_leitura.db"), 300, 8)
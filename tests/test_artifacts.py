@@ -0,0 +1,78 @@
+import pandas as pd
+import pytest
+
+import artifacts
+from artifacts import write_campaign, read_campaign, campaign_metadata, read_report, export_excel
+
+@pytest.fixture
+def campanha():
+    return pd.DataFrame({
+        "usuario": ["11111111111", "22222222222"],
+        "cpf": ["11111111111", "22222222222"],
+        "nome_cliente": ["ANA SILVA", None],
+        "telefone_contato": ["5511999999999", "5511988888888"],
+        "mensagem": ["Olá Ana", "Olá"],
+        "Saldo": [2500.0, 3100],
+        "datas_a_expirar": [[pd.Timestamp("2025-03-10"), pd.Timestamp("2025-03-20")], []],
+        "data_min_a_expirar": [pd.Timestamp("2025-03-10"), pd.NaT],
+        "filtro_pontuacao_data_inicio": pd.Timestamp("2024-03-17 08:30"),
+        "coluna_fora_do_schema": 1,
+    })
+
+def test_campaign_round_trip(campanha, tmp_path):
+    path = write_campaign(campanha, str(tmp_path / "campanhas" / "teste.arrow"), "teste")
+
+    lida = read_campaign(path)
+
+    assert list(lida.columns) == [field.name for field in artifacts.CAMPAIGN_SCHEMA]
+    assert lida["cpf"].tolist() == campanha["cpf"].tolist()
+    assert lida["Saldo"].tolist() == [2500.0, 3100.0]
+    assert [list(map(pd.Timestamp, datas)) for datas in lida["datas_a_expirar"]] == campanha["datas_a_expirar"].tolist()
+    assert lida["data_min_a_expirar"].iloc[0] == pd.Timestamp("2025-03-10")
+    assert pd.isna(lida["data_min_a_expirar"].iloc[1])
+    assert (lida["filtro_pontuacao_data_inicio"] == pd.Timestamp("2024-03-17 08:30")).all()
+    # Colunas opcionais ausentes ficam nulas
+    assert lida["data_max_a_expirar"].isna().all()
+    assert read_campaign(path, columns=["cpf", "mensagem"]).columns.tolist() == ["cpf", "mensagem"]
+    assert campaign_metadata(path)["nome_projeto"] == "teste"
+
+def test_missing_required_column(campanha, tmp_path):
+    with pytest.raises(ValueError, match="missing the column mensagem"):
+        write_campaign(campanha.drop(columns=["mensagem"]), str(tmp_path / "teste.arrow"), "teste")
+
+def test_null_in_required_column(campanha, tmp_path):
+    with pytest.raises(ValueError, match="telefone_contato has 1 nulls"):
+        write_campaign(campanha.assign(telefone_contato=["5511999999999", None]), str(tmp_path / "teste.arrow"), "teste")
+
+def test_schema_version_mismatch(campanha, tmp_path, monkeypatch):
+    monkeypatch.setattr(artifacts, "CAMPAIGN_SCHEMA_VERSION", artifacts.CAMPAIGN_SCHEMA_VERSION + 1)
+    path = write_campaign(campanha, str(tmp_path / "teste.arrow"), "teste")
+    monkeypatch.undo()
+
+    with pytest.raises(ValueError, match="schema version"):
+        read_campaign(path)
+
+def test_read_report_cache(tmp_path, monkeypatch):
+    relatorio = str(tmp_path / "resgates.xlsx")
+    export_excel(pd.DataFrame({"Cliente": ["11111111111", "22222222222"], "Pontos": ["1.000,50", "200"]}), relatorio, background=False)
+    cache_dir = str(tmp_path / "cache")
+
+    leituras = []
+    read_excel = pd.read_excel
+
+    def contar(*args, **kwargs):
+        leituras.append(kwargs)
+        return read_excel(*args, **kwargs)
+
+    monkeypatch.setattr(pd, "read_excel", contar)
+
+    primeira = read_report(relatorio, cache_dir=cache_dir, dtype={"Cliente": str})
+    segunda = read_report(relatorio, cache_dir=cache_dir, dtype={"Cliente": str})
+    assert len(leituras) == 1
+    pd.testing.assert_frame_equal(segunda, primeira)
+    assert primeira["Cliente"].tolist() == ["11111111111", "22222222222"]
+
+    # Outros argumentos de leitura não aproveitam a conversão anterior
+    sem_dtype = read_report(relatorio, cache_dir=cache_dir)
+    assert len(leituras) == 2
+    assert sem_dtype["Cliente"].tolist() == [11111111111, 22222222222]
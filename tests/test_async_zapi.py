@@ -0,0 +1,86 @@
+import asyncio
+import time
+import aiohttp
+import pytest
+from async_zapi import AsyncZAPIClient
+from benchmarks.stub_zapi import StubZAPIServer
+
+@pytest.fixture
+def stub():
+    with StubZAPIServer(latency=0.01) as stub:
+        yield stub
+
+def _client(stub, **kwargs):
+    return AsyncZAPIClient("instancia", "token", "client-token", base_url=stub.base_url, **kwargs)
+
+async def _coletar(client, mensagens, **kwargs):
+    async with client:
+        return [resultado async for resultado in client.send_text_many(mensagens, **kwargs)]
+
+def test_send_text_many_sends_every_message(stub):
+    mensagens = [(f"55119{i:08d}", f"Mensagem {i}") for i in range(200)]
+
+    resultados = asyncio.run(_coletar(_client(stub, max_concurrency=8, requests_per_second=10_000), mensagens))
+
+    assert sorted(phone for phone, _ in resultados) == sorted(phone for phone, _ in mensagens)
+    assert all("messageId" in resultado for _, resultado in resultados)
+    assert len(stub.sent_messages) == 200
+    assert stub.max_in_flight <= 8
+
+def test_send_text_many_pulls_messages_as_it_goes(stub):
+    lidas = 0
+
+    def mensagens():
+        nonlocal lidas
+        for i in range(100_000):
+            lidas += 1
+            yield f"55119{i:08d}", "Mensagem"
+
+    async def primeiros(n):
+        async with _client(stub, max_concurrency=4, requests_per_second=10_000) as client:
+            recebidos = 0
+            async for _ in client.send_text_many(mensagens()):
+                recebidos += 1
+                if recebidos == n:
+                    break
+        return recebidos
+
+    assert asyncio.run(primeiros(10)) == 10
+    # Só o que os workers e a fila de resultados comportam foi lido além do consumido
+    assert lidas <= 10 + 4 + 4 + 4
+    assert len(stub.sent_messages) < 30
+
+def test_send_text_many_returns_errors_per_message(stub):
+    stub.error_rate = 1.0
+
+    resultados = asyncio.run(_coletar(_client(stub, requests_per_second=10_000), [("5511900000001", "a"), ("5511900000002", "b")]))
+
+    assert len(resultados) == 2
+    assert all(isinstance(resultado, aiohttp.ClientResponseError) and resultado.status == 500 for _, resultado in resultados)
+
+def test_send_text_many_raises_iterable_errors(stub):
+    def mensagens():
+        yield "5511900000001", "a"
+        raise ValueError("broken source")
+
+    with pytest.raises(ValueError, match="broken source"):
+        asyncio.run(_coletar(_client(stub, requests_per_second=10_000), mensagens()))
+
+def test_rate_limit(stub):
+    mensagens = [(f"55119{i:08d}", "Mensagem") for i in range(60)]
+
+    inicio = time.perf_counter()
+    asyncio.run(_coletar(_client(stub, max_concurrency=20, requests_per_second=40), mensagens))
+
+    # 40 de rajada e os outros 20 a 40 por segundo
+    assert time.perf_counter() - inicio >= 0.45
+
+def test_other_endpoints(stub):
+    async def chamar():
+        async with _client(stub) as client:
+            return await client.get_chat_metadata("5511900000001"), await client.retrieve_chats(), \
+                await client.read_message("msg1", "5511900000001")
+
+    metadata, chats, _ = asyncio.run(chamar())
+    assert metadata["phone"] == "5511900000001"
+    assert chats == []
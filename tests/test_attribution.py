@@ -0,0 +1,107 @@
+import pandas as pd
+import pytest
+
+from attribution import attribute_conversions, SEM_RESGATE
+from ledger import SentMessageLedger
+
+ENVIO = pd.Timestamp("2025-03-01 10:00")
+
+def _envios(linhas):
+    return pd.DataFrame(linhas, columns=["usuario", "nome_projeto", "variante", "data_envio"])
+
+def _resgates(linhas):
+    return pd.DataFrame(linhas, columns=["usuario", "data_hora", "cnpj_empresa", "valor"])
+
+def _atribuir(envios, resgates, tmp_path, **kwargs):
+    return attribute_conversions(envios, resgates, window_days=7, buckets=4, workdir=str(tmp_path / "atribuicao"), **kwargs)
+
+def _por_loja(resultado):
+    return resultado.set_index("loja")[["envios", "conversoes", "pontos_resgatados"]].to_dict("index")
+
+@pytest.mark.parametrize("resgate, convertido", [
+    (ENVIO - pd.Timedelta(seconds=1), False),
+    (ENVIO, True),
+    (ENVIO + pd.Timedelta(days=7), True),
+    (ENVIO + pd.Timedelta(days=7, seconds=1), False),
+])
+def test_window(tmp_path, resgate, convertido):
+    resultado = _atribuir(
+        _envios([("11111111111", "aviso", "a", ENVIO)]),
+        _resgates([("11111111111", resgate, "loja1", 500)]),
+        tmp_path
+    )
+
+    loja = "loja1" if convertido else SEM_RESGATE
+    assert _por_loja(resultado) == {loja: {"envios": 1, "conversoes": int(convertido), "pontos_resgatados": 500.0 * convertido}}
+
+def test_first_redemption_after_the_send_counts(tmp_path):
+    resultado = _atribuir(
+        _envios([("11111111111", "aviso", "a", ENVIO)]),
+        _resgates([
+            ("11111111111", ENVIO - pd.Timedelta(days=1), "loja1", 100),
+            ("11111111111", ENVIO + pd.Timedelta(days=2), "loja2", 200),
+            ("11111111111", ENVIO + pd.Timedelta(days=3), "loja1", 300),
+        ]),
+        tmp_path
+    )
+
+    assert _por_loja(resultado) == {"loja2": {"envios": 1, "conversoes": 1, "pontos_resgatados": 200.0}}
+    assert resultado["dias_ate_resgate"].tolist() == [2.0]
+
+def test_two_sends_share_one_redemption(tmp_path):
+    # Cada envio conta a primeira conversão depois dele, mesmo que outro envio já a tenha contado
+    resultado = _atribuir(
+        _envios([
+            ("11111111111", "aviso", "a", ENVIO),
+            ("11111111111", "lembrete", "a", ENVIO + pd.Timedelta(days=1)),
+        ]),
+        _resgates([("11111111111", ENVIO + pd.Timedelta(days=2), "loja1", 500)]),
+        tmp_path
+    )
+
+    assert resultado.set_index("nome_projeto")[["conversoes", "pontos_resgatados", "dias_ate_resgate"]].to_dict("index") == {
+        "aviso": {"conversoes": 1, "pontos_resgatados": 500.0, "dias_ate_resgate": 2.0},
+        "lembrete": {"conversoes": 1, "pontos_resgatados": 500.0, "dias_ate_resgate": 1.0},
+    }
+
+@pytest.fixture
+def campanha():
+    envios = _envios([
+        (f"{i:011d}", "aviso", "curta" if i % 2 else "longa", ENVIO + pd.Timedelta(hours=i))
+        for i in range(1, 41)
+    ])
+    resgates = _resgates([
+        (f"{i:011d}", ENVIO + pd.Timedelta(hours=i, days=i % 10), f"loja{i % 3}", 100 * i)
+        for i in range(1, 41) if i % 4
+    ])
+    return envios, resgates
+
+def test_grouped_by_variant_and_store(campanha, tmp_path):
+    envios, resgates = campanha
+
+    resultado = _atribuir(envios, resgates, tmp_path, variant_column="variante")
+
+    # O mesmo cálculo, envio a envio
+    unido = envios.merge(resgates, on="usuario", how="left")
+    unido = unido[(unido["data_hora"] - unido["data_envio"]) <= pd.Timedelta(days=7)]
+    esperado = unido.groupby(["variante", "cnpj_empresa"]).agg(conversoes=("valor", "size"), pontos_resgatados=("valor", "sum"))
+    sem_resgate = envios.groupby("variante").size() - unido.groupby("variante").size()
+
+    convertidos = resultado[resultado["loja"] != SEM_RESGATE].set_index(["variante", "loja"])
+    assert convertidos["conversoes"].to_dict() == esperado["conversoes"].to_dict()
+    assert convertidos["pontos_resgatados"].to_dict() == esperado["pontos_resgatados"].astype(float).to_dict()
+    assert resultado[resultado["loja"] == SEM_RESGATE].set_index("variante")["envios"].to_dict() == sem_resgate.to_dict()
+    taxas = resultado.groupby("variante")["taxa_conversao"].sum()
+    assert taxas.to_dict() == pytest.approx((unido.groupby("variante").size() / envios.groupby("variante").size()).to_dict())
+
+def test_dataframe_and_parquet_give_the_same_result(campanha, tmp_path):
+    envios, resgates = campanha
+    ledger = SentMessageLedger(str(tmp_path / "ledger"), legacy_folder=None)
+    ledger.append(envios)
+    resgates_path = str(tmp_path / "resgates.parquet")
+    resgates.to_parquet(resgates_path)
+
+    do_dataframe = _atribuir(envios, resgates, tmp_path, variant_column="variante")
+    do_parquet = _atribuir(ledger.path, resgates_path, tmp_path, variant_column="variante")
+
+    pd.testing.assert_frame_equal(do_parquet, do_dataframe)
@@ -0,0 +1,43 @@
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine
+from utils import SempreLeitura
+from benchmarks.synthetic import gerar_movimentos_saldo
+
+TOTALIZADORES = ["Créditos", "Débitos", "Saldo", "Créditos Expirados", "Créditos a Expirar"]
+
+@pytest.fixture
+def sempreleitura():
+    return SempreLeitura(engine=create_engine("sqlite://"))
+
+@pytest.mark.parametrize("seed", range(5))
+def test_calculate_balances_matches_calculate_balance(sempreleitura, seed):
+    data_limite_expiracao, _ = sempreleitura.datas_limite()
+    movimentos = gerar_movimentos_saldo(3000, 150, data_limite_expiracao, seed=seed)
+
+    saldos = sempreleitura.calculate_balances(movimentos).set_index("usuario")
+
+    assert len(saldos) == movimentos["usuario"].nunique()
+    for usuario, df in movimentos.groupby("usuario"):
+        esperado = sempreleitura.calculate_balance(df)
+        linha = saldos.loc[usuario]
+
+        for coluna in TOTALIZADORES:
+            assert linha[coluna] == pytest.approx(esperado[coluna]), (usuario, coluna)
+        assert sorted(pd.Timestamp(data) for data in linha["datas_a_expirar"]) == \
+            sorted(pd.Timestamp(data) for data in esperado["datas_a_expirar"]), usuario
+
+def test_data_covers_the_edge_cases(sempreleitura):
+    data_limite_expiracao, _ = sempreleitura.datas_limite()
+    movimentos = gerar_movimentos_saldo(3000, 150, data_limite_expiracao, seed=0)
+    saldos = sempreleitura.calculate_balances(movimentos)
+
+    assert (saldos["Créditos"] == 0).any()
+    assert (saldos["Créditos Expirados"] > 0).any()
+    assert (saldos["Créditos a Expirar"] > 0).any()
+    assert ((movimentos["valor_resgatado"] > 0) & (movimentos["valor_resgatado"] < movimentos["valor"])).any()
+
+def test_calculate_balances_without_movements(sempreleitura):
+    saldos = sempreleitura.calculate_balances(pd.DataFrame())
+    assert saldos.empty
+    assert list(saldos.columns) == ["usuario", "datas_a_expirar"] + TOTALIZADORES
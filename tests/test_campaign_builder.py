@@ -0,0 +1,85 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import pytest
+
+import campaign_builder
+from utils import SempreLeitura, get_engine, connections_opened
+from ledger import SentMessageLedger
+from artifacts import write_campaign, read_campaign
+from campaign_builder import build_campaign, preparar_mensagens_pontos_a_expirar
+from benchmarks.synthetic import DATA_REFERENCIA
+
+def _mensagens(df):
+    return df.sort_values("cpf")[["cpf", "telefone_contato", "mensagem"]].reset_index(drop=True)
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_build_campaign_matches_single_process(sqlite_engine, workers):
+    candidatos = pd.read_sql_query("SELECT * FROM sl_usuarios", sqlite_engine)
+    sempreleitura = SempreLeitura(engine=sqlite_engine, data_referencia=DATA_REFERENCIA)
+    saldos = sempreleitura.calculate_balances(
+        sempreleitura.getMovimentosContaCorrenteBulk(candidatos["usuario"].tolist())
+    )
+    esperado = preparar_mensagens_pontos_a_expirar(saldos, candidatos)
+
+    mensagens, erros = build_campaign(candidatos, workers=workers, shard_size=70, engine_url=str(sqlite_engine.url),
+                                    data_referencia=DATA_REFERENCIA)
+
+    assert erros == {}
+    assert not esperado.empty
+    pd.testing.assert_frame_equal(_mensagens(mensagens), _mensagens(esperado))
+
+def _falhar_com(monkeypatch, usuario, falha):
+    """Faz o shard com o usuário falhar; os workers herdam o módulo alterado no fork"""
+    original = campaign_builder.preparar_mensagens_pontos_a_expirar
+
+    def preparar(saldos, candidatos):
+        if usuario in candidatos["usuario"].tolist():
+            falha()
+        return original(saldos, candidatos)
+
+    monkeypatch.setattr(campaign_builder, "preparar_mensagens_pontos_a_expirar", preparar)
+
+def _levantar():
+    raise RuntimeError("shard quebrado")
+
+@pytest.mark.parametrize("falha, erro", [(_levantar, "shard quebrado"), (lambda: os._exit(1), "The worker process died")])
+def test_failing_shard_keeps_the_other_shards(sqlite_engine, monkeypatch, falha, erro):
+    candidatos = pd.read_sql_query("SELECT * FROM sl_usuarios ORDER BY usuario", sqlite_engine)
+    completas, _ = build_campaign(candidatos, workers=2, shard_size=70, engine_url=str(sqlite_engine.url),
+                                  data_referencia=DATA_REFERENCIA)
+
+    _falhar_com(monkeypatch, candidatos["usuario"].iloc[150], falha)
+    mensagens, erros = build_campaign(candidatos, workers=2, shard_size=70, engine_url=str(sqlite_engine.url),
+                                      data_referencia=DATA_REFERENCIA)
+
+    assert erros == {2: erro}
+    sem_o_shard = completas[~completas["usuario"].isin(candidatos["usuario"].iloc[140:210])]
+    assert not sem_o_shard.empty
+    pd.testing.assert_frame_equal(_mensagens(mensagens), _mensagens(sem_o_shard))
+
+def test_campaign_without_messages_has_the_message_columns(sqlite_engine, tmp_path):
+    candidatos = pd.read_sql_query("SELECT * FROM sl_usuarios", sqlite_engine)
+
+    mensagens, erros = build_campaign(candidatos.iloc[:0], workers=1, engine_url=str(sqlite_engine.url))
+
+    assert erros == {}
+    assert mensagens.empty
+    assert SentMessageLedger(str(tmp_path / "ledger"), legacy_folder=str(tmp_path / "messages_sent")).filter_unsent(mensagens, "teste").empty
+    assert read_campaign(write_campaign(mensagens, str(tmp_path / "campanha.arrow"), "teste")).empty
+
+def _conexoes_do_worker():
+    with campaign_builder._sempreleitura.engine.connect() as conn:
+        conn.exec_driver_sql("SELECT 1")
+    return connections_opened()
+
+def test_worker_opens_its_own_connection(sqlite_engine):
+    url = str(sqlite_engine.url)
+    with get_engine(url).connect() as conn:
+        conn.exec_driver_sql("SELECT 1")
+    abertas = connections_opened()
+
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("fork"),
+                             initializer=campaign_builder._init_worker, initargs=(url, None)) as executor:
+        assert executor.submit(_conexoes_do_worker).result() == abertas + 1
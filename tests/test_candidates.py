@@ -0,0 +1,76 @@
+from types import SimpleNamespace
+
+import pandas as pd
+from sqlalchemy.dialects import mssql
+
+import candidates
+from candidates import select_candidates
+from utils import SQLServer, queries
+from benchmarks.candidate_rows import contar_linhas
+from benchmarks.synthetic import DATA_REFERENCIA
+
+DATA_INICIO = DATA_REFERENCIA - pd.DateOffset(months=12) + pd.DateOffset(days=10)
+DATA_FIM = DATA_INICIO + pd.DateOffset(days=20)
+
+def _movimentos_periodo(engine):
+    return pd.read_sql_query(
+        "SELECT usuario, data_hora, valor FROM sl_movimentacao_conta_corrente WHERE tipo = 'C'", engine
+    ).assign(data_hora=lambda df: pd.to_datetime(df["data_hora"])).query("@DATA_INICIO <= data_hora < @DATA_FIM")
+
+def test_only_qualifying_users_leave_the_database(sqlite_engine, tmp_path):
+    movimentos = _movimentos_periodo(sqlite_engine)
+    pontos = movimentos.groupby("usuario")["valor"].sum()
+
+    resultado = contar_linhas(300, 8, str(tmp_path))
+
+    assert resultado["rows_before"] == len(movimentos)
+    assert resultado["rows_after"] == (pontos > 500).sum()
+    assert 0 < resultado["rows_after"] < resultado["rows_before"]
+    assert resultado["same_candidates"]
+
+def test_period_includes_the_start_and_excludes_the_end(sqlite_engine):
+    sqlserver_db = SQLServer(engine=sqlite_engine)
+    with sqlite_engine.begin() as conn:
+        ultimo = conn.exec_driver_sql("SELECT MAX(id) FROM sl_movimentacao_conta_corrente").scalar()
+        for n, (usuario, data_hora) in enumerate([
+            ("11111111111", DATA_INICIO), ("22222222222", DATA_FIM), ("22222222222", DATA_FIM - pd.Timedelta(seconds=1))
+        ]):
+            conn.exec_driver_sql(
+                "INSERT INTO sl_movimentacao_conta_corrente (id, usuario, data_hora, data_cupom, valor, tipo, origem, extra_info, cnpj_empresa) "
+                "VALUES (?, ?, ?, ?, 100000, 'C', '1', '999', '00000000000001')",
+                (ultimo + n + 1, usuario, data_hora.strftime("%Y-%m-%d %H:%M:%S"), data_hora.strftime("%Y-%m-%d"))
+            )
+
+    pontos = select_candidates(sqlserver_db, DATA_INICIO, DATA_FIM, 50_000).set_index("usuario")["pontos_acumulados_periodo"]
+
+    assert pontos["11111111111"] == 100_000
+    assert pontos["22222222222"] == 100_000
+
+class _ServidorFalso:
+    """SQLServer em SQL Server com data_hora do tipo `tipo`, que guarda as consultas feitas"""
+    def __init__(self, tipo):
+        self.engine = SimpleNamespace(dialect=SimpleNamespace(name="mssql"), url=f"mssql+pyodbc://{tipo}")
+        self.tipo = tipo
+        self.consultas = []
+
+    def pandas_read_sql(self, query, params=None):
+        self.consultas.append((query, params))
+        if query == "tipo_data_hora":
+            return pd.DataFrame({"tipo": [self.tipo]})
+        return pd.DataFrame(columns=["usuario", "pontos_acumulados_periodo"])
+
+def test_text_column_is_compared_with_text(monkeypatch):
+    monkeypatch.setattr(candidates, "_tipos_data_hora", {})
+    texto, data = _ServidorFalso("varchar"), _ServidorFalso("datetime")
+
+    for _ in range(2):
+        select_candidates(texto, DATA_INICIO, DATA_FIM)
+    select_candidates(data, DATA_INICIO, DATA_FIM)
+
+    assert [query for query, _ in texto.consultas] == ["tipo_data_hora", "candidatos_pontuacao_data_texto", "candidatos_pontuacao_data_texto"]
+    assert [query for query, _ in data.consultas] == ["tipo_data_hora", "candidatos_pontuacao"]
+    assert texto.consultas[-1][1]["data_inicio"] == DATA_INICIO.strftime("%Y-%m-%d %H:%M:%S")
+
+    sql = str(queries.get("candidatos_pontuacao_data_texto", "mssql").compile(dialect=mssql.dialect()))
+    assert "mov.data_hora >= CONVERT(VARCHAR(19), :data_inicio)" in sql
+    assert "DATETIME" not in sql
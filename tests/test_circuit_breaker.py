@@ -0,0 +1,80 @@
+import pytest
+import requests
+
+from zapi_transport import CircuitBreaker, CircuitOpenError, ZAPITransport
+
+class _Relogio:
+    def __init__(self):
+        self.agora = 0.0
+
+    def __call__(self):
+        return self.agora
+
+class _Sessao:
+    """Sessão do requests que devolve (ou levanta) o próximo item de respostas"""
+    def __init__(self):
+        self.respostas = []
+
+    def request(self, method, url, **kwargs):
+        resposta = self.respostas.pop(0)
+        if isinstance(resposta, BaseException):
+            raise resposta
+        response = requests.Response()
+        response.status_code = resposta
+        return response
+
+@pytest.fixture
+def relogio():
+    return _Relogio()
+
+@pytest.fixture
+def transporte(relogio):
+    breaker = CircuitBreaker(window=2, min_requests=2, cooldown=10, clock=relogio)
+    transporte = ZAPITransport(max_retries=0, breaker=breaker, block_when_open=False, sleep=lambda _: None)
+    transporte._local.session = _Sessao()
+    return transporte
+
+def _abrir(transporte):
+    transporte._session().respostas += [503, 503]
+    for _ in range(2):
+        transporte.get("http://zapi", "chat-metadata")
+    assert transporte.breaker.state == CircuitBreaker.OPEN
+
+def test_open_breaker_refuses_until_cooldown(transporte, relogio):
+    _abrir(transporte)
+
+    with pytest.raises(CircuitOpenError):
+        transporte.post("http://zapi", "send-text")
+
+    relogio.agora = 10
+    transporte._session().respostas.append(200)
+    assert transporte.post("http://zapi", "send-text").status_code == 200
+    assert transporte.breaker.state == CircuitBreaker.CLOSED
+
+def test_failed_probe_reopens(transporte, relogio):
+    _abrir(transporte)
+
+    relogio.agora = 10
+    transporte._session().respostas.append(503)
+    transporte.post("http://zapi", "send-text")
+
+    assert transporte.breaker.state == CircuitBreaker.OPEN
+    assert transporte.breaker.times_opened == 2
+
+@pytest.mark.parametrize("erro", [ValueError("bad header"), requests.ConnectionError("reset"), KeyboardInterrupt()])
+def test_probe_raising_any_exception_reopens(transporte, relogio, erro):
+    _abrir(transporte)
+
+    relogio.agora = 10
+    transporte._session().respostas.append(erro)
+    with pytest.raises(type(erro)):
+        transporte.post("http://zapi", "send-text")
+
+    assert transporte.breaker.state == CircuitBreaker.OPEN
+    assert transporte.outcomes[-1]["outcome"] == "connection_error"
+
+    # Depois de outro cooldown a próxima requisição de teste fecha o breaker
+    relogio.agora = 20
+    transporte._session().respostas.append(200)
+    assert transporte.post("http://zapi", "send-text").status_code == 200
+    assert transporte.breaker.state == CircuitBreaker.CLOSED
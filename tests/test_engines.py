@@ -0,0 +1,63 @@
+import pandas as pd
+import pytest
+from utils import SQLServer, SempreLeitura, get_engine, connections_opened, dispose_engines
+
+class _SQLServerSQLite(SQLServer):
+    """SQLServer whose connection parameters point to a SQLite file"""
+    path = None
+
+    def connection_url(self):
+        return f"sqlite:///{self.path}"
+
+@pytest.fixture
+def engine_url(sqlite_engine):
+    yield str(sqlite_engine.url)
+    dispose_engines()
+
+def _consultar(engine, usuarios):
+    for usuario in usuarios:
+        SempreLeitura(engine=engine).getMovimentosContaCorrente(usuario)
+
+def test_get_engine_is_shared_per_parameters(engine_url):
+    assert get_engine(engine_url) is get_engine(engine_url)
+    assert get_engine(engine_url, pool_size=2) is not get_engine(engine_url)
+
+def test_connections_do_not_grow_with_users(engine_url, sqlite_engine):
+    usuarios = pd.read_sql_query("SELECT usuario FROM sl_usuarios", sqlite_engine)["usuario"].tolist()
+    engine = get_engine(engine_url, pool_size=2)
+
+    antes = connections_opened()
+    _consultar(engine, usuarios[:10])
+    com_10 = connections_opened() - antes
+
+    _consultar(engine, usuarios[10:210])
+    com_210 = connections_opened() - antes
+
+    assert com_10 == com_210 <= 2
+
+def test_disconnect_keeps_shared_engine_open(engine_url):
+    engine = get_engine(engine_url)
+    primeiro = SQLServer(engine=engine)
+    segundo = SQLServer(engine=engine)
+
+    antes = connections_opened()
+    primeiro.pandas_read_sql("SELECT COUNT(*) AS n FROM sl_usuarios")
+    primeiro.disconnect()
+    assert segundo.pandas_read_sql("SELECT COUNT(*) AS n FROM sl_usuarios")["n"].iloc[0] == 300
+    # A conexão do pool continuou aberta e foi reaproveitada
+    assert connections_opened() - antes == 1
+
+def test_disconnect_closes_own_engine(engine_url, sqlite_engine):
+    _SQLServerSQLite.path = sqlite_engine.url.database
+    proprio = _SQLServerSQLite("server", "db", "user", "password", share_engine=False, max_overflow=3)
+    compartilhado = _SQLServerSQLite("server", "db", "user", "password")
+
+    assert proprio.engine is not compartilhado.engine
+    assert proprio.engine.pool._max_overflow == 3
+    assert compartilhado.engine is get_engine(engine_url)
+
+    proprio.pandas_read_sql("SELECT 1 AS n")
+    assert proprio.engine.pool.checkedin() == 1
+    proprio.disconnect()
+    assert proprio.engine.pool.checkedin() == 0
+    assert compartilhado.pandas_read_sql("SELECT COUNT(*) AS n FROM sl_usuarios")["n"].iloc[0] == 300
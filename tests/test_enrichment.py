@@ -0,0 +1,96 @@
+import json
+import pandas as pd
+import pytest
+import requests
+
+import enrichment
+from enrichment import MetadataCache, enrich_chat_metadata, fetch_chat_metadata
+from suppression import SuppressionIndex, INVALID_PHONE
+
+def _response(status, corpo):
+    response = requests.Response()
+    response.status_code = status
+    response._content = corpo if isinstance(corpo, bytes) else json.dumps(corpo).encode()
+    return response
+
+class _Cliente:
+    """get_chat_metadata com uma resposta fixa por telefone"""
+    def __init__(self, respostas):
+        self.respostas = respostas
+        self.chamadas = []
+
+    def get_chat_metadata(self, phone):
+        self.chamadas.append(phone)
+        resposta = self.respostas[phone]
+        if isinstance(resposta, Exception):
+            raise resposta
+        return resposta
+
+def test_error_body_is_returned():
+    cliente = _Cliente({"5511900000001": _response(404, {"error": "Not Found", "message": "phone not found"})})
+
+    assert fetch_chat_metadata(cliente, "5511900000001", max_retries=3, backoff=0) == {
+        "error": "Not Found", "message": "phone not found"
+    }
+    assert len(cliente.chamadas) == 1
+
+def test_raises_when_retries_run_out():
+    cliente = _Cliente({"5511900000001": _response(503, {"message": "Internal server error"})})
+
+    with pytest.raises(requests.HTTPError):
+        fetch_chat_metadata(cliente, "5511900000001", max_retries=2, backoff=0)
+    assert len(cliente.chamadas) == 3
+
+def test_raises_on_error_without_json_body():
+    cliente = _Cliente({"5511900000001": _response(400, b"Bad Request")})
+
+    with pytest.raises(requests.HTTPError):
+        fetch_chat_metadata(cliente, "5511900000001", max_retries=0)
+
+def test_not_found_phones_are_suppressed(tmp_path):
+    cliente = _Cliente({
+        "5511900000001": _response(200, {"phone": "5511900000001", "name": "Cliente"}),
+        "5511900000002": _response(404, {"message": "phone not found"}),
+        "5511900000003": _response(503, {"message": "Internal server error"}),
+        "5511900000004": requests.ConnectionError("connection reset"),
+    })
+    messages_sent = pd.DataFrame({"usuario": ["1", "2", "3", "4"], "telefone_contato": list(cliente.respostas)})
+
+    enriquecido = enrich_chat_metadata(messages_sent, cliente, max_retries=0).set_index("telefone_contato")
+
+    assert enriquecido.loc["5511900000001", "name"] == "Cliente"
+    assert enriquecido.loc["5511900000002", "message"] == "phone not found"
+    assert enriquecido.loc[["5511900000003", "5511900000004"], "message"].isna().all()
+
+    suppression = SuppressionIndex(str(tmp_path / "suppression"))
+    assert suppression.sync_invalid_phones(enriquecido.reset_index()) == 1
+    assert suppression.contains(INVALID_PHONE, ["5511900000002", "5511900000003"]).tolist() == [True, False]
+
+def test_repeated_phones_are_requested_once():
+    cliente = _Cliente({"5511900000001": _response(200, {"name": "Cliente"})})
+    messages_sent = pd.DataFrame({"usuario": ["1", "2", "3"], "telefone_contato": ["5511900000001"] * 3})
+
+    enriquecido = enrich_chat_metadata(messages_sent, cliente, max_retries=0)
+
+    assert cliente.chamadas == ["5511900000001"]
+    assert enriquecido["usuario"].tolist() == ["1", "2", "3"]
+    assert (enriquecido["name"] == "Cliente").all()
+
+def test_cache_is_used_within_the_ttl(tmp_path, monkeypatch):
+    agora = [1_000_000.0]
+    monkeypatch.setattr(enrichment.time, "time", lambda: agora[0])
+    cliente = _Cliente({"5511900000001": _response(200, {"name": "Cliente"})})
+    messages_sent = pd.DataFrame({"usuario": ["1"], "telefone_contato": ["5511900000001"]})
+    cache = MetadataCache(str(tmp_path / "cache.db"), ttl_hours=1)
+
+    enrich_chat_metadata(messages_sent, cliente, cache=cache, max_retries=0)
+    agora[0] += 3600
+    enriquecido = enrich_chat_metadata(messages_sent, cliente, cache=cache, max_retries=0)
+    assert cliente.chamadas == ["5511900000001"]
+    assert enriquecido["name"].tolist() == ["Cliente"]
+
+    # Passado o TTL o telefone é consultado de novo
+    agora[0] += 1
+    assert cache.get_many(["5511900000001"]) == {}
+    enrich_chat_metadata(messages_sent, cliente, cache=cache, max_retries=0)
+    assert cliente.chamadas == ["5511900000001"] * 2
@@ -0,0 +1,12 @@
+from benchmarks.fault_injection import simular_queda
+
+def test_outage_loses_and_duplicates_nothing():
+    _, resumo = simular_queda(300, inicio_queda=0.2, duracao_queda=0.5, cooldown=0.2)
+
+    assert resumo["enviadas"] == resumo["mensagens"] == 300
+    assert resumo["entregues_stub"] == 300
+    assert resumo["entregues_em_dobro"] == 0
+    # O breaker abriu durante a queda e fechou depois, com os envios de volta
+    assert resumo["aberturas_circuit_breaker"] >= 1
+    assert resumo["estado_final_circuit_breaker"] == "closed"
+    assert resumo["vazao_durante"] < resumo["vazao_depois"]
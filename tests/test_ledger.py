@@ -0,0 +1,72 @@
+import os
+import time
+import pandas as pd
+import pytest
+
+from ledger import SentMessageLedger
+
+@pytest.fixture
+def legado(tmp_path):
+    # Arquivos soltos como os que message_whatsapp.py gravava antes do ledger
+    pasta = tmp_path / "messages_sent"
+    pasta.mkdir()
+    pd.DataFrame({
+        "usuario": ["00000000001", "00000000002"], "nome_projeto": "aviso_pontos_a_expirar",
+        "telefone_contato": "5511999999999", "data_envio": pd.Timestamp("2025-01-10"),
+    }).to_parquet(pasta / "2025-01-10.parquet")
+    pd.DataFrame({
+        "usuario": ["00000000002", "00000000003"], "nome_projeto": "aviso_pontos_a_expirar",
+        "telefone_contato": "5511999999999", "data_envio": pd.Timestamp("2025-02-10"),
+    }).to_parquet(pasta / "2025-02-10.parquet")
+    return str(pasta)
+
+def _ledger(tmp_path, legado):
+    return SentMessageLedger(str(tmp_path / "ledger"), legacy_folder=legado)
+
+def test_filter_unsent_imports_legacy_folder(tmp_path, legado):
+    candidatos = pd.DataFrame({"cpf": ["00000000001", "00000000003", "00000000004"]})
+
+    restantes = _ledger(tmp_path, legado).filter_unsent(candidatos, "aviso_pontos_a_expirar")
+
+    assert restantes["cpf"].to_list() == ["00000000004"]
+
+def test_read_imports_legacy_folder_once(tmp_path, legado):
+    assert sorted(_ledger(tmp_path, legado).read()["usuario"]) == ["00000000001", "00000000002", "00000000003"]
+
+    # O ledger já tem dados: um arquivo novo na pasta antiga não é importado de novo
+    pd.DataFrame({"usuario": ["00000000009"], "nome_projeto": "aviso_pontos_a_expirar"})\
+        .to_parquet(os.path.join(legado, "2025-03-10.parquet"))
+    ledger = _ledger(tmp_path, legado)
+    assert ledger.import_legacy() == 0
+    assert len(ledger.read()) == 3
+
+def test_append_imports_legacy_folder_first(tmp_path, legado):
+    ledger = _ledger(tmp_path, legado)
+
+    escritas = ledger.append(
+        pd.DataFrame({"usuario": ["00000000003", "00000000005"], "data_envio": pd.Timestamp("2025-03-01")}),
+        nome_projeto="aviso_pontos_a_expirar"
+    )
+
+    assert escritas == 1
+    assert sorted(ledger.read()["usuario"]) == ["00000000001", "00000000002", "00000000003", "00000000005"]
+
+def test_missing_legacy_folder(tmp_path):
+    ledger = _ledger(tmp_path, str(tmp_path / "nao_existe"))
+
+    assert ledger.read().empty
+    assert ledger.import_legacy() == 0
+
+def test_legacy_files_without_date_keep_the_date_of_the_file(tmp_path):
+    pasta = tmp_path / "messages_sent"
+    pasta.mkdir()
+    envios = pd.DataFrame({"usuario": ["00000000001"], "nome_projeto": "aviso_pontos_a_expirar"})
+    envios.to_parquet(pasta / "messages_sent_2024-11-05 10-30-00.parquet")
+    envios.assign(usuario="00000000002").to_parquet(pasta / "enviados.parquet")
+    modificado = pd.Timestamp("2024-12-01 08:00:00")
+    os.utime(pasta / "enviados.parquet", (time.mktime(modificado.timetuple()),) * 2)
+
+    datas = _ledger(tmp_path, str(pasta)).read().set_index("usuario")["data_envio"]
+
+    assert datas["00000000001"] == pd.Timestamp("2024-11-05 10:30:00")
+    assert datas["00000000002"] == modificado
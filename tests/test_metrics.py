@@ -0,0 +1,111 @@
+import random
+import re
+import pytest
+
+from metrics import Metrics
+
+@pytest.fixture
+def metrics():
+    return Metrics(enabled=True)
+
+def test_env_var_is_read_when_first_checked(monkeypatch):
+    monkeypatch.delenv("METRICS_ENABLED", raising=False)
+    metrics = Metrics()
+
+    # Como um .env carregado depois do import de metrics
+    monkeypatch.setenv("METRICS_ENABLED", "1")
+    assert metrics.enabled
+    metrics.disable()
+    assert not metrics.enabled
+
+def test_disabled_records_nothing():
+    metrics = Metrics(enabled=False)
+
+    @metrics.timed("etapa")
+    def etapa():
+        return [1, 2]
+
+    assert etapa() == [1, 2]
+    with metrics.timer("bloco") as timer:
+        timer.rows = 10
+    assert metrics.summary()["series"] == {}
+
+def test_timed_records_rows_status_and_errors(metrics):
+    @metrics.timed("envio", rows=len, status=lambda resultado: resultado[0])
+    def enviar(status):
+        if status is None:
+            raise RuntimeError("falhou")
+        return [status, "corpo"]
+
+    enviar(200)
+    enviar(503)
+    with pytest.raises(RuntimeError):
+        enviar(None)
+
+    serie = metrics.summary()["series"]["envio"]
+    assert (serie["count"], serie["errors"], serie["rows"]) == (3, 2, 4)
+    assert serie["status"] == {"200": 1, "503": 1}
+
+def test_timed_defaults_to_the_qualified_name(metrics):
+    @metrics.timed()
+    def etapa():
+        return None
+
+    etapa()
+    assert list(metrics.summary()["series"]) == [etapa.__wrapped__.__qualname__]
+
+def test_timer(metrics):
+    with metrics.timer("bloco") as timer:
+        timer.rows = 10
+        timer.status = 429
+
+    serie = metrics.summary()["series"]["bloco"]
+    assert (serie["count"], serie["rows"], serie["errors"], serie["status"]) == (1, 10, 1, {"429": 1})
+    assert serie["total_seconds"] >= 0
+
+def test_reservoir_keeps_a_uniform_sample():
+    random.seed(0)
+    metrics = Metrics(enabled=True, max_samples=200)
+
+    for i in range(20_000):
+        metrics.record("etapa", float(i))
+
+    serie = metrics._series["etapa"]
+    assert serie.count == 20_000
+    assert len(serie.latencies) == 200
+    # Uma amostra uniforme de 0..19999 tem média perto de 10000, não dos primeiros valores
+    assert 8_500 < sum(serie.latencies) / 200 < 11_500
+    assert metrics.summary()["series"]["etapa"]["total_seconds"] == sum(range(20_000))
+
+def test_prometheus_format(metrics, tmp_path):
+    metrics.record("a", 0.1, rows=3, status=200)
+    metrics.record("b", 0.2, status=500)
+    metrics.record("b", 0.4, error=True)
+    path = str(tmp_path / "metrics" / "run.prom")
+
+    metrics.export_prometheus(path, prefix="teste")
+
+    linhas = open(path).read().splitlines()
+    familias, familia = {}, None
+    for linha in linhas:
+        tipo = re.fullmatch(r"# TYPE (\w+) (counter|summary)", linha)
+        if tipo:
+            assert tipo.group(1) not in familias
+            familia = tipo.group(1)
+            familias[familia] = {}
+            continue
+        amostra = re.fullmatch(r'(\w+)\{(stage="\w+"(?:,\w+="[^"]*")?)\} (\S+)', linha)
+        assert amostra, linha
+        # Cada amostra vem logo depois do # TYPE da sua métrica
+        assert amostra.group(1) in (familia, f"{familia}_sum", f"{familia}_count"), linha
+        familias[familia][f"{amostra.group(1)}{{{amostra.group(2)}}}"] = float(amostra.group(3))
+
+    assert familias["teste_calls_total"] == {'teste_calls_total{stage="a"}': 1, 'teste_calls_total{stage="b"}': 2}
+    assert familias["teste_errors_total"]['teste_errors_total{stage="b"}'] == 2
+    assert familias["teste_rows_total"]['teste_rows_total{stage="a"}'] == 3
+    assert familias["teste_duration_seconds"]['teste_duration_seconds{stage="a",quantile="0.5"}'] == 0.1
+    assert familias["teste_duration_seconds"]['teste_duration_seconds_count{stage="b"}'] == 2
+    assert familias["teste_duration_seconds"]['teste_duration_seconds_sum{stage="b"}'] == pytest.approx(0.6)
+    assert familias["teste_http_responses_total"] == {
+        'teste_http_responses_total{stage="a",code="200"}': 1, 'teste_http_responses_total{stage="b",code="500"}': 1
+    }
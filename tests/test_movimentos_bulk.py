@@ -0,0 +1,60 @@
+import math
+import random
+import pandas as pd
+import pytest
+from sqlalchemy import event
+from utils import SempreLeitura
+
+def _por_usuario(sempreleitura, usuarios):
+    return pd.concat([sempreleitura.getMovimentosContaCorrente(usuario) for usuario in usuarios], ignore_index=True)
+
+def _ordenar(df):
+    return df.sort_values(["usuario", "data_cupom_mod", "id"]).reset_index(drop=True)
+
+def test_bulk_matches_per_user_query(sqlite_engine):
+    # Resgates repetidos para a mesma chave, para a soma pré-agregada ter o que somar
+    with sqlite_engine.begin() as conn:
+        conn.exec_driver_sql("INSERT INTO sl_historico_resgate SELECT * FROM sl_historico_resgate WHERE rowid % 3 = 0")
+        conn.exec_driver_sql(
+            "INSERT INTO sl_historico_resgate (usuario, extra_info, cnpj_empresa_credito, valor_resgate) "
+            "SELECT usuario, extra_info, cnpj_empresa_credito, NULL FROM sl_historico_resgate WHERE rowid % 5 = 0"
+        )
+
+    sempreleitura = SempreLeitura(engine=sqlite_engine)
+    usuarios = pd.read_sql_query("SELECT usuario FROM sl_usuarios", sqlite_engine)["usuario"].tolist()[:120]
+
+    # Usuários repetidos e um que não existe, em vários chunks
+    bulk = sempreleitura.getMovimentosContaCorrenteBulk(usuarios + usuarios[:10] + ["00000000000"], chunk_size=25)
+    esperado = _por_usuario(sempreleitura, usuarios)
+
+    assert len(bulk) == len(esperado) > 0
+    assert (bulk["valor_resgatado"] > 0).any()
+    pd.testing.assert_frame_equal(_ordenar(bulk), _ordenar(esperado)[bulk.columns], check_dtype=False)
+
+def test_bulk_is_ordered_by_user_date_and_id(sqlite_engine):
+    sempreleitura = SempreLeitura(engine=sqlite_engine)
+    usuarios = pd.read_sql_query("SELECT usuario FROM sl_usuarios", sqlite_engine)["usuario"].tolist()[:50]
+    random.Random(0).shuffle(usuarios)
+
+    bulk = sempreleitura.getMovimentosContaCorrenteBulk(usuarios, chunk_size=7)
+
+    pd.testing.assert_frame_equal(bulk, _ordenar(bulk))
+
+def test_bulk_without_users(sqlite_engine):
+    assert SempreLeitura(engine=sqlite_engine).getMovimentosContaCorrenteBulk([]).empty
+
+@pytest.mark.parametrize("n_usuarios", [1, 25, 26, 120, 300])
+def test_round_trips_grow_with_chunks_not_users(sqlite_engine, n_usuarios):
+    usuarios = pd.read_sql_query("SELECT usuario FROM sl_usuarios", sqlite_engine)["usuario"].tolist()[:n_usuarios]
+    consultas = []
+
+    def contar(conn, cursor, statement, parameters, context, executemany):
+        consultas.append(statement)
+
+    event.listen(sqlite_engine, "before_cursor_execute", contar)
+    try:
+        SempreLeitura(engine=sqlite_engine).getMovimentosContaCorrenteBulk(usuarios, chunk_size=25)
+    finally:
+        event.remove(sqlite_engine, "before_cursor_execute", contar)
+
+    assert len(consultas) == math.ceil(n_usuarios / 25)
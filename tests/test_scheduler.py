@@ -0,0 +1,87 @@
+import pandas as pd
+import pytest
+from aiohttp import web
+
+from benchmarks.stub_zapi import StubZAPIServer
+from scheduler import SendScheduler, SimulatedClock
+from send_queue import SendQueue
+from zapi_client import ZAPIClient
+from zapi_pool import ZAPIPool
+from zapi_transport import ZAPITransport, CircuitBreaker
+
+class _StubLimiteUmaVez(StubZAPIServer):
+    """Stub em que as instâncias de failing_instances falham só na primeira requisição"""
+    async def _falha(self, request, endpoint):
+        falha = await super()._falha(request, endpoint)
+        self.failing_instances.discard(request.match_info["instance"])
+        return falha
+
+class _StubSemJSON(StubZAPIServer):
+    """Stub que confirma o envio com um corpo que não é JSON"""
+    async def _send(self, request):
+        await request.json()
+        self.responses[200] += 1
+        return web.Response(text="ok")
+
+@pytest.fixture
+def clock():
+    # Sexta-feira, dentro da janela de envio
+    return SimulatedClock(pd.Timestamp("2025-03-07 10:00"))
+
+def _scheduler(stub, clock, tmp_path, telefones):
+    pool = ZAPIPool([
+        ZAPIClient(instance_id, "token", "cliente", base_url=stub.base_url, transport=ZAPITransport(
+            max_retries=0, block_when_open=False, breaker=CircuitBreaker(clock=lambda: clock.now().timestamp())
+        ))
+        for instance_id in ["instancia1", "instancia2"]
+    ])
+    if telefones is None:
+        # Um telefone para cada instância, a primeira enviando antes
+        telefones = [
+            next(f"55119{n:08d}" for n in range(1000) if pool.instance_for(f"55119{n:08d}") == instance_id)
+            for instance_id in pool.clients
+        ]
+
+    send_queue = SendQueue(str(tmp_path / "send_queue.db"))
+    send_queue.enqueue(pd.DataFrame({
+        "cpf": [f"{i:011d}" for i in range(len(telefones))],
+        "telefone_contato": telefones,
+        "mensagem": "Mensagem de teste",
+    }), "teste")
+    return send_queue, SendScheduler(send_queue, pool, clock=clock, rate=1.0)
+
+def test_message_released_after_the_queue_emptied_is_sent(clock, tmp_path):
+    # A instancia1 esvazia a fila antes de a instancia2 levar o 429 e devolver sua mensagem
+    with _StubLimiteUmaVez(error_status=429, retry_after=30) as stub:
+        stub.failing_instances.add("instancia2")
+        send_queue, scheduler = _scheduler(stub, clock, tmp_path, None)
+
+        assert scheduler.run("teste") == 2
+        assert stub.responses[429] == 1
+
+    assert send_queue.status_counts("teste") == {"sent": 2}
+    assert scheduler.history_dataframe()["instance_id"].tolist() == ["instancia1", "instancia2", "instancia2"]
+
+def test_response_without_json_is_still_sent(clock, tmp_path):
+    with _StubSemJSON() as stub:
+        send_queue, scheduler = _scheduler(stub, clock, tmp_path, ["5511999990001", "5511999990002"])
+
+        assert scheduler.run("teste") == 2
+
+    enviadas = send_queue.to_dataframe("teste")
+    assert enviadas["status"].tolist() == ["sent", "sent"]
+    assert enviadas["messageId"].isna().all()
+
+def test_sends_go_through_the_pool(clock, tmp_path):
+    with StubZAPIServer() as stub:
+        send_queue, scheduler = _scheduler(stub, clock, tmp_path, None)
+        pool = scheduler.zapi_client
+        telefones = send_queue.to_dataframe("teste")["telefone_contato"].tolist()
+
+        # A instancia2 sai da rotação antes do envio: a mensagem dela vai para a instancia1
+        pool._estados["instancia2"].unhealthy_until = float("inf")
+        assert scheduler.run("teste") == 2
+
+    assert pool.stats().set_index("instance_id")["sent"].to_dict() == {"instancia1": 2, "instancia2": 0}
+    assert all(pool._instancia_da_conversa(telefone) == "instancia1" for telefone in telefones)
+    assert stub.requests_by_instance == {"instancia1": 2}
@@ -0,0 +1,166 @@
+import sqlite3
+import pandas as pd
+import pytest
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+from send_queue import SendQueue, STATUS_FAILED, STATUS_PENDING, STATUS_SENT, STATUS_UNKNOWN
+from zapi_transport import CircuitOpenError, not_delivered
+
+def _http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(f"{status} error", response=response)
+
+def _sem_conexao():
+    motivo = NewConnectionError(None, "Failed to establish a new connection")
+    return requests.ConnectionError(MaxRetryError(None, "/", reason=motivo))
+
+ERROS_NAO_ENTREGUES = {
+    "circuit_open": CircuitOpenError("circuit open"),
+    "http_400": _http_error(400),
+    "http_429": _http_error(429),
+    "connect_timeout": requests.ConnectTimeout("connect timeout"),
+    "new_connection": _sem_conexao(),
+}
+ERROS_AMBIGUOS = {
+    "http_500": _http_error(500),
+    "http_503": _http_error(503),
+    "read_timeout": requests.ReadTimeout("read timeout"),
+    "connection_reset": requests.ConnectionError("connection reset by peer"),
+    "other": RuntimeError("unexpected"),
+}
+
+@pytest.fixture
+def send_queue(tmp_path):
+    return SendQueue(str(tmp_path / "send_queue.db"))
+
+def _falhar(send_queue, erros):
+    df = pd.DataFrame({"cpf": list(erros), "telefone_contato": "5511999999999", "mensagem": "Mensagem"})
+    send_queue.enqueue(df, "teste")
+    send_queue.claim(batch_size=len(df), nome_projeto="teste")
+    for cpf, erro in erros.items():
+        send_queue.mark_failed(send_queue.idempotency_key("teste", cpf), erro)
+
+def _status(send_queue):
+    df = send_queue.to_dataframe("teste")
+    return dict(zip(df["cpf"], df["status"]))
+
+@pytest.mark.parametrize("nome", list(ERROS_NAO_ENTREGUES))
+def test_not_delivered(nome):
+    assert not_delivered(ERROS_NAO_ENTREGUES[nome])
+
+@pytest.mark.parametrize("nome", list(ERROS_AMBIGUOS))
+def test_ambiguous_errors_are_not_not_delivered(nome):
+    assert not not_delivered(ERROS_AMBIGUOS[nome])
+
+def test_retry_failed_requeues_only_undelivered(send_queue):
+    _falhar(send_queue, {**ERROS_NAO_ENTREGUES, **ERROS_AMBIGUOS})
+
+    assert send_queue.retry_failed("teste") == len(ERROS_NAO_ENTREGUES)
+    status = _status(send_queue)
+    assert all(status[cpf] == STATUS_PENDING for cpf in ERROS_NAO_ENTREGUES)
+    assert all(status[cpf] == STATUS_FAILED for cpf in ERROS_AMBIGUOS)
+
+    assert send_queue.retry_failed("teste", include_ambiguous=True) == len(ERROS_AMBIGUOS)
+    assert set(_status(send_queue).values()) == {STATUS_PENDING}
+
+def test_retry_failed_keeps_old_failures(tmp_path):
+    # Falhas gravadas antes da coluna retryable não dizem se foram entregues
+    path = str(tmp_path / "antiga.db")
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE send_queue (
+            idempotency_key TEXT PRIMARY KEY, nome_projeto TEXT NOT NULL, cpf TEXT NOT NULL,
+            telefone_contato TEXT NOT NULL, mensagem TEXT NOT NULL, status TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0, zaapId TEXT, messageId TEXT, error TEXT,
+            created_at TEXT NOT NULL, updated_at TEXT NOT NULL
+        )""")
+    conn.execute(
+        "INSERT INTO send_queue VALUES ('teste:1', 'teste', '1', '5511999999999', 'Mensagem', ?, 1, NULL, NULL, 'timeout', '', '')",
+        (STATUS_FAILED,)
+    )
+    conn.commit()
+    conn.close()
+
+    send_queue = SendQueue(path)
+    assert send_queue.retry_failed("teste") == 0
+    assert send_queue.retry_failed("teste", include_ambiguous=True) == 1
+
+class _Cliente:
+    """ZAPIClient que responde 200 com corpo, ou levanta erro, e guarda os telefones enviados"""
+    def __init__(self, corpo=b'{"zaapId": "zaap", "messageId": "msg"}', falhar_em=None):
+        self.corpo = corpo
+        self.falhar_em = falhar_em
+        self.enviados = []
+
+    def send_text(self, phone, message, delay_message=None):
+        if self.falhar_em is not None and len(self.enviados) == self.falhar_em:
+            # O processo cai no meio do lote
+            raise SystemExit(1)
+        self.enviados.append(phone)
+        response = requests.Response()
+        response.status_code = 200
+        response._content = self.corpo
+        return response
+
+def _campanha(n):
+    return pd.DataFrame({
+        "cpf": [f"{i:011d}" for i in range(n)],
+        "telefone_contato": [f"551199999{i:04d}" for i in range(n)],
+        "mensagem": "Mensagem",
+    })
+
+def test_enqueue_is_idempotent(send_queue):
+    assert send_queue.enqueue(_campanha(3), "teste") == 3
+    assert send_queue.enqueue(_campanha(4).assign(mensagem="Outra"), "teste") == 1
+    assert send_queue.enqueue(_campanha(3), "outro_projeto") == 3
+
+    df = send_queue.to_dataframe("teste")
+    assert len(df) == 4
+    assert df.set_index("cpf")["mensagem"].to_dict() == {
+        "00000000000": "Mensagem", "00000000001": "Mensagem", "00000000002": "Mensagem", "00000000003": "Outra"
+    }
+
+def test_drain_marks_response_without_json_as_sent(send_queue):
+    send_queue.enqueue(_campanha(2), "teste")
+
+    assert send_queue.drain(_Cliente(corpo=b"ok"), nome_projeto="teste") == 2
+    df = send_queue.to_dataframe("teste")
+    assert set(df["status"]) == {STATUS_SENT}
+    assert df["messageId"].isna().all()
+    assert send_queue.retry_failed("teste", include_ambiguous=True) == 0
+
+def test_recover_after_crash_in_the_middle_of_a_batch(tmp_path):
+    path = str(tmp_path / "send_queue.db")
+    send_queue = SendQueue(path)
+    send_queue.enqueue(_campanha(5), "teste")
+    lote = send_queue.claim(batch_size=3, nome_projeto="teste")
+    send_queue.mark_sent(lote[0][0], "zaap", "msg")
+
+    # Outro processo abre a fila depois da queda
+    send_queue = SendQueue(path)
+    assert send_queue.recover() == 2
+
+    status = _status(send_queue)
+    assert [status[f"{i:011d}"] for i in range(5)] == [STATUS_SENT, STATUS_UNKNOWN, STATUS_UNKNOWN, STATUS_PENDING, STATUS_PENDING]
+    assert [key for key, _, _ in send_queue.claim(batch_size=10, nome_projeto="teste")] == ["teste:00000000003", "teste:00000000004"]
+
+def test_drain_restart_sends_nothing_twice(tmp_path):
+    path = str(tmp_path / "send_queue.db")
+    send_queue = SendQueue(path)
+    send_queue.enqueue(_campanha(10), "teste")
+
+    antes = _Cliente(falhar_em=5)
+    with pytest.raises(SystemExit):
+        send_queue.drain(antes, batch_size=4, nome_projeto="teste")
+
+    send_queue = SendQueue(path)
+    send_queue.recover()
+    depois = _Cliente()
+    send_queue.drain(depois, batch_size=4, nome_projeto="teste")
+
+    enviados = antes.enviados + depois.enviados
+    assert len(enviados) == len(set(enviados))
+    # O resto do lote interrompido fica unknown em vez de ser enviado de novo
+    assert send_queue.status_counts("teste") == {STATUS_SENT: 7, STATUS_UNKNOWN: 3}
@@ -0,0 +1,79 @@
+import sqlite3
+import tracemalloc
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine
+
+from utils import SQLServer, aggregate_chunks
+
+LINHAS = 300_000
+USUARIOS = 2_000
+CHUNKSIZE = 10_000
+
+@pytest.fixture(scope="module")
+def sqlserver_db(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("streaming") / "movimentos.db")
+    rng = np.random.default_rng(0)
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE movimentos (id INTEGER PRIMARY KEY, usuario TEXT, tipo TEXT, valor REAL)")
+    for inicio in range(0, LINHAS, 50_000):
+        n = min(50_000, LINHAS - inicio)
+        conn.executemany("INSERT INTO movimentos (usuario, tipo, valor) VALUES (?, ?, ?)", zip(
+            (f"{u:011d}" for u in rng.integers(0, USUARIOS, n)),
+            rng.choice(["C", "D"], n),
+            rng.integers(1, 1000, n).astype(float),
+        ))
+    conn.commit()
+    conn.close()
+
+    engine = create_engine(f"sqlite:///{path}")
+    yield SQLServer(engine=engine)
+    engine.dispose()
+
+AGREGACOES = dict(pontos=("valor", "sum"), movimentos=("valor", "count"), maior=("valor", "max"))
+QUERY = "SELECT usuario, tipo, valor FROM movimentos"
+
+def _pico(func):
+    tracemalloc.start()
+    try:
+        resultado = func()
+        return resultado, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def _ordenar(df):
+    return df.sort_values("usuario").reset_index(drop=True)
+
+def test_streamed_aggregate_matches_database(sqlserver_db):
+    agregado = aggregate_chunks(
+        sqlserver_db.pandas_read_sql_iter(QUERY, chunksize=CHUNKSIZE, downcast=True), "usuario", **AGREGACOES
+    )
+    esperado = sqlserver_db.pandas_read_sql(
+        "SELECT usuario, SUM(valor) AS pontos, COUNT(valor) AS movimentos, MAX(valor) AS maior FROM movimentos GROUP BY usuario"
+    )
+
+    agregado, esperado = _ordenar(agregado), _ordenar(esperado)
+    assert agregado["usuario"].astype(str).tolist() == esperado["usuario"].tolist()
+    np.testing.assert_allclose(agregado["pontos"], esperado["pontos"])
+    assert agregado["movimentos"].tolist() == esperado["movimentos"].tolist()
+    np.testing.assert_allclose(agregado["maior"], esperado["maior"])
+    assert agregado["movimentos"].sum() == LINHAS
+
+def test_streamed_aggregate_memory_is_bounded(sqlserver_db):
+    def em_chunks(limite):
+        return aggregate_chunks(
+            sqlserver_db.pandas_read_sql_iter(f"{QUERY} WHERE id <= {limite}", chunksize=CHUNKSIZE, downcast=True),
+            "usuario", **AGREGACOES
+        )
+
+    def inteiro():
+        return sqlserver_db.pandas_read_sql(QUERY).groupby("usuario").agg(**AGREGACOES)
+
+    _, pico_metade = _pico(lambda: em_chunks(LINHAS // 2))
+    _, pico_chunks = _pico(lambda: em_chunks(LINHAS))
+    _, pico_inteiro = _pico(inteiro)
+
+    # O pico depende do tamanho do chunk e do número de usuários, não do número de linhas
+    assert pico_chunks < 1.5 * pico_metade
+    assert pico_chunks < pico_inteiro / 4
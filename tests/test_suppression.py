@@ -0,0 +1,88 @@
+import pandas as pd
+import pytest
+
+import suppression
+from suppression import SuppressionIndex, OPT_OUT_PHONE, OPT_OUT_CPF, INVALID_PHONE, FREQUENCY_CAP
+from ledger import SentMessageLedger
+from send_queue import SendQueue
+from webhooks import WebhookStore, parse_callback
+
+@pytest.fixture
+def index(tmp_path):
+    return SuppressionIndex(str(tmp_path / "suppression"))
+
+def _resposta(phone, texto):
+    return parse_callback({
+        "type": "ReceivedCallback", "phone": phone, "messageId": f"m{phone}", "momment": 100, "text": {"message": texto}
+    })
+
+def test_sync_opt_outs_suppresses_the_cpfs_sent_to_the_phone(index, tmp_path):
+    path = str(tmp_path / "send_queue.db")
+    SendQueue(path).enqueue(pd.DataFrame({
+        "cpf": ["11111111111", "22222222222", "33333333333"],
+        # O mesmo telefone em outro formato, em outro projeto
+        "telefone_contato": ["5511988887777", "5511911112222", "(11) 98888-7777"],
+        "mensagem": "Mensagem",
+    }), "teste")
+    store = WebhookStore(path)
+    store.write_batch(_resposta("5511988887777", "SAIR") + _resposta("5511911112222", "Obrigado"))
+
+    assert index.sync_opt_outs(store) == {OPT_OUT_PHONE: 1, OPT_OUT_CPF: 2}
+    assert index.contains(OPT_OUT_PHONE, ["11988887777", "5511911112222"]).tolist() == [True, False]
+    assert index.contains(OPT_OUT_CPF, ["11111111111", "22222222222", "33333333333"]).tolist() == [True, False, True]
+    assert index.sync_opt_outs(store) == {OPT_OUT_PHONE: 0, OPT_OUT_CPF: 0}
+
+def test_sync_opt_outs_without_send_queue(index, tmp_path):
+    store = WebhookStore(str(tmp_path / "webhooks.db"))
+    store.write_batch(_resposta("5511988887777", "SAIR"))
+
+    assert index.sync_opt_outs(store) == {OPT_OUT_PHONE: 1, OPT_OUT_CPF: 0}
+
+def test_frequency_caps_at_the_edge_of_the_window(index, tmp_path):
+    agora = pd.Timestamp("2025-03-07 12:00")
+    inicio = agora - pd.Timedelta(days=30)
+    ledger = SentMessageLedger(str(tmp_path / "ledger"), legacy_folder=None)
+    ledger.append(pd.DataFrame({
+        "usuario": ["11111111111", "11111111111", "22222222222", "22222222222", "33333333333"],
+        "nome_projeto": ["a", "b", "a", "b", "a"],
+        "data_envio": [inicio, agora, inicio - pd.Timedelta(seconds=1), agora, agora],
+    }))
+
+    assert index.sync_frequency_caps(ledger, max_messages=2, days=30, now=agora) == 1
+    assert index.values(FREQUENCY_CAP).tolist() == [11111111111]
+
+    # Recalculado do zero: com a janela andando, o envio da borda sai
+    assert index.sync_frequency_caps(ledger, max_messages=2, days=30, now=agora + pd.Timedelta(seconds=1)) == 0
+
+def test_filter_counts_each_kind(index):
+    index.add(OPT_OUT_PHONE, ["5511911111111"])
+    index.add(INVALID_PHONE, ["11922222222", "11911111111"])
+    index.add(OPT_OUT_CPF, ["333.333.333-33"])
+    index.add(FREQUENCY_CAP, ["33333333333", "44444444444"])
+    campanha = pd.DataFrame({
+        "cpf": ["11111111111", "22222222222", "33333333333", "44444444444", "55555555555"],
+        "telefone_contato": ["(11) 91111-1111", "5511922222222", "11933333333", "11944444444", "11955555555"],
+    })
+
+    filtrada, contagem = index.filter(campanha)
+
+    assert filtrada["cpf"].tolist() == ["55555555555"]
+    # Uma linha suprimida por dois motivos conta nos dois
+    assert contagem == {OPT_OUT_PHONE: 1, INVALID_PHONE: 2, OPT_OUT_CPF: 1, FREQUENCY_CAP: 2}
+    assert index.filter(campanha, kinds=[OPT_OUT_CPF])[1] == {OPT_OUT_CPF: 1}
+
+def test_formatted_cpfs_take_the_fallback(monkeypatch):
+    original, chamadas = suppression.cpfs_to_int, []
+
+    def cpfs_to_int(cpfs):
+        chamadas.append(len(cpfs))
+        return original(cpfs)
+
+    monkeypatch.setattr(suppression, "cpfs_to_int", cpfs_to_int)
+
+    assert suppression._cpfs_para_int(pd.Series(["12345678909", "00000000191"])).tolist() == [12345678909, 191]
+    assert chamadas == []
+
+    valores = suppression._cpfs_para_int(pd.Series(["123.456.789-09", "00000000191", "sem cpf", None]))
+    assert valores.tolist() == [12345678909, 191, -1, -1]
+    assert chamadas == [4]
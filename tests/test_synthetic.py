@@ -0,0 +1,25 @@
+import os
+import pandas as pd
+
+from benchmarks.synthetic import carregar_sqlite, gerar_tabelas
+
+def _movimentos(engine):
+    return pd.read_sql_query("SELECT * FROM sl_movimentacao_conta_corrente ORDER BY id", engine)
+
+def test_tables_do_not_depend_on_the_day():
+    primeira, segunda = gerar_tabelas(50, 4), gerar_tabelas(50, 4)
+
+    for tabela in primeira:
+        pd.testing.assert_frame_equal(primeira[tabela], segunda[tabela])
+    assert primeira["sl_movimentacao_conta_corrente"]["data_hora"].max() < "2025-03-08"
+
+def test_file_is_reused_only_with_the_same_parameters(tmp_path):
+    path = str(tmp_path / "sempre_leitura.db")
+    original = _movimentos(carregar_sqlite(path, 50, 4, seed=1))
+    modificado = os.path.getmtime(path)
+
+    pd.testing.assert_frame_equal(_movimentos(carregar_sqlite(path, 50, 4, seed=1)), original)
+    assert os.path.getmtime(path) == modificado
+
+    assert len(_movimentos(carregar_sqlite(path, 50, 6, seed=1))) == 300
+    assert not _movimentos(carregar_sqlite(path, 50, 4, seed=2)).equals(original)
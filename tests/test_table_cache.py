@@ -0,0 +1,120 @@
+import pandas as pd
+import pytest
+
+from utils import SempreLeitura
+from table_cache import LoyaltyTableCache, MOVIMENTOS, USUARIOS, RESGATES, EMPRESAS
+from snapshots import BalanceSnapshot
+from benchmarks.synthetic import DATA_REFERENCIA
+
+NOVO_USUARIO = "12345678909"
+
+@pytest.fixture
+def cache(sqlite_engine, tmp_path):
+    cache = LoyaltyTableCache(sqlite_engine, str(tmp_path / "table_cache"))
+    cache.sync()
+    return cache
+
+def _usuarios(engine, n):
+    return pd.read_sql_query(f"SELECT usuario FROM sl_usuarios ORDER BY usuario LIMIT {n}", engine)["usuario"].tolist()
+
+def _inserir_movimento(engine, usuario, cnpj="00000000000001", tipo="C", origem="1", extra_info="999"):
+    with engine.begin() as conn:
+        ultimo = conn.exec_driver_sql("SELECT MAX(id) FROM sl_movimentacao_conta_corrente").scalar()
+        conn.exec_driver_sql(
+            "INSERT INTO sl_movimentacao_conta_corrente (id, usuario, data_hora, data_cupom, valor, tipo, origem, extra_info, cnpj_empresa) "
+            "VALUES (?, ?, '2025-03-06 10:00:00', '2025-03-06', 700, ?, ?, ?, ?)",
+            (ultimo + 1, usuario, tipo, origem, extra_info, cnpj)
+        )
+
+def _contar(engine, tabela):
+    return pd.read_sql_query(f"SELECT COUNT(*) AS n FROM {tabela}", engine)["n"].iloc[0]
+
+def test_sync_without_changes_pulls_nothing(cache, sqlite_engine):
+    assert cache.sync() == {MOVIMENTOS: 0, USUARIOS: 0, RESGATES: 0, EMPRESAS: 0}
+    for tabela in LoyaltyTableCache.TABELAS:
+        assert cache.metadata()[tabela]["rows"] == _contar(sqlite_engine, tabela)
+
+def test_sync_pulls_only_the_users_with_new_movements(cache, sqlite_engine):
+    alterado, sem_movimento = _usuarios(sqlite_engine, 2)
+    with sqlite_engine.begin() as conn:
+        conn.exec_driver_sql("UPDATE sl_usuarios SET nome_cliente = 'NOME NOVO' WHERE usuario IN (?, ?)", (alterado, sem_movimento))
+        conn.exec_driver_sql(
+            "INSERT INTO sl_usuarios (usuario, nome_cliente, email, ddd, telefone, ddd2, telefone2) "
+            "VALUES (?, 'CLIENTE NOVO', 'novo@exemplo.com', '11', '912345678', NULL, '912345678')",
+            (NOVO_USUARIO,)
+        )
+        conn.exec_driver_sql(
+            "INSERT INTO sl_historico_resgate (usuario, extra_info, cnpj_empresa_credito, valor_resgate) "
+            "VALUES (?, '999', '00000000000001', 300)",
+            (alterado,)
+        )
+    _inserir_movimento(sqlite_engine, alterado)
+    _inserir_movimento(sqlite_engine, alterado, tipo="R", origem="2")
+    _inserir_movimento(sqlite_engine, NOVO_USUARIO)
+
+    resgates_origem = pd.read_sql_query(
+        "SELECT COUNT(*) AS n FROM sl_historico_resgate WHERE usuario IN (?, ?)", sqlite_engine, params=(alterado, NOVO_USUARIO)
+    )["n"].iloc[0]
+    assert cache.sync() == {MOVIMENTOS: 3, USUARIOS: 2, RESGATES: resgates_origem, EMPRESAS: 0}
+
+    nomes = cache.read(USUARIOS, ["usuario", "nome_cliente"]).set_index("usuario")["nome_cliente"]
+    assert nomes[alterado] == "NOME NOVO"
+    assert nomes[sem_movimento] != "NOME NOVO"
+    assert nomes[NOVO_USUARIO] == "CLIENTE NOVO"
+    for tabela in LoyaltyTableCache.TABELAS:
+        assert cache.metadata()[tabela]["rows"] == len(cache.read(tabela))
+    assert len(cache.read(RESGATES)) == _contar(sqlite_engine, RESGATES)
+
+    usuarios = [alterado, NOVO_USUARIO] + _usuarios(sqlite_engine, 20)[2:]
+    do_cache = SempreLeitura(cache=cache).getMovimentosContaCorrenteBulk(usuarios)
+    do_banco = SempreLeitura(engine=sqlite_engine).getMovimentosContaCorrenteBulk(usuarios)
+    colunas = ["id", "usuario", "valor", "nome_cliente", "nome_loja", "data_cupom_mod", "valor_resgatado"]
+    pd.testing.assert_frame_equal(
+        do_cache[colunas].astype(str).reset_index(drop=True), do_banco[colunas].astype(str).reset_index(drop=True)
+    )
+
+def test_stores_are_reloaded_only_for_an_unknown_store(cache, sqlite_engine):
+    usuario = _usuarios(sqlite_engine, 1)[0]
+    lojas = _contar(sqlite_engine, EMPRESAS)
+
+    _inserir_movimento(sqlite_engine, usuario)
+    assert cache.sync()[EMPRESAS] == 0
+
+    with sqlite_engine.begin() as conn:
+        conn.exec_driver_sql("INSERT INTO ss_empresas (cnpj, descricao) VALUES ('99999999999999', 'Livraria Nova')")
+    _inserir_movimento(sqlite_engine, usuario, cnpj="99999999999999")
+    assert cache.sync()[EMPRESAS] == lojas + 1
+    assert "99999999999999" in cache.read(EMPRESAS)["cnpj"].tolist()
+
+def test_renamed_store_is_reloaded_when_its_full_load_is_old(cache, sqlite_engine):
+    cnpj = cache.read(EMPRESAS, ["cnpj"])["cnpj"].iloc[0]
+    lojas = _contar(sqlite_engine, EMPRESAS)
+    with sqlite_engine.begin() as conn:
+        conn.exec_driver_sql("UPDATE ss_empresas SET descricao = 'Livraria Renomeada' WHERE cnpj = ?", (cnpj,))
+
+    assert cache.sync()[EMPRESAS] == 0
+
+    # Carga completa de duas horas atrás: velha para max_age_minutes=60, não para o padrão de um dia
+    duas_horas_atras = (pd.Timestamp.now() - pd.Timedelta(hours=2)).isoformat(timespec="seconds")
+    cache._salvar_metadata(EMPRESAS, full_sync_at=duas_horas_atras)
+    assert cache.sync(tabelas=[EMPRESAS])[EMPRESAS] == 0
+    assert cache.staleness().set_index("tabela").loc[EMPRESAS, "full_sync_at"] == duas_horas_atras
+
+    for tabela in LoyaltyTableCache.TABELAS:
+        cache._salvar_metadata(tabela, synced_at=duas_horas_atras)
+    assert cache.sync(max_age_minutes=60)[EMPRESAS] == lojas
+    nomes = cache.read(EMPRESAS, ["cnpj", "descricao"]).set_index("cnpj")["descricao"]
+    assert nomes[cnpj] == "Livraria Renomeada"
+    assert cache.staleness().set_index("tabela").loc[EMPRESAS, "full_sync_at"] > duas_horas_atras
+
+def test_consistency_check_reads_the_database(cache, sqlite_engine, tmp_path):
+    snapshot = BalanceSnapshot(SempreLeitura(cache=cache, data_referencia=DATA_REFERENCIA), str(tmp_path / "snapshot.db"))
+    snapshot.update()
+    assert snapshot.verificar_consistencia(amostra=1000).empty
+
+    # Movimento que chegou ao banco depois da última sincronização do cache
+    usuario = _usuarios(sqlite_engine, 1)[0]
+    _inserir_movimento(sqlite_engine, usuario)
+
+    assert snapshot.verificar_consistencia(amostra=1000)["usuario"].tolist() == [usuario]
+    assert snapshot.verificar_consistencia(amostra=1000, origem=SempreLeitura(cache=cache, data_referencia=DATA_REFERENCIA)).empty
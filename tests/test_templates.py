@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils import TemplateMensagem, TemplateMensagemLote
+
+@pytest.fixture
+def campanha():
+    rng = np.random.default_rng(0)
+    n = 200
+    inicio = pd.Timestamp("2025-03-10") + pd.to_timedelta(rng.integers(0, 30, n), unit="D")
+    fim = inicio + pd.to_timedelta(rng.integers(0, 20, n), unit="D")
+    return pd.DataFrame({
+        # Um nome com % para o template % não confundir com um campo
+        "primeiro_nome": rng.choice(["Ana", "José", "Maria Clara", "100% Leitor"], n),
+        "cpf": [f"{valor:011d}" for valor in rng.integers(0, 10**11, n)],
+        "Saldo": rng.uniform(1000, 5_000_000, n).round(2),
+        "creditos_a_expirar": rng.uniform(0, 100_000, n).round(2),
+        "data_min_a_expirar": inicio,
+        # Sem data final, com a mesma data e com um intervalo
+        "data_max_a_expirar": pd.Series(fim).where(rng.random(n) > 0.3),
+        "nome_loja": rng.choice(["Livraria Centro", "Loja Shopping"], n),
+    })
+
+def _por_linha(campanha, metodo):
+    mensagens = []
+    for linha in campanha.itertuples(index=False):
+        template = TemplateMensagem(linha.primeiro_nome, linha.cpf)
+        if metodo == "pontos_a_expirar":
+            mensagens.append(template.pontos_a_expirar(
+                linha.data_min_a_expirar, linha.data_max_a_expirar, linha.creditos_a_expirar, linha.Saldo
+            ))
+        elif metodo == "loja_especifica":
+            mensagens.append(template.loja_especifica(linha.nome_loja, linha.Saldo))
+        else:
+            mensagens.append(template.pre_venda_copa())
+    return mensagens
+
+def _lote(campanha, metodo):
+    template = TemplateMensagemLote(campanha)
+    if metodo == "pontos_a_expirar":
+        return template.pontos_a_expirar()
+    if metodo == "loja_especifica":
+        return template.loja_especifica(campanha["nome_loja"])
+    return template.pre_venda_copa()
+
+@pytest.mark.parametrize("metodo", ["pontos_a_expirar", "loja_especifica", "pre_venda_copa"])
+def test_batch_matches_row_by_row(campanha, metodo):
+    assert (campanha["data_min_a_expirar"] == campanha["data_max_a_expirar"]).any()
+
+    lote = _lote(campanha, metodo)
+
+    assert lote.index.equals(campanha.index)
+    assert lote.tolist() == _por_linha(campanha, metodo)
+
+def test_store_name_can_be_a_single_value(campanha):
+    assert TemplateMensagemLote(campanha).loja_especifica("Livraria Centro").tolist() == \
+        _por_linha(campanha.assign(nome_loja="Livraria Centro"), "loja_especifica")
+
+@pytest.mark.parametrize("metodo", ["pontos_a_expirar", "loja_especifica"])
+def test_batch_rejects_less_than_1000_points(campanha, metodo):
+    with pytest.raises(ValueError):
+        _lote(campanha.assign(Saldo=campanha["Saldo"].where(campanha.index != 5, 999)), metodo)
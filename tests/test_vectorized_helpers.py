@@ -0,0 +1,78 @@
+import random
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils import select_phone_number, select_phone_numbers, validar_cpf, validar_cpfs
+
+LARGURA_TOTAL = str.maketrans("0123456789", "０１２３４５６７８９")
+
+def _cpf_valido(rng):
+    numeros = [rng.randrange(10) for _ in range(9)]
+    for tamanho in (9, 10):
+        soma = sum(a * b for a, b in zip(numeros, range(tamanho + 1, 1, -1)))
+        numeros.append(soma * 10 % 11 % 10)
+    return "".join(map(str, numeros))
+
+def _cpf(rng):
+    cpf = _cpf_valido(rng)
+    sorteio = rng.random()
+    if sorteio < 0.15:
+        cpf = cpf[:9] + str((int(cpf[9]) + 1) % 10) + cpf[10]
+    elif sorteio < 0.3:
+        cpf = cpf[:10] + str((int(cpf[10]) + 1) % 10)
+    elif sorteio < 0.35:
+        cpf = str(rng.randrange(10)) * 11
+    elif sorteio < 0.45:
+        cpf = cpf[:rng.randrange(11)]
+    elif sorteio < 0.55:
+        cpf = f"{cpf[:3]}.{cpf[3:6]}.{cpf[6:9]}-{cpf[9:]}"
+    elif sorteio < 0.65:
+        # Alguns dígitos em largura total, que str.isdigit e int() aceitam
+        cpf = "".join(d.translate(LARGURA_TOTAL) if rng.random() < 0.5 else d for d in cpf)
+    elif sorteio < 0.7:
+        cpf = cpf + str(rng.randrange(10))
+    return cpf
+
+@pytest.mark.parametrize("seed", range(5))
+def test_validar_cpfs_matches_validar_cpf(seed):
+    rng = random.Random(seed)
+    cpfs = pd.Series([_cpf(rng) for _ in range(2000)])
+
+    validos, contagem = validar_cpfs(cpfs)
+
+    esperado = cpfs.map(lambda cpf: validar_cpf(cpf) is not None)
+    assert validos.tolist() == esperado.tolist()
+    assert sum(contagem.values()) == (~esperado).sum()
+    assert cpfs.str.contains("[０-９]").any()
+
+def _telefone(rng):
+    sorteio = rng.random()
+    if sorteio < 0.15:
+        return None
+    if sorteio < 0.2:
+        return np.nan
+    if sorteio < 0.25:
+        return ""
+    ddd = str(rng.randrange(11, 100))
+    if sorteio < 0.5:
+        # Fixo: dez dígitos com o terceiro 1 ou 3
+        numero = ddd + rng.choice("13") + "".join(str(rng.randrange(10)) for _ in range(7))
+    else:
+        numero = ddd + "9" + "".join(str(rng.randrange(10)) for _ in range(rng.choice([7, 8])))
+    return numero.translate(LARGURA_TOTAL) if rng.random() < 0.05 else numero
+
+@pytest.mark.parametrize("seed", range(5))
+def test_select_phone_numbers_matches_select_phone_number(seed):
+    rng = random.Random(seed)
+    phones = pd.Series([_telefone(rng) for _ in range(2000)], dtype=object)
+    phones2 = pd.Series([_telefone(rng) for _ in range(2000)], dtype=object)
+
+    selecionados = select_phone_numbers(phones, phones2)
+
+    for i, (phone, phone2) in enumerate(zip(phones, phones2)):
+        esperado = select_phone_number(phone, phone2)
+        if pd.isna(esperado):
+            assert pd.isna(selecionados[i]), (phone, phone2)
+        else:
+            assert selecionados[i] == esperado, (phone, phone2)
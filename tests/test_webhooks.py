@@ -0,0 +1,80 @@
+import asyncio
+import sqlite3
+import pytest
+
+from webhooks import WebhookStore, WebhookReceiver, parse_callback
+
+def _status(message_id, status, momment):
+    return parse_callback({
+        "type": "MessageStatusCallback", "ids": [message_id], "status": status, "momment": momment, "phone": "5511999999999"
+    })
+
+@pytest.fixture
+def store(tmp_path):
+    return WebhookStore(str(tmp_path / "send_queue.db"))
+
+def _linha(store, message_id):
+    return store.conn.execute(
+        "SELECT status, delivered_at, read_at FROM message_status WHERE message_id = ?", (message_id,)
+    ).fetchone()
+
+@pytest.mark.parametrize("status", ["READ", "PLAYED"])
+def test_read_or_played_marks_delivered(store, status):
+    store.write_batch(_status("m1", status, 100))
+
+    assert _linha(store, "m1") == (status, 100, 100)
+
+def test_delivery_keeps_the_earliest_moment(store):
+    # O READ chegou antes do RECEIVED, que tem o momento real da entrega
+    store.write_batch(_status("m1", "READ", 300))
+    store.write_batch(_status("m1", "RECEIVED", 200))
+    store.write_batch(_status("m1", "PLAYED", 400))
+
+    assert _linha(store, "m1") == ("PLAYED", 200, 300)
+
+class _StoreInstavel(WebhookStore):
+    """Falha nas primeiras `falhas` escritas de lote"""
+    def __init__(self, path, falhas):
+        super().__init__(path)
+        self.falhas = falhas
+
+    def write_batch(self, eventos, opt_out_keywords=None):
+        if self.falhas > 0:
+            self.falhas -= 1
+            raise sqlite3.OperationalError("database is locked")
+        return super().write_batch(eventos)
+
+def _receber(receiver, eventos):
+    async def rodar():
+        await receiver._start(None)
+        for evento in eventos:
+            await receiver._queue.put(evento)
+        await receiver._stop(None)
+
+    asyncio.run(rodar())
+
+def test_failed_batch_is_retried(tmp_path):
+    store = _StoreInstavel(str(tmp_path / "send_queue.db"), falhas=2)
+    receiver = WebhookReceiver(store, write_retries=3, retry_backoff=0.01)
+
+    _receber(receiver, _status("m1", "RECEIVED", 100) + _status("m2", "READ", 200))
+
+    assert receiver.written == 2
+    assert receiver.dead_lettered == 0
+    assert _linha(store, "m2") == ("READ", 200, 200)
+
+def test_batch_that_keeps_failing_goes_to_dead_letter(tmp_path):
+    store = _StoreInstavel(str(tmp_path / "send_queue.db"), falhas=10)
+    receiver = WebhookReceiver(store, write_retries=2, retry_backoff=0.01)
+
+    _receber(receiver, _status("m1", "RECEIVED", 100) + _status("m2", "READ", 200))
+
+    assert receiver.written == 0
+    assert receiver.dead_lettered == 2
+    assert _linha(store, "m1") is None
+
+    store.falhas = 0
+    assert store.replay_dead_letter() == 2
+    assert _linha(store, "m1") == ("RECEIVED", 100, None)
+    assert _linha(store, "m2") == ("READ", 200, 200)
+    assert store.replay_dead_letter() == 0
@@ -0,0 +1,84 @@
+import pytest
+
+from zapi_client import ZAPIClient
+from zapi_pool import ZAPIPool
+from zapi_transport import ZAPITransport, CircuitBreaker
+
+class _Relogio:
+    def __init__(self):
+        self.agora = 0.0
+
+    def __call__(self):
+        return self.agora
+
+def test_from_env(monkeypatch):
+    monkeypatch.setenv("ZAPI_INSTANCES", " instancia1:token1, instancia2:token2 ,")
+    monkeypatch.setenv("ZAPI_CLIENT_TOKEN", "cliente")
+
+    pool = ZAPIPool.from_env()
+
+    assert {i: c.instance_token for i, c in pool.clients.items()} == {"instancia1": "token1", "instancia2": "token2"}
+    assert all(c.client_token == "cliente" for c in pool.clients.values())
+
+@pytest.mark.parametrize("instancias, mensagem", [
+    ("instancia1:token1,instancia2", r"entry 2 \(instancia2\)"),
+    ("instancia1:token1,instancia2:", r"entry 2 \(instancia2\)"),
+    ("instancia1:token1,:token2", r"entry 2 \(no id\)"),
+])
+def test_from_env_rejects_malformed_entries(monkeypatch, instancias, mensagem):
+    monkeypatch.setenv("ZAPI_INSTANCES", instancias)
+
+    with pytest.raises(ValueError, match=mensagem) as erro:
+        ZAPIPool.from_env()
+    assert "token1" not in str(erro.value)
+
+def test_instance_returns_to_rotation_for_the_probe():
+    relogio = _Relogio()
+    clients = [
+        ZAPIClient(instance_id, "token", "cliente", transport=ZAPITransport(
+            breaker=CircuitBreaker(min_requests=2, cooldown=10, clock=relogio), block_when_open=False
+        ))
+        for instance_id in ["instancia1", "instancia2"]
+    ]
+    pool = ZAPIPool(clients)
+    breaker = pool.clients["instancia1"].transport.breaker
+    telefone = next(f"55119{n:08d}" for n in range(1000) if pool.instances_for(f"55119{n:08d}")[0] == "instancia1")
+
+    breaker.record(False)
+    breaker.record(False)
+    assert not pool.healthy("instancia1")
+    assert pool.instance_for(telefone) == "instancia2"
+
+    # Passado o cooldown o breaker ainda está aberto, mas aceita a requisição de teste
+    relogio.agora = 10
+    assert breaker.state == CircuitBreaker.OPEN
+    assert pool.healthy("instancia1")
+    assert pool.instance_for(telefone) == "instancia1"
+
+    # Com a requisição de teste em andamento as outras vão para a próxima instância
+    breaker.try_acquire()
+    assert not pool.healthy("instancia1")
+    assert pool.instance_for(telefone) == "instancia2"
+
+def test_adding_or_removing_an_instance_moves_few_phones():
+    instancias = [f"instancia{i}" for i in range(1, 6)]
+    telefones = [f"55119{n:08d}" for n in range(10_000)]
+
+    def rotas(ids):
+        pool = ZAPIPool([ZAPIClient(instance_id, "token", "cliente") for instance_id in ids])
+        return {telefone: pool.instances_for(telefone)[0] for telefone in telefones}
+
+    antes = rotas(instancias)
+    com_nova = rotas(instancias + ["instancia6"])
+    sem_uma = rotas(instancias[1:])
+
+    # Só mudam os telefones que vão para a instância nova, cerca de 1/6 deles
+    movidos = [t for t in telefones if com_nova[t] != antes[t]]
+    assert all(com_nova[t] == "instancia6" for t in movidos)
+    assert len(movidos) / len(telefones) == pytest.approx(1 / 6, abs=0.05)
+
+    # Só mudam os telefones da instância removida, cerca de 1/5 deles
+    movidos = [t for t in telefones if sem_uma[t] != antes[t]]
+    assert all(antes[t] == "instancia1" for t in movidos)
+    assert len(movidos) == sum(rota == "instancia1" for rota in antes.values())
+    assert len(movidos) / len(telefones) == pytest.approx(1 / 5, abs=0.05)
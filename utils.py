@@ -1,19 +1,80 @@
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 import logging
 import dotenv
 import os
-import requests
 import re
-from sqlalchemy import create_engine
+import string
+import threading
+import unicodedata
+from functools import lru_cache
 from datetime import datetime, timedelta
-from babel import Locale
-from babel.dates import format_date
-
-locale = Locale('pt', 'BR')
+from metrics import metrics
+# ZAPIClient vive em zapi_client, que não carrega pandas; continua importável daqui
+from zapi_client import ZAPIClient
 
+# SQLAlchemy e babel são importados onde são usados, para quem não consulta o banco nem formata datas não pagar por eles.
+# O .env é carregado aqui para os scripts por célula; o cli.py o carrega por conta própria
 dotenv.load_dotenv()
 
+# Engines compartilhados pelo processo, um por conjunto de parâmetros de conexão
+_engines = {}
+_engines_lock = threading.Lock()
+_connections_opened = 0
+
+def get_engine(url: str, pool_size: int = 5, max_overflow: int = 10, pool_pre_ping: bool = True, pool_recycle: int = 3600):
+    """
+    Returns the process-wide engine for the given connection parameters, creating it on first use.
+
+    :param url: SQLAlchemy database URL
+    :param pool_size: Connections kept open in the pool
+    :param max_overflow: Extra connections allowed above pool_size
+    :param pool_pre_ping: Checks connections before handing them out
+    :param pool_recycle: Seconds after which a connection is replaced
+    :return: SQLAlchemy engine
+    """
+    from sqlalchemy import create_engine, event
+
+    key = (url, pool_size, max_overflow, pool_pre_ping, pool_recycle)
+
+    with _engines_lock:
+        if key not in _engines:
+            engine = create_engine(
+                url,
+                pool_size=pool_size,
+                max_overflow=max_overflow,
+                pool_pre_ping=pool_pre_ping,
+                pool_recycle=pool_recycle
+            )
+            event.listen(engine, "connect", _count_connection)
+            _engines[key] = engine
+
+    return _engines[key]
+
+def dispose_engines(close: bool = True):
+    """
+    Closes and forgets every engine from get_engine, e.g. at the end of the process or after a fork.
+
+    :param close: False in a forked child, to drop the pooled connections inherited from the parent
+        without closing them, as the parent still uses them
+    """
+    with _engines_lock:
+        engines = list(_engines.values())
+        _engines.clear()
+    for engine in engines:
+        engine.dispose(close=close)
+
+def connections_opened() -> int:
+    """Number of physical connections opened by engines from get_engine"""
+    return _connections_opened
+
+def _count_connection(dbapi_connection, connection_record):
+    global _connections_opened
+    with _engines_lock:
+        _connections_opened += 1
+
 def select_phone_number(phone, phone2):
     # If one is null, return the other
     if pd.isna(phone):
@@ -29,6 +90,117 @@ def select_phone_number(phone, phone2):
 
     return phone if phone else phone2
 
+def select_phone_numbers(phones: pd.Series, phones2: pd.Series) -> pd.Series:
+    """Column version of select_phone_number, with the same result for every row"""
+    phones_str, phones2_str = phones.astype(str), phones2.astype(str)
+
+    # If its not a mobile phone (or is empty), use the other
+    fixo = (phones_str.str.len() == 10) & phones_str.str[2].isin(["1", "3"])
+    selected = phones_str.where(~(fixo | phones_str.eq("")), phones2_str)
+
+    # If one is null, use the other as is
+    selected = selected.where(phones2.notna(), phones)
+    selected = selected.where(phones.notna(), phones2)
+
+    return selected
+
+def normalize_phones(phones: pd.Series) -> pd.Series:
+    """
+    Phones as int64 DDD + number, so "5511999999999", "(11) 99999-9999" and "11999999999" compare equal.
+    Numbers without 10 or 11 digits (after dropping the country code 55) become -1.
+    """
+    # pyarrow.compute faz as mesmas operações de texto que .str cerca de 10x mais rápido
+    digitos = pc.fill_null(pc.replace_substring_regex(pa.array(phones.astype("string")), r"\D", ""), "")
+    com_ddi = pc.and_(pc.is_in(pc.utf8_length(digitos), pa.array([12, 13], pa.int32())), pc.starts_with(digitos, "55"))
+    digitos = pc.if_else(com_ddi, pc.utf8_slice_codeunits(digitos, 2), digitos)
+    validos = pc.is_in(pc.utf8_length(digitos), pa.array([10, 11], pa.int32()))
+    return pd.Series(pc.cast(pc.if_else(validos, digitos, "-1"), pa.int64()).to_numpy(), index=phones.index)
+
+_DANGEROUS_SQL_PATTERNS = [
+    re.compile(r"(--|#)"),  # SQL comments
+    re.compile(r"(/\*.*\*/)"),  # Block comments
+    #re.compile(r"(;)"),  # Multiple statements
+    re.compile(r"\b(DELETE|DROP|TRUNCATE|INSERT|UPDATE)\b", re.IGNORECASE)  # DDL/DML operations
+]
+
+def validate_sql_read_query(query: str):
+    """Validates SQL query to check for suspicious patterns"""
+    for pattern in _DANGEROUS_SQL_PATTERNS:
+        if pattern.search(query):
+            raise ValueError("Potential SQL injection detected!")
+
+# Trechos que só existem no SQL Server; os outros dialetos (ex.: SQLite nos testes locais) usam SQL padrão
+_SQL_DIALETOS = {
+    "mssql": {
+        "nolock": "(NOLOCK)",
+        "data_hora_texto": "CONVERT(VARCHAR(10), mf.data_hora, 120)",
+        "tabela_empresas": "simpleset.dbo.ss_empresas",
+        # A conversão fica no parâmetro, não na coluna, para o filtro de data usar o índice de data_hora
+        "param_data_inicio": "CONVERT(DATETIME, :data_inicio, 120)",
+        "param_data_fim": "CONVERT(DATETIME, :data_fim, 120)",
+        # Para data_hora em varchar; o pyodbc manda str como nvarchar, que converteria a coluna
+        "param_data_inicio_texto": "CONVERT(VARCHAR(19), :data_inicio)",
+        "param_data_fim_texto": "CONVERT(VARCHAR(19), :data_fim)",
+    },
+    "default": {
+        "nolock": "",
+        "data_hora_texto": "SUBSTR(mf.data_hora, 1, 10)",
+        "tabela_empresas": "ss_empresas",
+        "param_data_inicio": ":data_inicio",
+        "param_data_fim": ":data_fim",
+        "param_data_inicio_texto": ":data_inicio",
+        "param_data_fim_texto": ":data_fim",
+    },
+}
+
+class QueryRegistry:
+    """
+    Named, parameterized read statements. Each statement is validated once when registered and
+    compiled once per dialect, so the server sees the same text (and reuses its plan) on every call.
+    """
+    def __init__(self):
+        self._templates = {}
+        self._statements = {}
+
+    def register(self, name: str, sql: str, expanding=()):
+        """
+        :param name: Name used to get the statement
+        :param sql: SQL with named placeholders (:param) and, optionally, the {nolock},
+            {data_hora_texto}, {tabela_empresas}, {param_data_inicio}, {param_data_fim},
+            {param_data_inicio_texto} and {param_data_fim_texto} dialect fragments
+        :param expanding: Parameters that receive a list (used as IN :param)
+        """
+        validate_sql_read_query(sql)
+        self._templates[name] = (sql, tuple(expanding))
+        self._statements = {key: value for key, value in self._statements.items() if key[0] != name}
+
+    def get(self, name: str, dialect: str = "mssql"):
+        dialect = dialect if dialect in _SQL_DIALETOS else "default"
+        key = (name, dialect)
+
+        if key not in self._statements:
+            from sqlalchemy import text, bindparam
+
+            sql, expanding = self._templates[name]
+            self._statements[key] = text(sql.format(**_SQL_DIALETOS[dialect])).bindparams(
+                *[bindparam(param, expanding=True) for param in expanding]
+            )
+
+        return self._statements[key]
+
+    def __contains__(self, name):
+        return name in self._templates
+
+queries = QueryRegistry()
+
+@lru_cache(maxsize=256)
+def _ad_hoc_statement(query: str):
+    # Queries avulsas são validadas e compiladas uma única vez por texto
+    from sqlalchemy import text
+
+    validate_sql_read_query(query)
+    return text(query)
+
 class SempreLeitura:
     TIPO_MOVIMENTO_CREDITO = "C"
     TIPO_MOVIMENTO_DEBITO = "D"
@@ -41,51 +213,100 @@ class SempreLeitura:
     VALIDADE_PONTOS_DIAS = 365
     DIAS_A_EXPIRAR = 30
 
-    def __init__(self):
-        self.engine = SQLServer().define_engine()
+    def __init__(self, engine=None, cache=None, data_referencia=None):
+        """
+        :param engine: Engine of the Sempre Leitura database (defaults to the DB_* environment variables)
+        :param cache: LoyaltyTableCache to read from instead of the database
+        :param data_referencia: Day the balances and expirations are computed for (defaults to today)
+        """
+        self.cache = cache
+        self.data_referencia = data_referencia
+        if engine:
+            self.engine = engine
+        else:
+            self.engine = SQLServer().engine if cache is None else None
 
+    @metrics.timed("sempreleitura.getMovimentosContaCorrente", rows=len)
     def getMovimentosContaCorrente(self, usuario: str):
-        query = f"""
-        SELECT 
-            mf.*, 
-            u.nome_cliente, 
-            e.descricao AS nome_loja, 
-            ISNULL(mf.data_cupom, CONVERT(VARCHAR(10), mf.data_hora, 120)) AS data_cupom_mod, 
-            ISNULL((
-                SELECT SUM(ISNULL(hr.valor_resgate, 0))
-                FROM sl_historico_resgate hr (NOLOCK)
-                WHERE hr.usuario = mf.usuario
-                AND hr.extra_info = mf.extra_info
-                AND hr.cnpj_empresa_credito = mf.cnpj_empresa
-            ), 0) AS valor_resgatado, 
-            u.email 
-        FROM 
-            sl_movimentacao_conta_corrente mf (NOLOCK)
-        INNER JOIN 
-            sl_usuarios u (NOLOCK) ON u.usuario = mf.usuario
-        INNER JOIN 
-            simpleset.dbo.ss_empresas e (NOLOCK) ON e.cnpj = mf.cnpj_empresa
-        WHERE 
-            1 = 1
-            AND mf.usuario = '{usuario}'
-        ORDER BY 
-            ISNULL(mf.data_cupom, CONVERT(VARCHAR(10), mf.data_hora, 120)), 
-            mf.id;
+        if self.cache is not None:
+            return self.cache.movimentos_conta_corrente([usuario])
+
+        with self.engine.connect() as conn:
+            df = pd.read_sql_query(
+                queries.get("movimentos_conta_corrente", self.engine.dialect.name), conn,
+                params={"usuario": usuario}
+            )
+
+        return df
+
+    @metrics.timed("sempreleitura.getMovimentosContaCorrenteBulk", rows=len)
+    def getMovimentosContaCorrenteBulk(self, usuarios, chunk_size: int = 1000):
+        """
+        Loads the movements of many users at once, one query per chunk of users.
+
+        :param usuarios: Iterable of users (CPFs)
+        :param chunk_size: Users per query (SQL Server accepts at most 2100 parameters)
+        :return: Pandas DataFrame ordered by usuario, data_cupom_mod and id
+        """
+        # Em ordem, para os chunks (cada um ordenado pela query) saírem ordenados também entre si
+        usuarios = sorted(set(usuarios))
+        if not usuarios:
+            return pd.DataFrame()
+        if self.cache is not None:
+            return self.cache.movimentos_conta_corrente(usuarios)
+
+        query = queries.get("movimentos_conta_corrente_bulk", self.engine.dialect.name)
+
+        dfs = []
+        with self.engine.connect() as conn:
+            for i in range(0, len(usuarios), chunk_size):
+                chunk = usuarios[i:i + chunk_size]
+                dfs.append(pd.read_sql_query(query, conn, params={"usuarios": chunk}))
+
+        return pd.concat(dfs, ignore_index=True)
+
+    def getMovimentosDesde(self, ultimo_id: int = 0):
+        """
+        Loads every movement with id greater than ultimo_id, with the columns needed to update a balance.
+
+        :param ultimo_id: Highest movement id already processed
+        :return: Pandas DataFrame ordered by id
         """
+        if self.cache is not None:
+            return self.cache.movimentos_desde(ultimo_id)
 
         with self.engine.connect() as conn:
-            df = pd.read_sql_query(query, conn)
+            df = pd.read_sql_query(
+                queries.get("movimentos_desde", self.engine.dialect.name), conn,
+                params={"ultimo_id": ultimo_id}
+            )
 
         return df
 
+    def getResgatesAgrupados(self, usuarios, chunk_size: int = 1000):
+        """Sums the redemptions of the users by (usuario, extra_info, cnpj_empresa_credito)"""
+        usuarios = list(dict.fromkeys(usuarios))
+        if not usuarios:
+            return pd.DataFrame(columns=["usuario", "extra_info", "cnpj_empresa_credito", "valor_resgatado"])
+        if self.cache is not None:
+            return self.cache.resgates_agrupados(usuarios)
+
+        query = queries.get("resgates_agrupados", self.engine.dialect.name)
+
+        dfs = []
+        with self.engine.connect() as conn:
+            for i in range(0, len(usuarios), chunk_size):
+                dfs.append(pd.read_sql_query(query, conn, params={"usuarios": usuarios[i:i + chunk_size]}))
+
+        return pd.concat(dfs, ignore_index=True)
+
+    @metrics.timed("sempreleitura.calculate_balance")
     def calculate_balance(self, df):
         if df.empty:
             return {}
 
         # Nos subtraimos um dia a data de expiração para garantir que o último dia seja considerado
-        data_limite_expiracao = (datetime.today() - timedelta(days=self.VALIDADE_PONTOS_DIAS))
-        data_limite_expiracao = data_limite_expiracao.replace(hour=0, minute=0, second=0, microsecond=0)
-        data_limite_a_expirar = (data_limite_expiracao + timedelta(days=self.DIAS_A_EXPIRAR))
+        data_limite_expiracao, data_limite_a_expirar = self.datas_limite()
 
         a_totalizadores = {
             'Créditos': 0,
@@ -125,114 +346,329 @@ class SempreLeitura:
             "datas_a_expirar": datas_a_expirar,
         } | a_totalizadores
 
+    def datas_limite(self):
+        """Coupon dates before which credits are expired and before which they are about to expire"""
+        hoje = self.data_referencia if self.data_referencia is not None else datetime.today()
+        data_limite_expiracao = (hoje - timedelta(days=self.VALIDADE_PONTOS_DIAS))
+        data_limite_expiracao = data_limite_expiracao.replace(hour=0, minute=0, second=0, microsecond=0)
+        data_limite_a_expirar = (data_limite_expiracao + timedelta(days=self.DIAS_A_EXPIRAR))
+        return data_limite_expiracao, data_limite_a_expirar
+
+    @metrics.timed("sempreleitura.calculate_balances", rows=len)
+    def calculate_balances(self, df):
+        """
+        Columnar version of calculate_balance: computes the balance of every user in df at once.
+
+        :param df: Movements of one or more users, as returned by getMovimentosContaCorrenteBulk
+        :return: Pandas DataFrame with one row per user and the same keys as calculate_balance
+        """
+        colunas = [
+            "usuario", "datas_a_expirar", "Créditos", "Débitos", "Saldo",
+            "Créditos Expirados", "Créditos a Expirar"
+        ]
+        if df.empty:
+            return pd.DataFrame(columns=colunas)
+
+        data_limite_expiracao, data_limite_a_expirar = self.datas_limite()
+
+        valor = df["valor"]
+        valor_resgatado = df["valor_resgatado"] if "valor_resgatado" in df.columns else 0
+        data_cupom = pd.to_datetime(df["data_cupom_mod"], format="%Y-%m-%d")
+
+        credito = df["tipo"].eq(self.TIPO_MOVIMENTO_CREDITO)
+        debito = df["tipo"].isin([self.TIPO_MOVIMENTO_DEBITO, self.TIPO_MOVIMENTO_RESGATE])
+
+        valor_disponivel = valor - valor_resgatado
+        disponivel = credito & df["origem"].eq(self.ORIGEM_PONTUACAO_COMPRA) & (valor_disponivel > 0)
+        expirado = disponivel & (data_cupom < data_limite_expiracao)
+        a_expirar = disponivel & (data_cupom >= data_limite_expiracao) & (data_cupom < data_limite_a_expirar)
+
+        totalizadores = pd.DataFrame({
+            "usuario": df["usuario"],
+            "Créditos": valor.where(credito, 0),
+            "Débitos": valor.where(debito, 0),
+            "Créditos Expirados": valor_disponivel.where(expirado, 0),
+            "Créditos a Expirar": valor_disponivel.where(a_expirar, 0),
+        }).groupby("usuario", sort=False).sum()
+
+        totalizadores["Saldo"] = (
+            totalizadores["Créditos"] - totalizadores["Débitos"] - totalizadores["Créditos Expirados"]
+        )
+
+        datas_a_expirar = (
+            (data_cupom[a_expirar] + timedelta(days=self.VALIDADE_PONTOS_DIAS))
+                .groupby(df["usuario"][a_expirar], sort=False)
+                .agg(list)
+        )
+        totalizadores["datas_a_expirar"] = [datas_a_expirar.get(usuario, []) for usuario in totalizadores.index]
+
+        return totalizadores.reset_index()[colunas]
+
+queries.register("movimentos_conta_corrente", """
+SELECT 
+    mf.*, 
+    u.nome_cliente, 
+    e.descricao AS nome_loja, 
+    COALESCE(mf.data_cupom, {data_hora_texto}) AS data_cupom_mod, 
+    COALESCE((
+        SELECT SUM(COALESCE(hr.valor_resgate, 0))
+        FROM sl_historico_resgate hr {nolock}
+        WHERE hr.usuario = mf.usuario
+        AND hr.extra_info = mf.extra_info
+        AND hr.cnpj_empresa_credito = mf.cnpj_empresa
+    ), 0) AS valor_resgatado, 
+    u.email 
+FROM 
+    sl_movimentacao_conta_corrente mf {nolock}
+INNER JOIN 
+    sl_usuarios u {nolock} ON u.usuario = mf.usuario
+INNER JOIN 
+    {tabela_empresas} e {nolock} ON e.cnpj = mf.cnpj_empresa
+WHERE 
+    1 = 1
+    AND mf.usuario = :usuario
+ORDER BY 
+    COALESCE(mf.data_cupom, {data_hora_texto}), 
+    mf.id
+""")
+
+# Os resgates são somados uma única vez por (usuario, extra_info, cnpj) em vez de
+# uma subquery correlacionada por movimento
+queries.register("movimentos_conta_corrente_bulk", """
+SELECT 
+    mf.*, 
+    u.nome_cliente, 
+    e.descricao AS nome_loja, 
+    COALESCE(mf.data_cupom, {data_hora_texto}) AS data_cupom_mod, 
+    COALESCE(hr.valor_resgatado, 0) AS valor_resgatado, 
+    u.email 
+FROM 
+    sl_movimentacao_conta_corrente mf {nolock}
+INNER JOIN 
+    sl_usuarios u {nolock} ON u.usuario = mf.usuario
+INNER JOIN 
+    {tabela_empresas} e {nolock} ON e.cnpj = mf.cnpj_empresa
+LEFT JOIN (
+    SELECT 
+        usuario, 
+        extra_info, 
+        cnpj_empresa_credito, 
+        SUM(COALESCE(valor_resgate, 0)) AS valor_resgatado
+    FROM sl_historico_resgate {nolock}
+    WHERE usuario IN :usuarios
+    GROUP BY usuario, extra_info, cnpj_empresa_credito
+) hr 
+    ON hr.usuario = mf.usuario 
+    AND hr.extra_info = mf.extra_info 
+    AND hr.cnpj_empresa_credito = mf.cnpj_empresa
+WHERE 
+    mf.usuario IN :usuarios
+ORDER BY 
+    mf.usuario, 
+    COALESCE(mf.data_cupom, {data_hora_texto}), 
+    mf.id
+""", expanding=["usuarios"])
+
+queries.register("movimentos_desde", """
+SELECT 
+    mf.id, 
+    mf.usuario, 
+    mf.data_hora, 
+    mf.valor, 
+    mf.tipo, 
+    mf.origem, 
+    mf.extra_info, 
+    mf.cnpj_empresa, 
+    COALESCE(mf.data_cupom, {data_hora_texto}) AS data_cupom_mod 
+FROM 
+    sl_movimentacao_conta_corrente mf {nolock}
+INNER JOIN 
+    sl_usuarios u {nolock} ON u.usuario = mf.usuario
+INNER JOIN 
+    {tabela_empresas} e {nolock} ON e.cnpj = mf.cnpj_empresa
+WHERE 
+    mf.id > :ultimo_id
+ORDER BY 
+    mf.id
+""")
+
+queries.register("resgates_agrupados", """
+SELECT 
+    usuario, 
+    extra_info, 
+    cnpj_empresa_credito, 
+    SUM(COALESCE(valor_resgate, 0)) AS valor_resgatado
+FROM sl_historico_resgate {nolock}
+WHERE usuario IN :usuarios
+GROUP BY usuario, extra_info, cnpj_empresa_credito
+""", expanding=["usuarios"])
+
 class SQLServer:
-    def __init__(self, server: str = None, database: str = None, username: str = None, password: str = None):
+    def __init__(
+        self, server: str = None, database: str = None, username: str = None, password: str = None,
+        engine=None, pool_size: int = 5, max_overflow: int = 10, pool_pre_ping: bool = True, pool_recycle: int = 3600,
+        share_engine: bool = True
+    ):
+        """
+        :param engine: Engine to use instead of one built from the connection parameters
+        :param share_engine: Uses the process-wide engine of get_engine; with False the instance
+            builds its own, which disconnect closes
+        """
         self.server = server if server else os.getenv("DB_SERVER")
         self.database = database if database else os.getenv("DB_NAME")
         self.username = username if username else os.getenv("DB_USERNAME")
         self.password = password if password else os.getenv("DB_PASSWORD")
 
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.pool_pre_ping = pool_pre_ping
+        self.pool_recycle = pool_recycle
+        self._engine_proprio = False
+
+        if engine is not None:
+            self.engine = engine
+            return
+
         if not all([self.server, self.database, self.username, self.password]):
             raise ValueError("Missing database connection parameters")
 
-        self.engine = self.define_engine()
+        if share_engine:
+            self.engine = self.define_engine()
+        else:
+            from sqlalchemy import create_engine
+
+            self.engine = create_engine(
+                self.connection_url(),
+                pool_size=self.pool_size,
+                max_overflow=self.max_overflow,
+                pool_pre_ping=self.pool_pre_ping,
+                pool_recycle=self.pool_recycle
+            )
+            self._engine_proprio = True
+
+    def connection_url(self) -> str:
+        return f"mssql+pyodbc://{self.username}:{self.password}@{self.server}/{self.database}?driver=ODBC+Driver+11+for+SQL+Server"
 
     def define_engine(self):
-        return create_engine(
-            f"mssql+pyodbc://{self.username}:{self.password}@{self.server}/{self.database}?driver=ODBC+Driver+11+for+SQL+Server"
+        return get_engine(
+            self.connection_url(),
+            pool_size=self.pool_size,
+            max_overflow=self.max_overflow,
+            pool_pre_ping=self.pool_pre_ping,
+            pool_recycle=self.pool_recycle
         )
 
     def disconnect(self):
-        self.engine.dispose()
+        """
+        Closes the connections of an engine this instance built (share_engine=False). Shared and
+        injected engines stay open, as other instances use them; see dispose_engines.
+        """
+        if self._engine_proprio:
+            self.engine.dispose()
     
+    @metrics.timed("sqlserver.pandas_read_sql", rows=len)
     def pandas_read_sql(self, query: str, params: dict = None):
         """
         Executes a parameterized SQL query safely and returns a Pandas DataFrame.
         
-        :param query: SQL query with named placeholders (e.g., "SELECT * FROM users WHERE id = :id")
+        :param query: Name of a statement in the query registry, or SQL query with named
+            placeholders (e.g., "SELECT * FROM users WHERE id = :id")
         :param params: Dictionary of parameters to safely inject into the query
         :return: Pandas DataFrame with the query result
         """
-        self._validate_sql_read_query(query)
         with self.engine.connect() as conn:
-            df = pd.read_sql_query(query, conn, params=params)
+            df = pd.read_sql_query(self._statement(query), conn, params=params)
 
         return df
 
-    def _validate_sql_read_query(self, query: str):
-        """Validates SQL query to check for suspicious patterns"""
-        dangerous_patterns = [
-            r"(--|#)",  # SQL comments
-            r"(/\*.*\*/)",  # Block comments
-            #r"(;)",  # Multiple statements
-            r"\b(DELETE|DROP|TRUNCATE|INSERT|UPDATE)\b"  # DDL/DML operations
-        ]
-
-        for pattern in dangerous_patterns:
-            if re.search(pattern, query, re.IGNORECASE):
-                raise ValueError("Potential SQL injection detected!")
-
-class ZAPIClient:
-    def __init__(self, instance_id=None, instance_token=None, client_token=None):
-        self.instance_id = instance_id if instance_id else os.getenv("ZAPI_INSTANCE_ID")
-        self.instance_token = instance_token if instance_token else os.getenv("ZAPI_INSTANCE_TOKEN")
-        self.client_token = client_token if client_token else os.getenv("ZAPI_CLIENT_TOKEN")
-
-    def send_text(self, phone, message, delay_message=10):
-        url = f"https://api.z-api.io/instances/{self.instance_id}/token/{self.instance_token}/send-text"
-        headers = {
-            "client-token": self.client_token,
-            "Content-Type": "application/json"
-        }
-        data = {
-            "phone": phone,
-            "message": message,
-            "delayMessage": delay_message
-        }
-
-        return requests.post(url, headers=headers, json=data)
-
-    def send_image(self, phone, caption, image_url, delay_message=10):
-        url = f"https://api.z-api.io/instances/{self.instance_id}/token/{self.instance_token}/send-image"
-        headers = {
-            "client-token": self.client_token,
-            "Content-Type": "application/json"
-        }
-        data = {
-            "phone": phone,
-            "caption": caption,
-            "image": image_url,
-            "delayMessage": delay_message
-        }
-
-        return requests.post(url, headers=headers, json=data)
-
-    def read_message(self, message_id, phone):
-        url = f"https://api.z-api.io/instances/{self.instance_id}/token/{self.instance_token}/read-message"
-        headers = {
-            "client-token": self.client_token,
-            "Content-Type": "application/json"
-        }
-        data = {
-            "phone": phone,
-            "message_id": message_id
-        }
+    def pandas_read_sql_iter(self, query: str, params: dict = None, chunksize: int = 100_000, downcast: bool = False):
+        """
+        Executes a parameterized SQL query and yields the result in DataFrames of up to chunksize rows,
+        reading from a server-side cursor so the full result is never held in memory.
 
-        return requests.post(url, headers=headers, json=data)
+        :param query: Name of a statement in the query registry, or SQL query with named
+            placeholders (e.g., "SELECT * FROM users WHERE id = :id")
+        :param params: Dictionary of parameters to safely inject into the query
+        :param chunksize: Rows per DataFrame
+        :param downcast: Applies downcast_movimentos to every chunk
+        :return: Generator of Pandas DataFrames
+        """
+        statement = self._statement(query)
+        with self.engine.connect().execution_options(stream_results=True, max_row_buffer=chunksize) as conn:
+            for chunk in pd.read_sql_query(statement, conn, params=params, chunksize=chunksize):
+                yield downcast_movimentos(chunk) if downcast else chunk
 
-    def retrieve_chats(self):
-        url = f"https://api.z-api.io/instances/{self.instance_id}/token/{self.instance_token}/chats"
-        headers = {
-            "client-token": self.client_token
-        }
-        return requests.get(url, headers=headers)
+    def _statement(self, query: str):
+        if query in queries:
+            return queries.get(query, self.engine.dialect.name)
+        return _ad_hoc_statement(query)
 
-    def get_chat_metadata(self, phone):
-        url = f"https://api.z-api.io/instances/{self.instance_id}/token/{self.instance_token}/chats/{phone}"
-        headers = {
-            "client-token": self.client_token
-        }
-        return requests.get(url, headers=headers)
+    def _validate_sql_read_query(self, query: str):
+        validate_sql_read_query(query)
+
+def downcast_movimentos(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Shrinks the usual movement columns: tipo/origem as categories, amounts as float32
+    and CPFs as Arrow-backed strings. Columns that are not present are ignored.
+    """
+    df = df.copy()
+    for coluna in ["tipo", "origem"]:
+        if coluna in df.columns:
+            df[coluna] = df[coluna].astype("category")
+    for coluna in ["valor", "valor_resgatado"]:
+        if coluna in df.columns:
+            df[coluna] = pd.to_numeric(df[coluna]).astype("float32")
+    for coluna in ["usuario", "cpf"]:
+        if coluna in df.columns:
+            df[coluna] = df[coluna].astype("string[pyarrow]")
+    return df
+
+_AGREGACOES_COMBINAVEIS = {
+    "sum": "sum",
+    "count": "sum",
+    "size": "sum",
+    "min": "min",
+    "max": "max",
+    "first": "first",
+    "last": "last",
+}
+
+def aggregate_chunks(chunks, by, compact_every: int = 8, **aggregations):
+    """
+    Runs groupby(by).agg(**aggregations) over an iterable of DataFrames, one chunk at a time.
+
+    Only aggregations that can be combined from partial results are supported
+    (sum, count, size, min, max, first, last).
+
+    :param chunks: Iterable of DataFrames, e.g. from SQLServer.pandas_read_sql_iter
+    :param by: Column (or list of columns) to group by
+    :param compact_every: Number of partial results kept before they are combined
+    :param aggregations: Named aggregations, as in DataFrame.agg (name=(column, function))
+    :return: Pandas DataFrame with one row per group, with the group columns as regular columns
+    """
+    for nome, (_, funcao) in aggregations.items():
+        if funcao not in _AGREGACOES_COMBINAVEIS:
+            raise ValueError(f"Aggregation {funcao} of {nome} cannot be computed chunk by chunk")
+
+    combinacao = {nome: (nome, _AGREGACOES_COMBINAVEIS[funcao]) for nome, (_, funcao) in aggregations.items()}
+
+    def combinar(parciais):
+        return pd.concat(parciais).groupby(level=by, sort=False, observed=True).agg(**combinacao)
+
+    parciais = []
+    for chunk in chunks:
+        # Somas de float32 acumulam erro, então as parciais são calculadas em float64
+        float32 = chunk.select_dtypes("float32").columns
+        chunk = chunk.astype({coluna: "float64" for coluna in float32})
+
+        parciais.append(chunk.groupby(by, sort=False, observed=True).agg(**aggregations))
+        if len(parciais) >= compact_every:
+            parciais = [combinar(parciais)]
+
+    if not parciais:
+        return pd.DataFrame(columns=([by] if isinstance(by, str) else list(by)) + list(aggregations))
+
+    return combinar(parciais).reset_index()
 
 def validar_cpf(cpf: str) -> bool:
     cpf = str(cpf)
@@ -257,6 +693,67 @@ def validar_cpf(cpf: str) -> bool:
 
     return cpf
 
+def validar_cpfs(cpfs: pd.Series):
+    """
+    Column version of validar_cpf. Checks the two check digits of every CPF at once.
+
+    Like validar_cpf, any Unicode decimal digit counts (e.g. fullwidth "１"). Characters that
+    str.isdigit accepts but are not decimal digits (e.g. superscripts) are ignored here, where
+    validar_cpf raises on them.
+
+    :param cpfs: Series of CPFs
+    :return: Tuple with a boolean mask of valid CPFs (True where validar_cpf returns
+        the CPF) and a dict with the number of invalid CPFs per reason
+    """
+    digitos = cpfs.astype(str).str.replace(r"\D", "", regex=True)
+    # Os poucos CPFs com dígitos fora do ASCII são convertidos um a um, como o int() de validar_cpf faz
+    fora_ascii = ~digitos.map(str.isascii)
+    if fora_ascii.any():
+        digitos[fora_ascii] = digitos[fora_ascii].map(lambda d: "".join(str(unicodedata.decimal(c)) for c in d))
+    onze_digitos = (digitos.str.len() == 11).to_numpy()
+
+    matriz = np.frombuffer(
+        "".join(digitos[onze_digitos]).encode("ascii"), dtype=np.uint8
+    ).reshape(-1, 11).astype(np.int64) - ord("0")
+
+    repetidos = (matriz == matriz[:, :1]).all(axis=1)
+
+    primeiro_digito = (matriz[:, :9] @ np.arange(10, 1, -1) * 10 % 11) % 10
+    primeiro_invalido = ~repetidos & (matriz[:, 9] != primeiro_digito)
+
+    segundo_digito = (matriz[:, :10] @ np.arange(11, 1, -1) * 10 % 11) % 10
+    segundo_invalido = ~repetidos & ~primeiro_invalido & (matriz[:, 10] != segundo_digito)
+
+    validos = np.zeros(len(cpfs), dtype=bool)
+    validos[onze_digitos] = ~(repetidos | primeiro_invalido | segundo_invalido)
+
+    contagem = {
+        "tamanho_ou_digitos_iguais": int((~onze_digitos).sum() + repetidos.sum()),
+        "primeiro_digito": int(primeiro_invalido.sum()),
+        "segundo_digito": int(segundo_invalido.sum()),
+    }
+    for motivo, quantidade in contagem.items():
+        if quantidade > 0:
+            logging.error(f"{quantidade} CPFs inválidos ({motivo}).")
+
+    return pd.Series(validos, index=cpfs.index), contagem
+
+def cpfs_to_int(cpfs: pd.Series) -> pd.Series:
+    """
+    CPFs as int64, the key used to compare them across the ledger, the suppression index and the
+    redemption reports. Formatted CPFs ("123.456.789-09") count by their digits; values without
+    digits become -1.
+    """
+    # CPFs como int64 deixam o hash set bem menor e a busca bem mais rápida que com strings
+    numeros = pd.to_numeric(cpfs, errors="coerce")
+    formatados = numeros.isna() & cpfs.notna()
+    if formatados.any():
+        numeros[formatados] = pd.to_numeric(cpfs[formatados].astype(str).str.replace(r"\D", "", regex=True), errors="coerce")
+    return numeros.fillna(-1).astype("int64")
+
+def primeiros_nomes(nomes: pd.Series) -> pd.Series:
+    return nomes.str.partition(" ")[0].str.capitalize()
+
 def clean_column_names(column_names):
     cleaned_names = []
     for name in column_names:
@@ -268,45 +765,82 @@ def clean_column_names(column_names):
         cleaned_names.append(cleaned_name)
     return cleaned_names
 
+_MENSAGEM_PRE_VENDA_COPA = (
+    "Oi, {nome_cliente}! Tudo bem? ✨\n\n"
+    "Aqui é a Lê, assistente virtual da Leitura Boulevard! Como você é um cliente especial da nossa loja, estou passando para te dar um spoiler de campeão: a pré-venda do *Álbum da Copa do Mundo 2026* já começou! ⚽🇧🇷\n\n"
+    "Temos opções para todos os tipos de colecionadores. Confira os destaques:\n\n"
+    "🏆 *Kits Premium (previsão de chegada: final de maio):*\n"
+    "• Kit Estádio (Edição Numerada): *R$ 1.129,90*\n"
+    "• Box Super Premium: *R$ 499,90*\n"
+    "• Box Premium: *R$ 429,90*\n"
+    "• Box Caixa Premium: *R$ 359,90*\n"
+    "• Box Caixa Trapezoidal: *R$ 284,90*\n\n"
+    "📖 *Álbuns e Figurinhas (previsão de chegada: início de maio):*\n"
+    "• Álbum Capa Dura (Ouro ou Prata): *R$ 79,90*\n"
+    "• Álbum Brochura: *R$ 24,90*\n"
+    "• Blister (12 envelopes): *R$ 84,00*\n\n"
+    "A procura está enorme e os boxes numerados são *limitadíssimos*!\n\n"
+    "Como você prefere garantir o seu? Pode vir aqui na nossa loja no *Boulevard Shopping* conferir de perto ou, se preferir, eu faço a sua reserva por aqui agora mesmo! O que acha? 😉\n\n"
+    "PS: Não quer mais receber essas mensagens? Sem problema! É só responder SAIR que eu paro de te enviar! 😉\n"
+)
+
+_MENSAGEM_LOJA_ESPECIFICA = (
+    "Olá, {nome_cliente}! Tudo bem?\n\n"
+    "Aqui é a Júlia, da *{nome_loja}*, e tenho uma notícia incrível:"
+    " você acumulou {numero_pontos} pontos no programa Sempre Leitura, que equivalem a *R${dinheiro}* de desconto na sua próxima compra em nossa loja! 🎉📚\n\n"
+    "Com a Volta às Aulas chegando, é uma ótima oportunidade para garantir o material escolar de alguém especial! E, claro, você também pode aproveitar seus pontos para levar aquele livro que está de olho há um tempo!\n\n"
+    "Passe na *{nome_loja}*, onde temos tudo o que você precisa — desde materiais escolares até os melhores livros!\n\n"
+    "Estamos super ansiosos para te receber e te ajudar no que precisar! 😊\n\n"
+    "*Os pontos estão atrelados ao CPF {cpf}, não podem ser transferidos e têm validade, hein! 😉 Quer saber mais? Dá uma olhada no regulamento lá no nosso site!"
+)
+
+_MENSAGEM_PONTOS_A_EXPIRAR = (
+    "Olá, {nome_cliente}! Tudo bem?\n\n"
+    "Aqui é a Júlia, do programa de pontos *Sempre Leitura*. Passando para te avisar que {pontos_a_expirar} dos seus pontos vão expirar {mensagem_data}! 📅\n\n"
+    "Que tal aproveitar essa oportunidade para garantir aquele livro dos sonhos ou qualquer outro produto que esteja na sua lista? No total, você tem {numero_pontos} pontos, que valem *R${dinheiro}* em crédito na *Livraria Leitura*! 💰📚\n\n"
+    "Mas atenção: os pontos que expiram não voltam! Então não deixe para depois—vem garantir seu resgate enquanto dá tempo!\n\n"
+    "Te esperamos na loja! Qualquer dúvida, é só me chamar. 😉\n\n"
+    "*Os pontos estão atrelados ao CPF {cpf} e não podem ser transferidos! Quer saber mais? Dá uma olhada no regulamento lá no nosso site!\n\n"
+    "PS: Não quer mais receber esses lembretes? Sem problema! É só responder SAIR que eu paro de te enviar mensagens! 😉\n\n"
+)
+
+@lru_cache(maxsize=1)
+def _locale():
+    from babel import Locale
+
+    return Locale('pt', 'BR')
+
+@lru_cache(maxsize=1024)
+def format_date_to_text(date):
+    from babel.dates import format_date
+
+    formatted_date = format_date(date, locale=_locale(), format='long')
+    formatted_date_no_year = ' '.join(formatted_date.split()[:-2])
+    return formatted_date_no_year
+
 class TemplateMensagem:
     def __init__(self, nome_cliente, cpf):
         self.nome_cliente = nome_cliente
         self.cpf = cpf
 
+    @metrics.timed("template.pre_venda_copa")
     def pre_venda_copa(self):
-        return (
-            f"Oi, {self.nome_cliente}! Tudo bem? ✨\n\n"
-            "Aqui é a Lê, assistente virtual da Leitura Boulevard! Como você é um cliente especial da nossa loja, estou passando para te dar um spoiler de campeão: a pré-venda do *Álbum da Copa do Mundo 2026* já começou! ⚽🇧🇷\n\n"
-            "Temos opções para todos os tipos de colecionadores. Confira os destaques:\n\n"
-            "🏆 *Kits Premium (previsão de chegada: final de maio):*\n"
-            "• Kit Estádio (Edição Numerada): *R$ 1.129,90*\n"
-            "• Box Super Premium: *R$ 499,90*\n"
-            "• Box Premium: *R$ 429,90*\n"
-            "• Box Caixa Premium: *R$ 359,90*\n"
-            "• Box Caixa Trapezoidal: *R$ 284,90*\n\n"
-            "📖 *Álbuns e Figurinhas (previsão de chegada: início de maio):*\n"
-            "• Álbum Capa Dura (Ouro ou Prata): *R$ 79,90*\n"
-            "• Álbum Brochura: *R$ 24,90*\n"
-            "• Blister (12 envelopes): *R$ 84,00*\n\n"
-            "A procura está enorme e os boxes numerados são *limitadíssimos*!\n\n"
-            "Como você prefere garantir o seu? Pode vir aqui na nossa loja no *Boulevard Shopping* conferir de perto ou, se preferir, eu faço a sua reserva por aqui agora mesmo! O que acha? 😉\n\n"
-            "PS: Não quer mais receber essas mensagens? Sem problema! É só responder SAIR que eu paro de te enviar! 😉\n"
-        )
+        return _MENSAGEM_PRE_VENDA_COPA.format(nome_cliente=self.nome_cliente)
 
+    @metrics.timed("template.loja_especifica")
     def loja_especifica(self, nome_loja, numero_pontos):
         if numero_pontos < 1000:
             raise ValueError("O número de pontos deve ser maior ou igual a 1000.")
 
-        return (
-        f"Olá, {self.nome_cliente}! Tudo bem?\n\n"
-        f"Aqui é a Júlia, da *{nome_loja}*, e tenho uma notícia incrível:"
-        f" você acumulou {self._formatar_numero_pontos(numero_pontos)} pontos no programa Sempre Leitura, que equivalem a *R${self._transformar_pontos_em_dinheiro(numero_pontos)}* de desconto na sua próxima compra em nossa loja! 🎉📚\n\n"
-        "Com a Volta às Aulas chegando, é uma ótima oportunidade para garantir o material escolar de alguém especial! E, claro, você também pode aproveitar seus pontos para levar aquele livro que está de olho há um tempo!\n\n"
-        f"Passe na *{nome_loja}*, onde temos tudo o que você precisa — desde materiais escolares até os melhores livros!\n\n"
-        "Estamos super ansiosos para te receber e te ajudar no que precisar! 😊\n\n"
-        f"*Os pontos estão atrelados ao CPF {self._hide_cpf()}, não podem ser transferidos e têm validade, hein! 😉 Quer saber mais? Dá uma olhada no regulamento lá no nosso site!" 
-        )   
+        return _MENSAGEM_LOJA_ESPECIFICA.format(
+            nome_cliente=self.nome_cliente,
+            nome_loja=nome_loja,
+            numero_pontos=self._formatar_numero_pontos(numero_pontos),
+            dinheiro=self._transformar_pontos_em_dinheiro(numero_pontos),
+            cpf=self._hide_cpf()
+        )
 
+    @metrics.timed("template.pontos_a_expirar")
     def pontos_a_expirar(self, data_a_expirar_inicio, data_a_expirar_fim, pontos_a_expirar, numero_pontos):
         if numero_pontos < 1000:
             raise ValueError("O número de pontos deve ser maior ou igual a 1000.")
@@ -320,20 +854,17 @@ class TemplateMensagem:
         else:
             mensagem_data = f"entre {self.format_date_to_text(data_a_expirar_inicio)} e {self.format_date_to_text(data_a_expirar_fim)}"
 
-        return (
-        f"Olá, {self.nome_cliente}! Tudo bem?\n\n"
-        f"Aqui é a Júlia, do programa de pontos *Sempre Leitura*. Passando para te avisar que {self._formatar_numero_pontos(pontos_a_expirar)} dos seus pontos vão expirar {mensagem_data}! 📅\n\n"
-        f"Que tal aproveitar essa oportunidade para garantir aquele livro dos sonhos ou qualquer outro produto que esteja na sua lista? No total, você tem {self._formatar_numero_pontos(numero_pontos)} pontos, que valem *R${self._transformar_pontos_em_dinheiro(numero_pontos)}* em crédito na *Livraria Leitura*! 💰📚\n\n"
-        "Mas atenção: os pontos que expiram não voltam! Então não deixe para depois—vem garantir seu resgate enquanto dá tempo!\n\n"
-        "Te esperamos na loja! Qualquer dúvida, é só me chamar. 😉\n\n"
-        f"*Os pontos estão atrelados ao CPF {self._hide_cpf()} e não podem ser transferidos! Quer saber mais? Dá uma olhada no regulamento lá no nosso site!\n\n" 
-        "PS: Não quer mais receber esses lembretes? Sem problema! É só responder SAIR que eu paro de te enviar mensagens! 😉\n\n"
+        return _MENSAGEM_PONTOS_A_EXPIRAR.format(
+            nome_cliente=self.nome_cliente,
+            pontos_a_expirar=self._formatar_numero_pontos(pontos_a_expirar),
+            mensagem_data=mensagem_data,
+            numero_pontos=self._formatar_numero_pontos(numero_pontos),
+            dinheiro=self._transformar_pontos_em_dinheiro(numero_pontos),
+            cpf=self._hide_cpf()
         )
     
     def format_date_to_text(self, date):
-        formatted_date = format_date(date, locale=locale, format='long')
-        formatted_date_no_year = ' '.join(formatted_date.split()[:-2])
-        return formatted_date_no_year
+        return format_date_to_text(date)
 
     def _transformar_pontos_em_dinheiro(self, numero_pontos):
         return int(np.floor(numero_pontos / 100))
@@ -344,3 +875,104 @@ class TemplateMensagem:
     def _hide_cpf(self) -> str:
         cpf = str(self.cpf)
         return f"{cpf[:3]}.XXX.{cpf[6:9]}-XX"
+
+class TemplateMensagemLote:
+    """
+    Renders the TemplateMensagem messages for a whole DataFrame at once.
+    Each method returns a Series aligned with df, identical to calling TemplateMensagem row by row.
+    """
+    def __init__(self, df: pd.DataFrame, nome_cliente: str = "primeiro_nome", cpf: str = "cpf"):
+        self.df = df
+        self.nome_cliente = df[nome_cliente].astype(str)
+
+        cpfs = df[cpf].astype(str)
+        self.cpf = cpfs.str[:3] + ".XXX." + cpfs.str[6:9] + "-XX"
+
+    @metrics.timed("template_lote.pre_venda_copa", rows=len)
+    def pre_venda_copa(self):
+        return self._render(_MENSAGEM_PRE_VENDA_COPA, nome_cliente=self.nome_cliente)
+
+    @metrics.timed("template_lote.loja_especifica", rows=len)
+    def loja_especifica(self, nome_loja, numero_pontos: str = "Saldo"):
+        pontos = self._validar_pontos(numero_pontos)
+
+        return self._render(
+            _MENSAGEM_LOJA_ESPECIFICA,
+            nome_cliente=self.nome_cliente,
+            nome_loja=nome_loja if isinstance(nome_loja, pd.Series) else pd.Series(nome_loja, index=self.df.index),
+            numero_pontos=self._formatar_numero_pontos(pontos),
+            dinheiro=self._transformar_pontos_em_dinheiro(pontos),
+            cpf=self.cpf
+        )
+
+    @metrics.timed("template_lote.pontos_a_expirar", rows=len)
+    def pontos_a_expirar(
+        self, data_a_expirar_inicio: str = "data_min_a_expirar", data_a_expirar_fim: str = "data_max_a_expirar",
+        pontos_a_expirar: str = "creditos_a_expirar", numero_pontos: str = "Saldo"
+    ):
+        pontos = self._validar_pontos(numero_pontos)
+
+        inicio = self.df[data_a_expirar_inicio]
+        fim = self.df[data_a_expirar_fim]
+
+        # Se as datas forem iguais, não precisa do intervalo
+        presente = fim.notna().to_numpy()
+        intervalo = presente.copy()
+        intervalo[presente] = (inicio[presente] != fim[presente]).to_numpy(dtype=bool)
+
+        inicio_texto = self._formatar_datas(inicio)
+        fim_texto = self._formatar_datas(fim.where(intervalo))
+        mensagem_data = ("entre " + inicio_texto + " e " + fim_texto).where(intervalo, "no dia " + inicio_texto)
+
+        return self._render(
+            _MENSAGEM_PONTOS_A_EXPIRAR,
+            nome_cliente=self.nome_cliente,
+            pontos_a_expirar=self._formatar_numero_pontos(self.df[pontos_a_expirar]),
+            mensagem_data=mensagem_data,
+            numero_pontos=self._formatar_numero_pontos(pontos),
+            dinheiro=self._transformar_pontos_em_dinheiro(pontos),
+            cpf=self.cpf
+        )
+
+    def _render(self, template, **campos):
+        template_compilado, nomes = _compilar_template(template)
+        return pd.Series(
+            [template_compilado % valores for valores in zip(*(campos[nome] for nome in nomes))],
+            index=self.df.index,
+            dtype=object
+        )
+
+    def _validar_pontos(self, numero_pontos):
+        pontos = self.df[numero_pontos]
+        if (pontos < 1000).any():
+            raise ValueError("O número de pontos deve ser maior ou igual a 1000.")
+        return pontos
+
+    @staticmethod
+    def _formatar_datas(datas: pd.Series) -> pd.Series:
+        # Uma campanha tem poucas datas distintas, então cada uma é formatada uma vez só
+        textos = {data: format_date_to_text(data) for data in datas.dropna().unique()}
+        return datas.map(textos)
+
+    @staticmethod
+    def _transformar_pontos_em_dinheiro(pontos: pd.Series) -> pd.Series:
+        return np.floor(pontos / 100).astype("int64").astype(str)
+
+    @staticmethod
+    def _formatar_numero_pontos(pontos: pd.Series) -> pd.Series:
+        inteiros = np.floor(pontos).astype("int64")
+        return pd.Series(
+            [f"{valor:,}".replace(",", ".") for valor in inteiros.tolist()],
+            index=pontos.index,
+            dtype=object
+        )
+
+@lru_cache(maxsize=None)
+def _compilar_template(template: str):
+    # Converte o template str.format em um template % com os campos na ordem em que aparecem
+    partes = list(string.Formatter().parse(template))
+    template_compilado = "".join(
+        literal.replace("%", "%%") + ("%s" if campo is not None else "")
+        for literal, campo, _, _ in partes
+    )
+    return template_compilado, [campo for _, campo, _, _ in partes if campo is not None]
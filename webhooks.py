@@ -0,0 +1,351 @@
+import argparse
+import asyncio
+import json
+import logging
+import sqlite3
+import string
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import pandas as pd
+from aiohttp import web
+
+OPT_OUT_KEYWORDS = {"SAIR"}
+
+# Ordem dos status do Z-API; um status só substitui outro mais adiantado
+STATUS_RANK = {"SENT": 1, "RECEIVED": 2, "READ": 3, "PLAYED": 4}
+
+class WebhookStore:
+    """
+    Stores the Z-API callbacks next to the send queue (same SQLite file), keyed by messageId.
+
+    message_status keeps the furthest status of each sent message with the time it was first
+    delivered and read; webhook_events keeps every callback; opt_outs keeps the phones that
+    replied with an opt-out keyword; webhook_dead_letter keeps the events that could not be
+    written, until replay_dead_letter writes them.
+    """
+    def __init__(self, path: str = "data/send_queue.db"):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+        CREATE TABLE IF NOT EXISTS webhook_events (
+            id INTEGER PRIMARY KEY,
+            event TEXT NOT NULL,
+            message_id TEXT,
+            zaap_id TEXT,
+            phone TEXT,
+            status TEXT,
+            momment INTEGER,
+            text TEXT,
+            received_at TEXT NOT NULL,
+            payload TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_webhook_events_message_id ON webhook_events (message_id);
+        CREATE TABLE IF NOT EXISTS message_status (
+            message_id TEXT PRIMARY KEY,
+            zaap_id TEXT,
+            phone TEXT,
+            status TEXT,
+            status_rank INTEGER NOT NULL DEFAULT 0,
+            delivered_at INTEGER,
+            read_at INTEGER,
+            replied_at INTEGER,
+            error TEXT,
+            updated_at TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_message_status_zaap_id ON message_status (zaap_id);
+        CREATE INDEX IF NOT EXISTS idx_message_status_phone ON message_status (phone);
+        CREATE TABLE IF NOT EXISTS opt_outs (
+            phone TEXT PRIMARY KEY,
+            text TEXT,
+            momment INTEGER,
+            received_at TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS webhook_dead_letter (
+            id INTEGER PRIMARY KEY,
+            event TEXT NOT NULL,
+            error TEXT,
+            failed_at TEXT NOT NULL
+        );
+        """)
+
+    def write_batch(self, eventos, opt_out_keywords=OPT_OUT_KEYWORDS):
+        """
+        Writes a batch of normalized events (see parse_callback) in one transaction.
+
+        :return: Number of opt-outs in the batch
+        """
+        agora = datetime.now().isoformat()
+        status, opt_outs = [], []
+        for evento in eventos:
+            if evento["event"] in ("status", "delivery") and evento["message_id"]:
+                rank = STATUS_RANK.get(evento["status"], 0)
+                status.append((
+                    evento["message_id"], evento["zaap_id"], evento["phone"], evento["status"], rank,
+                    # Lida ou reproduzida também foi entregue, mesmo que o RECEIVED não chegue
+                    evento["momment"] if rank >= STATUS_RANK["RECEIVED"] else None,
+                    evento["momment"] if rank >= STATUS_RANK["READ"] else None,
+                    evento.get("error"), agora
+                ))
+            elif evento["event"] == "received" and is_opt_out(evento["text"], opt_out_keywords):
+                opt_outs.append((evento["phone"], evento["text"], evento["momment"], agora))
+
+        with self.conn:
+            self.conn.executemany("""
+            INSERT INTO webhook_events (event, message_id, zaap_id, phone, status, momment, text, received_at, payload)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, [
+                (e["event"], e["message_id"], e["zaap_id"], e["phone"], e["status"], e["momment"], e["text"], agora, e["payload"])
+                for e in eventos
+            ])
+
+            self.conn.executemany("""
+            INSERT INTO message_status (message_id, zaap_id, phone, status, status_rank, delivered_at, read_at, error, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (message_id) DO UPDATE SET
+                zaap_id = COALESCE(message_status.zaap_id, excluded.zaap_id),
+                phone = COALESCE(message_status.phone, excluded.phone),
+                status = CASE WHEN excluded.status_rank > message_status.status_rank THEN excluded.status ELSE message_status.status END,
+                status_rank = MAX(message_status.status_rank, excluded.status_rank),
+                delivered_at = COALESCE(MIN(message_status.delivered_at, excluded.delivered_at), message_status.delivered_at, excluded.delivered_at),
+                read_at = COALESCE(MIN(message_status.read_at, excluded.read_at), message_status.read_at, excluded.read_at),
+                error = COALESCE(excluded.error, message_status.error),
+                updated_at = excluded.updated_at
+            """, status)
+
+            # Respostas marcam a última mensagem enviada ao telefone como respondida
+            self.conn.executemany("""
+            UPDATE message_status SET replied_at = COALESCE(replied_at, ?)
+            WHERE message_id = (SELECT message_id FROM message_status WHERE phone = ? ORDER BY rowid DESC LIMIT 1)
+            """, [(e["momment"], e["phone"]) for e in eventos if e["event"] == "received"])
+
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO opt_outs (phone, text, momment, received_at) VALUES (?, ?, ?, ?)",
+                opt_outs
+            )
+
+        return len(opt_outs)
+
+    def write_dead_letter(self, eventos, error):
+        """Keeps normalized events that could not be written, to be written later by replay_dead_letter"""
+        agora = datetime.now().isoformat()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO webhook_dead_letter (event, error, failed_at) VALUES (?, ?, ?)",
+                [(json.dumps(evento, ensure_ascii=False, default=str), str(error), agora) for evento in eventos]
+            )
+
+    def replay_dead_letter(self, opt_out_keywords=OPT_OUT_KEYWORDS) -> int:
+        """
+        Writes the dead-letter events again, in the order they failed, and removes them from the table.
+
+        :return: Number of events written
+        """
+        linhas = self.conn.execute("SELECT id, event FROM webhook_dead_letter ORDER BY id").fetchall()
+        if not linhas:
+            return 0
+
+        self.write_batch([json.loads(evento) for _, evento in linhas], opt_out_keywords)
+        with self.conn:
+            self.conn.executemany("DELETE FROM webhook_dead_letter WHERE id = ?", [(id_,) for id_, _ in linhas])
+        return len(linhas)
+
+    def opt_outs(self) -> pd.DataFrame:
+        return pd.read_sql_query("SELECT * FROM opt_outs", self.conn)
+
+    def message_status(self) -> pd.DataFrame:
+        """Status of the sent messages, with the send queue columns when the queue lives in the same file"""
+        tem_fila = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'send_queue'"
+        ).fetchone()
+        if not tem_fila:
+            return pd.read_sql_query("SELECT * FROM message_status", self.conn)
+
+        return pd.read_sql_query("""
+        SELECT q.nome_projeto, q.cpf, q.telefone_contato, q.zaapId, q.messageId, q.status AS queue_status,
+            s.status, s.delivered_at, s.read_at, s.replied_at, s.error
+        FROM send_queue q
+        LEFT JOIN message_status s ON s.message_id = q.messageId
+        WHERE q.messageId IS NOT NULL
+        """, self.conn)
+
+def is_opt_out(text, keywords=OPT_OUT_KEYWORDS) -> bool:
+    """True when the reply is only an opt-out keyword, ignoring case, accents, spaces and punctuation"""
+    if not text:
+        return False
+    normalizado = unicodedata.normalize("NFKD", str(text)).encode("ascii", "ignore").decode()
+    normalizado = normalizado.translate(str.maketrans("", "", string.punctuation)).strip().upper()
+    return normalizado in keywords
+
+def parse_callback(payload: dict) -> list:
+    """Normalizes a Z-API callback into a list of events (a status callback can cover several messages)"""
+    tipo = payload.get("type")
+    base = {
+        "zaap_id": payload.get("zaapId"),
+        "phone": payload.get("phone"),
+        "status": payload.get("status"),
+        "momment": payload.get("momment"),
+        "text": None,
+        "error": payload.get("error"),
+        "payload": json.dumps(payload, ensure_ascii=False),
+    }
+
+    if tipo == "MessageStatusCallback":
+        return [base | {"event": "status", "message_id": message_id} for message_id in payload.get("ids", [])]
+    if tipo == "DeliveryCallback":
+        return [base | {"event": "delivery", "message_id": payload.get("messageId"), "status": "SENT"}]
+    if tipo == "ReceivedCallback":
+        if payload.get("fromMe"):
+            return []
+        return [base | {
+            "event": "received",
+            "message_id": payload.get("messageId"),
+            "text": (payload.get("text") or {}).get("message"),
+        }]
+
+    return [base | {"event": tipo or "unknown", "message_id": payload.get("messageId")}]
+
+class WebhookReceiver:
+    """
+    aiohttp app that receives the Z-API callbacks and writes them to a WebhookStore in batches.
+
+    Handlers only parse the JSON and queue the events, so Z-API gets its 200 right away; a
+    background task writes the queue to SQLite in one transaction per batch, in a separate thread.
+    A batch that fails is retried with exponential backoff and, if it still fails, goes to the
+    store's dead-letter table (WebhookStore.replay_dead_letter writes it later).
+    Point every Z-API webhook (delivery, received, message status) at POST /webhooks/zapi.
+
+    :param store: Where the events are written
+    :param batch_size: Events per transaction
+    :param flush_interval: Longest time, in seconds, an event waits in memory
+    :param secret: If set, callbacks must carry it in the token query parameter
+    :param on_opt_out: Function called with the phones that opted out in each batch
+    :param write_retries: Retries of a batch that fails to be written
+    :param retry_backoff: Wait before the first retry, in seconds, doubled at each retry
+    """
+    def __init__(self, store: WebhookStore = None, batch_size: int = 1000, flush_interval: float = 0.5,
+                 secret: str = None, max_queue: int = 100_000, opt_out_keywords=OPT_OUT_KEYWORDS, on_opt_out=None,
+                 write_retries: int = 3, retry_backoff: float = 0.5):
+        self.store = store if store else WebhookStore()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.secret = secret
+        self.max_queue = max_queue
+        self.opt_out_keywords = opt_out_keywords
+        self.on_opt_out = on_opt_out
+        self.write_retries = write_retries
+        self.retry_backoff = retry_backoff
+
+        self.received = 0
+        self.written = 0
+        self.opt_outs = 0
+        self.dead_lettered = 0
+        self._queue = None
+        self._writer = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="webhook_writer")
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=1024 ** 2)
+        app.router.add_post("/webhooks/zapi", self._handle)
+        app.router.add_post("/webhooks/{tipo}", self._handle)
+        app.router.add_get("/health", self._health)
+        app.on_startup.append(self._start)
+        app.on_cleanup.append(self._stop)
+        return app
+
+    async def _start(self, app):
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._writer = asyncio.create_task(self._write_loop())
+
+    async def _stop(self, app):
+        await self._queue.put(None)
+        await self._writer
+        self._executor.shutdown()
+
+    async def _health(self, request):
+        return web.json_response({
+            "received": self.received,
+            "written": self.written,
+            "opt_outs": self.opt_outs,
+            "dead_lettered": self.dead_lettered,
+            "queued": self._queue.qsize(),
+        })
+
+    async def _handle(self, request):
+        if self.secret is not None and request.query.get("token") != self.secret:
+            return web.json_response({"error": "invalid token"}, status=401)
+
+        try:
+            payload = await request.json(loads=json.loads)
+        except ValueError:
+            return web.json_response({"error": "invalid JSON"}, status=400)
+
+        for evento in parse_callback(payload):
+            await self._queue.put(evento)
+        self.received += 1
+        return web.json_response({"ok": True})
+
+    async def _write_loop(self):
+        loop = asyncio.get_running_loop()
+        parar = False
+        while not parar:
+            lote = []
+            evento = await self._queue.get()
+            limite = loop.time() + self.flush_interval
+            while evento is not None:
+                lote.append(evento)
+                if len(lote) >= self.batch_size:
+                    break
+                try:
+                    evento = await asyncio.wait_for(self._queue.get(), max(limite - loop.time(), 0))
+                except asyncio.TimeoutError:
+                    break
+            parar = evento is None
+
+            if lote:
+                opt_outs = await self._write(loop, lote)
+                if opt_outs is None:
+                    continue
+
+                self.written += len(lote)
+                self.opt_outs += opt_outs
+                if opt_outs and self.on_opt_out is not None:
+                    self.on_opt_out([
+                        e["phone"] for e in lote
+                        if e["event"] == "received" and is_opt_out(e["text"], self.opt_out_keywords)
+                    ])
+
+    async def _write(self, loop, lote):
+        """Writes the batch, retrying it; returns the number of opt-outs, or None if it went to the dead letter"""
+        for tentativa in range(self.write_retries + 1):
+            try:
+                return await loop.run_in_executor(self._executor, self.store.write_batch, lote, self.opt_out_keywords)
+            except Exception as e:
+                erro = e
+                logging.warning(f"Error writing {len(lote)} webhook events (attempt {tentativa + 1}): {e}")
+                if tentativa < self.write_retries:
+                    await asyncio.sleep(self.retry_backoff * 2 ** tentativa)
+
+        try:
+            await loop.run_in_executor(self._executor, self.store.write_dead_letter, lote, erro)
+            self.dead_lettered += len(lote)
+            logging.error(f"{len(lote)} webhook events moved to the dead-letter table: {erro}")
+        except Exception as e:
+            # Último recurso: sem o banco, os eventos ficam ao menos no log
+            logging.error(f"Lost {len(lote)} webhook events ({e}): {json.dumps(lote, ensure_ascii=False, default=str)}")
+        return None
+
+def run_receiver(host: str = "0.0.0.0", port: int = 8080, path: str = "data/send_queue.db", secret: str = None):
+    logging.basicConfig(level=logging.INFO)
+    web.run_app(WebhookReceiver(WebhookStore(path), secret=secret).app(), host=host, port=port, access_log=None)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Receives the Z-API webhooks")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--path", default="data/send_queue.db", help="SQLite file of the send queue")
+    parser.add_argument("--secret", default=None, help="Value expected in the token query parameter")
+    args = parser.parse_args()
+    run_receiver(args.host, args.port, args.path, args.secret)
@@ -0,0 +1,83 @@
+from __future__ import annotations
+import os
+from metrics import metrics
+from zapi_transport import ZAPITransport
+
+def _status_code(response):
+    return response.status_code
+
+class ZAPIClient:
+    BASE_URL = "https://api.z-api.io"
+
+    def __init__(self, instance_id=None, instance_token=None, client_token=None, base_url=None, transport=None):
+        self.instance_id = instance_id if instance_id else os.getenv("ZAPI_INSTANCE_ID")
+        self.instance_token = instance_token if instance_token else os.getenv("ZAPI_INSTANCE_TOKEN")
+        self.client_token = client_token if client_token else os.getenv("ZAPI_CLIENT_TOKEN")
+        self.base_url = base_url if base_url else self.BASE_URL
+        self.transport = transport if transport else ZAPITransport()
+
+    def outcomes_dataframe(self) -> pd.DataFrame:
+        """Outcome record of every request made by this client"""
+        return self.transport.outcomes_dataframe().assign(instance_id=self.instance_id)
+
+    @metrics.timed("zapi.send_text", status=_status_code)
+    def send_text(self, phone, message, delay_message=10):
+        url = f"{self.base_url}/instances/{self.instance_id}/token/{self.instance_token}/send-text"
+        headers = {
+            "client-token": self.client_token,
+            "Content-Type": "application/json"
+        }
+        data = {
+            "phone": phone,
+            "message": message,
+            "delayMessage": delay_message
+        }
+
+        return self.transport.post(url, "send-text", headers=headers, json=data)
+
+    @metrics.timed("zapi.send_image", status=_status_code)
+    def send_image(self, phone, caption, image_url, delay_message=10):
+        url = f"{self.base_url}/instances/{self.instance_id}/token/{self.instance_token}/send-image"
+        headers = {
+            "client-token": self.client_token,
+            "Content-Type": "application/json"
+        }
+        data = {
+            "phone": phone,
+            "caption": caption,
+            "image": image_url,
+            "delayMessage": delay_message
+        }
+
+        return self.transport.post(url, "send-image", headers=headers, json=data)
+
+    @metrics.timed("zapi.read_message", status=_status_code)
+    def read_message(self, message_id, phone):
+        url = f"{self.base_url}/instances/{self.instance_id}/token/{self.instance_token}/read-message"
+        headers = {
+            "client-token": self.client_token,
+            "Content-Type": "application/json"
+        }
+        data = {
+            "phone": phone,
+            "message_id": message_id
+        }
+
+        # Marcar como lida mais de uma vez não tem efeito, então pode ser repetido
+        return self.transport.post(url, "read-message", idempotent=True, headers=headers, json=data)
+
+    @metrics.timed("zapi.retrieve_chats", status=_status_code)
+    def retrieve_chats(self):
+        url = f"{self.base_url}/instances/{self.instance_id}/token/{self.instance_token}/chats"
+        headers = {
+            "client-token": self.client_token
+        }
+        return self.transport.get(url, "chats", headers=headers)
+
+    @metrics.timed("zapi.get_chat_metadata", status=_status_code)
+    def get_chat_metadata(self, phone):
+        url = f"{self.base_url}/instances/{self.instance_id}/token/{self.instance_token}/chats/{phone}"
+        headers = {
+            "client-token": self.client_token
+        }
+        return self.transport.get(url, "chat-metadata", headers=headers)
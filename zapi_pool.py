@@ -0,0 +1,255 @@
+from __future__ import annotations
+import bisect
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import deque
+from zapi_client import ZAPIClient
+from zapi_transport import ZAPITransport, CircuitBreaker, CircuitOpenError, RETRY_STATUS
+
+def _hash(valor: str) -> int:
+    return int.from_bytes(hashlib.blake2b(valor.encode(), digest_size=8).digest(), "big")
+
+class _EstadoInstancia:
+    def __init__(self, window: int):
+        self.in_flight = 0
+        self.sent = 0
+        self.errors = 0
+        self.recent = deque(maxlen=window)
+        self.sent_at = deque()
+        self.unhealthy_until = 0.0
+
+class ZAPIPool:
+    """
+    Spreads the requests over several Z-API instances, with the same methods as ZAPIClient.
+
+    Each phone is routed to an instance by consistent hashing, so a conversation stays on the
+    same WhatsApp number and adding or removing an instance only moves the phones of that
+    instance. When the instance of a phone is unhealthy (circuit breaker open, too many recent
+    errors or too many requests in flight), the phone goes to the next healthy instance on the ring.
+
+        pool = ZAPIPool.from_env()
+        send_queue.drain(pool, workers=len(pool.clients) * 2)
+
+    :param clients: ZAPIClient of each instance
+    :param replicas: Points of each instance on the hash ring
+    :param window: Recent requests considered in the error rate of an instance
+    :param error_threshold: Recent error rate above which an instance is unhealthy
+    :param min_requests: Recent requests needed before the error rate is considered
+    :param cooldown: Seconds an instance stays out of the rotation after crossing the error threshold
+    :param max_in_flight: Concurrent requests above which an instance is unhealthy (None for no limit)
+    :param throughput_window: Seconds considered in the throughput of each instance
+    """
+    def __init__(self, clients, replicas: int = 100, window: int = 20, error_threshold: float = 0.5,
+                 min_requests: int = 5, cooldown: float = 30.0, max_in_flight: int = None,
+                 throughput_window: float = 60.0):
+        if not clients:
+            raise ValueError("The pool needs at least one Z-API instance")
+
+        self.clients = {client.instance_id: client for client in clients}
+        if len(self.clients) != len(clients):
+            raise ValueError("Duplicate Z-API instance ids in the pool")
+
+        self.error_threshold = error_threshold
+        self.min_requests = min_requests
+        self.cooldown = cooldown
+        self.max_in_flight = max_in_flight
+        self.throughput_window = throughput_window
+
+        self._estados = {instance_id: _EstadoInstancia(window) for instance_id in self.clients}
+        self._rotas = {}
+        self._lock = threading.Lock()
+        self._criado_em = time.monotonic()
+
+        anel = sorted(
+            (_hash(f"{instance_id}#{i}"), instance_id)
+            for instance_id in self.clients
+            for i in range(replicas)
+        )
+        self._anel_hashes = [h for h, _ in anel]
+        self._anel_instancias = [instance_id for _, instance_id in anel]
+
+    @classmethod
+    def from_credentials(cls, credentials, client_token=None, base_url=None, **kwargs):
+        """
+        Builds the pool from (instance_id, instance_token) pairs.
+
+        Each instance gets its own transport and circuit breaker, which refuses requests instead
+        of waiting while open, so the pool can move them to another instance.
+        """
+        clients = [
+            ZAPIClient(
+                instance_id, instance_token, client_token, base_url=base_url,
+                transport=ZAPITransport(breaker=CircuitBreaker(), block_when_open=False)
+            )
+            for instance_id, instance_token in credentials
+        ]
+        return cls(clients, **kwargs)
+
+    @classmethod
+    def from_env(cls, **kwargs):
+        """Builds the pool from ZAPI_INSTANCES ("id1:token1,id2:token2") and ZAPI_CLIENT_TOKEN"""
+        credentials = []
+        for posicao, instancia in enumerate(os.getenv("ZAPI_INSTANCES", "").split(","), start=1):
+            if not instancia.strip():
+                continue
+            instance_id, _, instance_token = (parte.strip() for parte in instancia.partition(":"))
+            if not instance_id or not instance_token:
+                # O token não vai para a mensagem, só o id da instância
+                raise ValueError(
+                    f"Malformed ZAPI_INSTANCES entry {posicao} ({instance_id or 'no id'}): expected instance_id:instance_token"
+                )
+            credentials.append((instance_id, instance_token))
+        return cls.from_credentials(credentials, os.getenv("ZAPI_CLIENT_TOKEN"), **kwargs)
+
+    def instances_for(self, phone):
+        """Instances in the order they are tried for the phone, the first being its own"""
+        inicio = bisect.bisect(self._anel_hashes, _hash(str(phone)))
+        ordem = []
+        for i in range(len(self._anel_instancias)):
+            instance_id = self._anel_instancias[(inicio + i) % len(self._anel_instancias)]
+            if instance_id not in ordem:
+                ordem.append(instance_id)
+                if len(ordem) == len(self.clients):
+                    break
+        return ordem
+
+    def instance_for(self, phone):
+        """Instance that handles the phone right now"""
+        return self._escolher(phone)[0]
+
+    def healthy(self, instance_id) -> bool:
+        with self._lock:
+            return self._saudavel(instance_id)
+
+    def _saudavel(self, instance_id):
+        estado = self._estados[instance_id]
+        # Depois do cooldown a instância volta à rotação, para a requisição de teste do breaker poder sair
+        if not self.clients[instance_id].transport.breaker.accepting():
+            return False
+        if self.max_in_flight is not None and estado.in_flight >= self.max_in_flight:
+            return False
+        return time.monotonic() >= estado.unhealthy_until
+
+    def _escolher(self, phone):
+        """Healthy instances for the phone, in order; all of them if none is healthy"""
+        ordem = self.instances_for(phone)
+        with self._lock:
+            saudaveis = [instance_id for instance_id in ordem if self._saudavel(instance_id)]
+        return saudaveis if saudaveis else ordem
+
+    def _enviar(self, phone, metodo, *args, **kwargs):
+        ultimo_erro = None
+        for instance_id in self._escolher(phone):
+            try:
+                return self._enviar_pela(instance_id, phone, metodo, *args, **kwargs)
+            except CircuitOpenError as e:
+                # A requisição não saiu, então é seguro tentar a próxima instância
+                logging.warning(f"Z-API instance {instance_id} refused {metodo}, trying the next one")
+                ultimo_erro = e
+
+        raise ultimo_erro
+
+    def _enviar_pela(self, instance_id, phone, metodo, *args, **kwargs):
+        """Request through one instance, counted in its health and recorded as the route of the phone"""
+        with self._lock:
+            self._estados[instance_id].in_flight += 1
+
+        sucesso, recusada = False, False
+        try:
+            response = getattr(self.clients[instance_id], metodo)(*args, **kwargs)
+            sucesso = response.status_code not in RETRY_STATUS
+        except CircuitOpenError:
+            recusada = True
+            raise
+        finally:
+            self._registrar(instance_id, sucesso, recusada)
+
+        with self._lock:
+            self._rotas[str(phone)] = instance_id
+        return response
+
+    def _registrar(self, instance_id, sucesso, recusada):
+        agora = time.monotonic()
+        with self._lock:
+            estado = self._estados[instance_id]
+            estado.in_flight -= 1
+            if recusada:
+                return
+
+            estado.recent.append(sucesso)
+            if sucesso:
+                estado.sent += 1
+                estado.sent_at.append(agora)
+            else:
+                estado.errors += 1
+
+            if (
+                len(estado.recent) >= self.min_requests
+                and estado.recent.count(False) / len(estado.recent) >= self.error_threshold
+            ):
+                # Fora da rotação pelo cooldown; depois volta a receber tráfego e é reavaliada
+                logging.warning(f"Z-API instance {instance_id} unhealthy, out of the rotation for {self.cooldown}s")
+                estado.unhealthy_until = agora + self.cooldown
+                estado.recent.clear()
+
+            while estado.sent_at and estado.sent_at[0] < agora - self.throughput_window:
+                estado.sent_at.popleft()
+
+    def _instancia_da_conversa(self, phone):
+        """Instance that last sent to the phone, so reads and lookups go to the same number"""
+        with self._lock:
+            instance_id = self._rotas.get(str(phone))
+        return instance_id if instance_id else self.instances_for(phone)[0]
+
+    def send_text(self, phone, message, delay_message=10):
+        return self._enviar(phone, "send_text", phone, message, delay_message=delay_message)
+
+    def send_image(self, phone, caption, image_url, delay_message=10):
+        return self._enviar(phone, "send_image", phone, caption, image_url, delay_message=delay_message)
+
+    def send_text_on(self, instance_id, phone, message, delay_message=10):
+        """
+        send_text through the given instance, without trying the others, for callers that pick the
+        instance themselves (SendScheduler). The send still counts in the health of the instance
+        and in the route of the phone used by read_message.
+        """
+        return self._enviar_pela(instance_id, phone, "send_text", phone, message, delay_message=delay_message)
+
+    def read_message(self, message_id, phone):
+        return self.clients[self._instancia_da_conversa(phone)].read_message(message_id, phone)
+
+    def get_chat_metadata(self, phone):
+        return self.clients[self._instancia_da_conversa(phone)].get_chat_metadata(phone)
+
+    def outcomes_dataframe(self) -> pd.DataFrame:
+        """Outcome record of every request made by the instances of the pool"""
+        import pandas as pd
+
+        return pd.concat([client.outcomes_dataframe() for client in self.clients.values()], ignore_index=True)
+
+    def stats(self) -> pd.DataFrame:
+        """In-flight requests, counts, recent error rate, health and throughput of each instance"""
+        import pandas as pd
+
+        agora = time.monotonic()
+        janela = max(min(self.throughput_window, agora - self._criado_em), 1e-9)
+        linhas = []
+        with self._lock:
+            for instance_id, estado in self._estados.items():
+                while estado.sent_at and estado.sent_at[0] < agora - self.throughput_window:
+                    estado.sent_at.popleft()
+
+                linhas.append({
+                    "instance_id": instance_id,
+                    "healthy": self._saudavel(instance_id),
+                    "breaker": self.clients[instance_id].transport.breaker.state,
+                    "in_flight": estado.in_flight,
+                    "sent": estado.sent,
+                    "errors": estado.errors,
+                    "recent_error_rate": estado.recent.count(False) / len(estado.recent) if estado.recent else 0.0,
+                    "messages_per_second": len(estado.sent_at) / janela,
+                })
+        return pd.DataFrame(linhas)
@@ -0,0 +1,278 @@
+from __future__ import annotations
+import logging
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+class CircuitOpenError(Exception):
+    """Raised when a request is refused because the circuit breaker is open"""
+
+class CircuitBreaker:
+    """
+    Opens when the error rate of the last `window` requests reaches `error_threshold`.
+
+    While open, requests wait (or are refused) until `cooldown` seconds have passed; then one
+    probe request is let through. The circuit closes if the probe succeeds and reopens otherwise.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, window: int = 50, error_threshold: float = 0.5, min_requests: int = 10,
+                 cooldown: float = 30.0, clock=time.monotonic):
+        self.window = deque(maxlen=window)
+        self.error_threshold = error_threshold
+        self.min_requests = min_requests
+        self.cooldown = cooldown
+        self.clock = clock
+
+        self.state = self.CLOSED
+        self.opened_at = None
+        self.times_opened = 0
+        self._lock = threading.Lock()
+
+    def error_rate(self):
+        with self._lock:
+            return self.window.count(False) / len(self.window) if self.window else 0.0
+
+    def try_acquire(self):
+        """
+        Returns 0 if a request may be sent now, or the seconds to wait before asking again.
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return 0
+
+            restante = self.opened_at + self.cooldown - self.clock()
+            if self.state == self.OPEN and restante <= 0:
+                self.state = self.HALF_OPEN
+                return 0
+
+            # Aberto dentro do cooldown, ou já existe uma requisição de teste em andamento
+            return max(restante, 0.1)
+
+    def accepting(self) -> bool:
+        """True if try_acquire would let a request through now, without changing the state"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            return self.state == self.OPEN and self.opened_at + self.cooldown - self.clock() <= 0
+
+    def record(self, success: bool):
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                if success:
+                    logging.info("Circuit breaker closed after a successful probe")
+                    self.state = self.CLOSED
+                    self.window.clear()
+                else:
+                    self._open()
+                return
+
+            self.window.append(success)
+            if (
+                self.state == self.CLOSED
+                and len(self.window) >= self.min_requests
+                and self.window.count(False) / len(self.window) >= self.error_threshold
+            ):
+                self._open()
+
+    def _open(self):
+        if self.state == self.CLOSED:
+            logging.warning(f"Circuit breaker opened, pausing requests for {self.cooldown}s")
+        self.state = self.OPEN
+        self.opened_at = self.clock()
+        self.times_opened += 1
+
+def _nao_conectou(erro) -> bool:
+    """True when the request failed before a connection to the server was established"""
+    import requests
+    from urllib3.exceptions import NewConnectionError
+
+    if isinstance(erro, requests.ConnectTimeout):
+        return True
+    motivo = getattr(erro.args[0], "reason", None) if erro.args else None
+    return isinstance(motivo, NewConnectionError)
+
+def not_delivered(erro) -> bool:
+    """
+    True when a send that raised erro certainly did not reach Z-API: refused by the circuit
+    breaker, failed before connecting, or answered with a 4xx. Timeouts after connecting,
+    dropped connections and 5xx are ambiguous, as Z-API may have queued the message.
+    """
+    import requests
+
+    if isinstance(erro, CircuitOpenError):
+        return True
+    if isinstance(erro, requests.HTTPError) and erro.response is not None:
+        return erro.response.status_code < 500
+    return isinstance(erro, requests.RequestException) and _nao_conectou(erro)
+
+def _retry_after_seconds(response):
+    """Parses Retry-After, given either in seconds or as an HTTP date"""
+    retry_after = response.headers.get("Retry-After")
+    if not retry_after:
+        return None
+    if retry_after.strip().isdigit():
+        return float(retry_after)
+    try:
+        return max((parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+class ZAPITransport:
+    """
+    HTTP layer used by ZAPIClient: timeouts, retries with backoff, circuit breaker and outcome records.
+
+    Idempotent calls are retried on timeouts, connection errors, 429 and 5xx. Sends are not
+    idempotent, so they are only retried when Z-API certainly did not receive them: on 429 and
+    when the connection could not be established.
+
+    :param connect_timeout: Seconds to establish the connection
+    :param read_timeout: Seconds to wait for the response
+    :param max_retries: Retries after the first attempt
+    :param backoff: Base of the exponential backoff, in seconds (full jitter is applied)
+    :param max_backoff: Longest wait between two attempts, Retry-After included
+    :param breaker: CircuitBreaker shared by the requests (one with the default settings if None)
+    :param block_when_open: Waits for the breaker to close instead of raising CircuitOpenError
+    :param max_outcomes: Outcome records kept in memory
+    """
+    def __init__(self, connect_timeout: float = 5.0, read_timeout: float = 30.0, max_retries: int = 3,
+                 backoff: float = 0.5, max_backoff: float = 60.0, breaker: CircuitBreaker = None,
+                 block_when_open: bool = True, max_outcomes: int = 100_000, sleep=time.sleep):
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.block_when_open = block_when_open
+        self.outcomes = deque(maxlen=max_outcomes)
+        self.sleep = sleep
+        self._local = threading.local()
+
+    def _session(self):
+        # Uma sessão por thread, para reaproveitar conexões sem compartilhar estado entre threads
+        if not hasattr(self._local, "session"):
+            import requests
+
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def get(self, url, endpoint, **kwargs):
+        return self.request("GET", url, endpoint, idempotent=True, **kwargs)
+
+    def post(self, url, endpoint, idempotent=False, **kwargs):
+        return self.request("POST", url, endpoint, idempotent=idempotent, **kwargs)
+
+    def request(self, method, url, endpoint, idempotent, **kwargs):
+        """
+        Sends the request and returns the last requests.Response.
+
+        Raises the last requests exception when every attempt failed without a response, and
+        CircuitOpenError when the breaker is open and block_when_open is False. Any other
+        exception of the request is recorded as a failure in the breaker and raised at once.
+        """
+        # requests leva ~100 ms para carregar; só quem de fato faz requisições paga por isso
+        import requests
+
+        inicio = time.perf_counter()
+        tentativas = 0
+        response, erro = None, None
+
+        try:
+            while True:
+                self._acquire(endpoint)
+                tentativas += 1
+                response, erro = None, None
+
+                try:
+                    response = self._session().request(method, url, timeout=self.timeout, **kwargs)
+                except requests.RequestException as e:
+                    erro = e
+                except BaseException as e:
+                    # Qualquer outra exceção também é uma falha: sem isso uma requisição de teste
+                    # deixaria o breaker meio aberto para sempre
+                    erro = e
+                    self.breaker.record(False)
+                    raise
+
+                falhou = erro is not None or response.status_code in RETRY_STATUS
+                self.breaker.record(not falhou)
+
+                if not falhou or tentativas > self.max_retries or not self._retryable(response, erro, idempotent):
+                    break
+
+                self.sleep(self._espera(tentativas, response))
+        except CircuitOpenError as e:
+            erro = e
+            raise
+        finally:
+            self._record(endpoint, method, response, erro, tentativas, time.perf_counter() - inicio)
+
+        if erro is not None:
+            raise erro
+        return response
+
+    def _acquire(self, endpoint):
+        while True:
+            espera = self.breaker.try_acquire()
+            if espera == 0:
+                return
+            if not self.block_when_open:
+                raise CircuitOpenError(f"Circuit breaker open, refusing {endpoint}")
+            self.sleep(espera)
+
+    @staticmethod
+    def _retryable(response, erro, idempotent):
+        import requests
+
+        if idempotent:
+            return isinstance(erro, (requests.ConnectionError, requests.Timeout)) if erro is not None else True
+        # Só é seguro repetir um envio quando a conexão nem chegou a ser estabelecida
+        if erro is not None:
+            return _nao_conectou(erro)
+        return response.status_code == 429
+
+    def _espera(self, tentativa, response):
+        espera = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (tentativa - 1)))
+        if response is not None and response.status_code == 429:
+            retry_after = _retry_after_seconds(response)
+            if retry_after is not None:
+                espera = max(espera, min(retry_after, self.max_backoff))
+        return espera
+
+    def _record(self, endpoint, method, response, erro, tentativas, segundos):
+        import requests
+
+        if isinstance(erro, CircuitOpenError):
+            outcome = "circuit_open"
+        elif isinstance(erro, requests.Timeout):
+            outcome = "timeout"
+        elif erro is not None:
+            outcome = "connection_error"
+        elif response.status_code >= 400:
+            outcome = "http_error"
+        else:
+            outcome = "retried_ok" if tentativas > 1 else "ok"
+
+        self.outcomes.append({
+            "timestamp": time.time(),
+            "endpoint": endpoint,
+            "method": method,
+            "outcome": outcome,
+            "status": response.status_code if response is not None else None,
+            "attempts": tentativas,
+            "seconds": segundos,
+            "error": str(erro) if erro is not None else None,
+        })
+
+    def outcomes_dataframe(self) -> pd.DataFrame:
+        """Outcome records as a DataFrame, one row per request (attempts included)"""
+        import pandas as pd
+
+        return pd.DataFrame(list(self.outcomes))